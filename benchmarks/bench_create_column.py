@@ -0,0 +1,77 @@
+# Copyright 2020, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Benchmark `create-column` (`create_column_pyeval`) against the previous `df.iterrows()` implementation.
+
+Usage:
+
+    python benchmarks/bench_create_column.py [n_rows] [--skip-legacy]
+
+The default is 1,000,000 rows. The legacy implementation takes several minutes per expression
+at that size; use `--skip-legacy` to only time the current implementation.
+
+"""
+
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from dataframe_action_cli.dataframe_actions import create_column_pyeval
+
+EXPRESSIONS = [
+    # (expression, use_format)
+    ("amount * price_each", False),
+    ("str(int(Pos[1:])) + ' ' + Pos[0]", False),
+    ("Pos.lower() + name", False),
+    ("price_each if amount > 3 else 0", False),    # Not vectorized, evaluated row-by-row.
+    ("'{Pos}' + name", True),
+]
+
+
+def legacy_create_column_pyeval(df, columnname, expr, use_format=False):
+    """ The implementation before expressions were compiled and vectorized. """
+    if use_format:
+        df[columnname] = [eval(expr.format(**dict(row)), None, dict(row)) for rowidx, row in df.iterrows()]
+    else:
+        df[columnname] = [eval(expr, None, dict(row)) for rowidx, row in df.iterrows()]
+    return df
+
+
+def make_dataframe(n_rows, seed=0):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'Pos': [f"{row}{col}" for row, col in zip(rng.choice(list("ABCDEFGHIJKLMNOP"), n_rows),
+                                                  rng.integers(1, 25, n_rows))],
+        'name': rng.choice(["Peter", "Michael", "Anna", "Maria"], n_rows),
+        'amount': rng.integers(0, 100, n_rows),
+        'price_each': rng.random(n_rows) * 100,
+    })
+
+
+def timeit(func, *args, **kwargs):
+    start = time.perf_counter()
+    func(*args, **kwargs)
+    return time.perf_counter() - start
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    skip_legacy = '--skip-legacy' in argv
+    n_rows = int(float(next((arg for arg in argv if not arg.startswith('--')), 1e6)))
+    df = make_dataframe(n_rows)
+    print(f"create-column benchmark, {n_rows} rows:\n")
+    print(f"{'expression':40} {'use_format':>10} {'current (s)':>12} {'legacy (s)':>12} {'speedup':>8}")
+    for expr, use_format in EXPRESSIONS:
+        current = timeit(create_column_pyeval, df.copy(), 'new', expr, use_format=use_format)
+        if skip_legacy:
+            legacy, speedup = float('nan'), float('nan')
+        else:
+            legacy = timeit(legacy_create_column_pyeval, df.copy(), 'new', expr, use_format=use_format)
+            speedup = legacy / current
+        print(f"{expr:40} {use_format!s:>10} {current:12.3f} {legacy:12.3f} {speedup:8.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+# Copyright 2020, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Benchmark CLI startup time, i.e. the time to import `dataframe_action_cli.cli` and run cheap actions.
+
+Each case is run in a fresh Python process, and the median wall time is reported, together with
+whether pandas was imported. `-help` and config/cache actions should not import pandas.
+
+Usage:
+
+    python benchmarks/bench_import_time.py [n_repeats] [--check]
+
+With `--check`, the benchmark exits with an error if any of the cheap cases imports pandas,
+e.g. to catch regressions in CI.
+
+Use `python -X importtime -c "import dataframe_action_cli.cli"` to see which modules are imported.
+
+"""
+
+import statistics
+import subprocess
+import sys
+import time
+
+CASES = [
+    # (name, code, pandas allowed)
+    ("python startup", "pass", False),
+    ("import cli", "import dataframe_action_cli.cli", False),
+    ("-help", "from dataframe_action_cli.cli import action_cli; action_cli(['-help'])", False),
+    ("-help natsort", "from dataframe_action_cli.cli import action_cli; action_cli(['-help', 'natsort'])", False),
+    ("-cache-stats", "from dataframe_action_cli.cli import action_cli; action_cli(['-cache-stats'])", False),
+    ("import pandas", "import pandas", True),
+    ("import dataframe_actions", "import dataframe_action_cli.dataframe_actions", True),
+]
+
+# Appended to each case, to report whether pandas was imported:
+REPORT_PANDAS = "; import sys; sys.stderr.write('PANDAS=%d' % ('pandas' in sys.modules))"
+
+
+def run_case(code, n_repeats):
+    """ Run `code` in `n_repeats` fresh processes, returning (list of wall times, pandas imported). """
+    times, pandas_imported = [], False
+    for _ in range(n_repeats):
+        start = time.perf_counter()
+        proc = subprocess.run([sys.executable, "-c", code + REPORT_PANDAS],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, check=True)
+        times.append(time.perf_counter() - start)
+        pandas_imported = proc.stderr.decode().endswith('PANDAS=1')
+    return times, pandas_imported
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    check = '--check' in argv
+    n_repeats = int(next((arg for arg in argv if not arg.startswith('--')), 10))
+    print(f"CLI startup benchmark, median of {n_repeats} runs:\n")
+    print(f"{'case':28} {'median (ms)':>12} {'min (ms)':>10} {'pandas':>8}")
+    failed = []
+    for name, code, pandas_allowed in CASES:
+        times, pandas_imported = run_case(code, n_repeats)
+        print(f"{name:28} {statistics.median(times) * 1000:12.1f} {min(times) * 1000:10.1f} "
+              f"{'yes' if pandas_imported else 'no':>8}")
+        if pandas_imported and not pandas_allowed:
+            failed.append(name)
+    if check and failed:
+        sys.exit(f"\nERROR: pandas was imported by: {', '.join(failed)}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,220 @@
+# Copyright 2020, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Benchmark suite covering every dataframe action, and complete CLI action chains.
+
+Each action in `dataframe_actions.ACTIONS` is timed on synthetic tables (see `datagen.py`) of
+one or more sizes, and a few typical action chains are timed end-to-end through `action_cli(argv)`.
+Every action function must have at least one benchmark case; the suite refuses to run otherwise,
+so new actions get benchmarks when they are added.
+
+Results are saved as JSON (with the git commit, library versions and machine info),
+and two result files can be compared with `compare.py`:
+
+    python benchmarks/bench_suite.py --sizes 1e4,1e5,1e6 --output before.json
+    git checkout my-branch
+    python benchmarks/bench_suite.py --sizes 1e4,1e5,1e6 --output after.json
+    python benchmarks/compare.py before.json after.json
+
+Usage:
+
+    python benchmarks/bench_suite.py [--sizes 1e4,1e5] [--repeat 3] [--filter <substring>] [--output <file.json>]
+
+By default, results are saved in `benchmarks/results/<date>_<commit>.json`.
+Generated csv files are cached in the system temp directory (see `datagen.py`).
+
+"""
+
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from dataframe_action_cli import dataframe_actions
+from dataframe_action_cli.cli import action_cli
+
+from datagen import make_table, get_csv_file
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, "results")
+
+def plates_file(ctx):
+    """ Return a csv file with a row for each plate, to join with (written to the context's tmpdir). """
+    filename = os.path.join(ctx.tmpdir, "plates.csv")
+    if not os.path.isfile(filename):
+        plates = sorted(make_table(ctx.n_rows).Plate.unique())
+        pd.DataFrame({'Plate': plates, 'batch': [idx // 10 for idx in range(len(plates))]}).to_csv(filename, index=False)
+    return filename
+
+
+# Action benchmark cases: (name, action key, function returning (args, kwargs) for a context).
+# The context has `n_rows`, `csv` (input file) and `tmpdir` (for output files).
+ACTION_CASES = [
+    ("read-from", 'read-from', lambda ctx: ([ctx.csv], {})),
+    ("write-to", 'write-to', lambda ctx: ([os.path.join(ctx.tmpdir, "out.csv")], {})),
+    ("print-csv", 'print-csv', lambda ctx: ([], {})),
+    ("select-rows-from", 'select-rows-from', lambda ctx: ([ctx.n_rows // 2], {})),
+    ("select-rows-to", 'select-rows-to', lambda ctx: ([ctx.n_rows // 2], {})),
+    ("select-rows-between", 'select-rows-between', lambda ctx: ([ctx.n_rows // 4, ctx.n_rows // 2], {})),
+    ("select-rows-islice", 'select-rows-islice', lambda ctx: ([ctx.n_rows // 4, ctx.n_rows // 2], {})),
+    ("select-rows", 'select-rows', lambda ctx: (["5", f"{ctx.n_rows // 4}:{ctx.n_rows // 2}", "::10"], {})),
+    ("select-query", 'select-query', lambda ctx: (["amount > 50 and name == 'Peter'"], {})),
+    ("select-where[eq]", 'select-where', lambda ctx: (["name", "eq", "Peter"], {})),
+    ("select-where[gt-int]", 'select-where', lambda ctx: (["amount", "gt", "50"], {})),
+    ("select-where[regex]", 'select-where', lambda ctx: (["Pos", "matches", "[A-D]1[0-9]"], {})),
+    ("select-where[glob]", 'select-where', lambda ctx: (["note", "glob", "*signal*"], {})),
+    ("select-fused", 'select-fused', lambda ctx: ([], {'filters': [
+        ('select-where', ("amount", "gt", "50"), {}), ('select-query', ("price < 50",), {}),
+        ('select-where', ("name", "eq", "Peter"), {})]})),
+    ("select-columns", 'select-columns', lambda ctx: (["Pos", "name", "price"], {})),
+    ("sort-by[float]", 'sort-by', lambda ctx: (["price::desc"], {})),
+    ("sort-by[multi]", 'sort-by', lambda ctx: (["name", "amount::desc"], {})),
+    ("sort-by[top-20]", 'sort-by', lambda ctx: (["price::desc"], {'limit': 20})),
+    ("natsort-single", 'natsort-single', lambda ctx: (["Pos"], {})),
+    ("natsort[multi]", 'natsort', lambda ctx: (["Plate", "Pos"], {})),
+    ("group-as", 'group-as', lambda ctx: (["name", "Peter", "Anna", "Sofie"], {})),
+    ("group-by", 'group-by', lambda ctx: (["Plate"], {})),
+    ("aggregate", 'aggregate', lambda ctx: (["amount:sum", "price:mean", "count"], {'by': "Plate,name"})),
+    ("join-with[hash]", 'join-with', lambda ctx: ([plates_file(ctx)], {'on': "Plate"})),
+    ("join-with[partitioned]", 'join-with', lambda ctx: ([plates_file(ctx)], {'on': "Plate", 'strategy': "partitioned"})),
+    ("create-column-fast", 'create-column-fast', lambda ctx: (["total", "amount * price"], {})),
+    ("create-column[arithmetic]", 'create-column', lambda ctx: (["total", "amount * price"], {})),
+    ("create-column[string]", 'create-column', lambda ctx: (["well", "Pos[0] + str(int(Pos[1:]))"], {})),
+    ("create-column[row-wise]", 'create-column', lambda ctx: (["x", "price if amount > 50 else 0"], {})),
+]
+
+# Action chains run through `action_cli`; "{csv}" and "{tmpdir}" are replaced by the context values.
+CLI_CASES = [
+    ("cli:filter-sort-print", ["-read-from", "{csv}", "-select-where", "name", "eq", "Peter",
+                               "-sort-by", "price::desc", "-print-csv", "limit=20"]),
+    ("cli:lazy-filter-print", ["-lazy", "-read-from", "{csv}", "-select-where", "name", "eq", "Peter",
+                               "-select-columns", "Pos", "price", "-print-csv"]),
+    ("cli:lazy-first-matches", ["-lazy", "-read-from", "{csv}", "-select-where", "note", "eq", "control",
+                                "-print-csv", "limit=20"]),
+    ("cli:stream-filter-write", ["-stream", "-read-from", "{csv}", "-select-where", "amount", "lt", "10",
+                                 "-write-to", "{tmpdir}/stream.csv"]),
+    ("cli:natsort-create-write", ["-read-from", "{csv}", "-natsort", "Plate", "Pos",
+                                  "-create-column", "total", "amount * price", "-write-to", "{tmpdir}/out.csv"]),
+    ("cli:external-sort-write", ["sort_memory=1MB", "-stream", "-read-from", "{csv}", "-sort-by", "Plate", "price::desc",
+                                 "-write-to", "{tmpdir}/sorted.csv"]),
+]
+
+
+class Context:
+    def __init__(self, n_rows, csv, tmpdir):
+        self.n_rows = n_rows
+        self.csv = csv
+        self.tmpdir = tmpdir
+
+
+def check_coverage():
+    """ Raise RuntimeError if any action function in `dataframe_actions.ACTIONS` has no benchmark case. """
+    covered = {dataframe_actions.ACTIONS[action_key] for _, action_key, _ in ACTION_CASES}
+    missing = sorted(action_key for action_key, func in dataframe_actions.ACTIONS.items() if func not in covered)
+    if missing:
+        raise RuntimeError(f"No benchmark cases for actions: {', '.join(missing)}. Please add them to ACTION_CASES.")
+
+
+def time_repeats(func, repeat, setup=None):
+    """ Call `func(setup())` `repeat` times, returning the wall times (excluding setup). """
+    times = []
+    for _ in range(repeat):
+        arg = setup() if setup is not None else None
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            start = time.perf_counter()
+            func(arg)
+            times.append(time.perf_counter() - start)
+    return times
+
+
+def run_action_case(action_key, args, kwargs, df, repeat):
+    func = dataframe_actions.ACTIONS[action_key]
+    config = {'verbosity': 0}
+    if func is dataframe_actions.read_file:
+        return time_repeats(lambda _: func(pd.DataFrame(), *args, **kwargs, config=config), repeat)
+    # Actions may modify the table (e.g. create-column), so each run gets a fresh copy:
+    return time_repeats(lambda table: func(table, *args, **kwargs, config=config), repeat, setup=df.copy)
+
+
+def run_cli_case(argv, repeat):
+    return time_repeats(lambda _: action_cli(["verbosity=0"] + argv), repeat)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCHMARKS_DIR, check=True,
+                              stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout.decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def metadata():
+    return {
+        'commit': git_commit(),
+        'date': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark all dataframe actions and typical action chains.")
+    parser.add_argument('--sizes', default="1e4,1e5", help="Comma-separated table sizes (rows), e.g. 1e4,1e5,1e6,1e7.")
+    parser.add_argument('--repeat', type=int, default=3, help="Number of runs per benchmark.")
+    parser.add_argument('--filter', default=None, help="Only run benchmarks whose name contains this string.")
+    parser.add_argument('--output', default=None, help="Result file (JSON). Default: benchmarks/results/.")
+    parser.add_argument('--data-dir', default=None, help="Directory for generated csv files.")
+    args = parser.parse_args(argv)
+
+    check_coverage()
+    sizes = [int(float(size)) for size in args.sizes.split(",")]
+    meta = metadata()
+    results = []
+    tmpdir = tempfile.mkdtemp(prefix="dataframe-action-cli-bench-")
+    try:
+        for n_rows in sizes:
+            csv = get_csv_file(n_rows, data_dir=args.data_dir) if args.data_dir else get_csv_file(n_rows)
+            ctx = Context(n_rows, csv, tmpdir)
+            df = make_table(n_rows)
+            print(f"\n{n_rows} rows:")
+            print(f"    {'benchmark':32} {'min (s)':>10} {'median (s)':>11}")
+            cases = [(name, lambda key=key, make_args=make_args: run_action_case(
+                        key, *make_args(ctx), df=df, repeat=args.repeat))
+                     for name, key, make_args in ACTION_CASES]
+            cases += [(name, lambda cli_argv=cli_argv: run_cli_case(
+                        [arg.format(csv=ctx.csv, tmpdir=ctx.tmpdir) for arg in cli_argv], repeat=args.repeat))
+                      for name, cli_argv in CLI_CASES]
+            for name, run in cases:
+                if args.filter and args.filter not in name:
+                    continue
+                times = run()
+                results.append({'name': name, 'n_rows': n_rows, 'times': times,
+                                'min': min(times), 'median': statistics.median(times)})
+                print(f"    {name:32} {min(times):10.4f} {statistics.median(times):11.4f}", flush=True)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+    output = args.output
+    if output is None:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{meta['date'][:10]}_{meta['commit'] or 'unknown'}.json")
+    with open(output, 'w') as fp:
+        json.dump({'meta': meta, 'results': results}, fp, indent=1)
+    print(f"\nSaved results to {output!r}.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+# Copyright 2020, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Compare two benchmark result files from `bench_suite.py`, e.g. from two commits.
+
+Usage:
+
+    python benchmarks/compare.py <before.json> <after.json> [--threshold 1.1] [--fail-on-regression]
+
+For each benchmark and table size present in both files, the ratio of the minimum times
+(after / before) is printed. Ratios above the threshold are marked as slower, below 1/threshold as faster.
+With `--fail-on-regression`, the script exits with an error if any benchmark got slower.
+
+"""
+
+import argparse
+import json
+import sys
+
+
+def load_results(filename):
+    with open(filename) as fp:
+        data = json.load(fp)
+    return data['meta'], {(result['name'], result['n_rows']): result for result in data['results']}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files.")
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--threshold', type=float, default=1.1, help="Ratio above which a benchmark is 'slower'.")
+    parser.add_argument('--fail-on-regression', action='store_true')
+    args = parser.parse_args(argv)
+
+    meta_before, before = load_results(args.before)
+    meta_after, after = load_results(args.after)
+    print(f"before: {meta_before.get('commit')} ({meta_before.get('date')}, pandas {meta_before.get('pandas')})")
+    print(f"after:  {meta_after.get('commit')} ({meta_after.get('date')}, pandas {meta_after.get('pandas')})\n")
+    print(f"{'benchmark':32} {'rows':>10} {'before (s)':>11} {'after (s)':>11} {'ratio':>7}")
+    slower = []
+    for key in sorted(set(before) & set(after), key=lambda key: (key[1], key[0])):
+        name, n_rows = key
+        time_before, time_after = before[key]['min'], after[key]['min']
+        ratio = time_after / time_before if time_before > 0 else float('inf')
+        if ratio > args.threshold:
+            mark = "slower"
+            slower.append(key)
+        elif ratio < 1 / args.threshold:
+            mark = "faster"
+        else:
+            mark = ""
+        print(f"{name:32} {n_rows:>10} {time_before:11.4f} {time_after:11.4f} {ratio:7.2f} {mark}")
+    only_before = sorted(set(before) - set(after))
+    only_after = sorted(set(after) - set(before))
+    if only_before:
+        print(f"\nOnly in {args.before}: {', '.join(f'{name} ({n_rows})' for name, n_rows in only_before)}")
+    if only_after:
+        print(f"\nOnly in {args.after}: {', '.join(f'{name} ({n_rows})' for name, n_rows in only_after)}")
+    if args.fail_on_regression and slower:
+        sys.exit(f"\n{len(slower)} benchmark(s) got slower than {args.threshold}x.")
+
+
+if __name__ == '__main__':
+    main()
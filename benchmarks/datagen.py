@@ -0,0 +1,83 @@
+# Copyright 2020, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Deterministic synthetic test data for the benchmarks.
+
+The generated table has a mix of column types, similar to typical lab data:
+
+    Pos      Well IDs, "A1" to "P24" (384-well plate), for natural sorting.
+    Plate    Plate names, "Plate-1" to "Plate-50" (low cardinality, natural sort order differs from text order).
+    name     A few person names (low cardinality / categorical).
+    amount   Integers 0-99.
+    price    Floats, with 1% missing values.
+    date     ISO dates in 2019.
+    flag     Booleans.
+    note     Short free-text strings, with 5% missing values.
+
+The same `n_rows` and `seed` always give the same table. Csv files are cached in a data directory,
+so large files are only generated once.
+
+Usage:
+
+    python benchmarks/datagen.py <n_rows> [output.csv]
+
+"""
+
+import os
+import sys
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_DATA_DIR = os.path.join(tempfile.gettempdir(), "dataframe-action-cli-bench")
+
+WELL_IDS = [f"{row}{col}" for row in "ABCDEFGHIJKLMNOP" for col in range(1, 25)]
+PLATE_NAMES = [f"Plate-{idx}" for idx in range(1, 51)]
+NAMES = ["Peter", "Michael", "Anna", "Maria", "Rasmus", "Sofie"]
+NOTE_WORDS = ["ok", "check", "redo", "low signal", "contaminated", "diluted 1:10", "control"]
+
+
+def make_table(n_rows, seed=0) -> pd.DataFrame:
+    """ Return a deterministic synthetic DataFrame with `n_rows` rows. """
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2019-01-01", "2019-12-31").strftime("%Y-%m-%d").to_numpy()
+    price = rng.random(n_rows) * 100
+    price[rng.random(n_rows) < 0.01] = np.nan
+    note = np.array(NOTE_WORDS, dtype=object)[rng.integers(0, len(NOTE_WORDS), n_rows)]
+    note[rng.random(n_rows) < 0.05] = np.nan
+    return pd.DataFrame({
+        'Pos': np.array(WELL_IDS, dtype=object)[rng.integers(0, len(WELL_IDS), n_rows)],
+        'Plate': np.array(PLATE_NAMES, dtype=object)[rng.integers(0, len(PLATE_NAMES), n_rows)],
+        'name': np.array(NAMES, dtype=object)[rng.integers(0, len(NAMES), n_rows)],
+        'amount': rng.integers(0, 100, n_rows),
+        'price': price,
+        'date': dates[rng.integers(0, len(dates), n_rows)],
+        'flag': rng.random(n_rows) < 0.5,
+        'note': note,
+    })
+
+
+def get_csv_file(n_rows, seed=0, data_dir=DEFAULT_DATA_DIR):
+    """ Return the path of a csv file with `make_table(n_rows, seed)`, generating it if it does not exist. """
+    os.makedirs(data_dir, exist_ok=True)
+    filename = os.path.join(data_dir, f"bench_{n_rows}_{seed}.csv")
+    if not os.path.isfile(filename):
+        tmp_fn = filename + ".tmp"
+        make_table(n_rows, seed).to_csv(tmp_fn, index=False)
+        os.replace(tmp_fn, filename)
+    return filename
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    n_rows = int(float(argv[0])) if argv else 10**5
+    if len(argv) > 1:
+        make_table(n_rows).to_csv(argv[1], index=False)
+        print(argv[1])
+    else:
+        print(get_csv_file(n_rows))
+
+
+if __name__ == '__main__':
+    main()
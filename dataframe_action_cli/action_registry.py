@@ -0,0 +1,119 @@
+# Copyright 2020, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Lightweight registry of actions, which only imports an action module when one of its actions is run.
+
+Importing `dataframe_actions` imports pandas, numpy and actionista, which takes a substantial part
+of a second. To keep e.g. `dataframe-action-cli -help` and config actions fast, the action keys
+are read from the action modules' source code (the module-level `ACTIONS` dict), and the docstrings
+(for `-help`) are parsed with `ast`, without importing the modules.
+The module is imported the first time an action function is looked up.
+
+Examples:
+
+    >>> actions = ActionCollection('config_actions')
+    >>> 'verbose' in actions
+    True
+    >>> actions.summary('verbose')
+    'Increase program informational output verbosity.'
+
+"""
+
+import importlib
+import os
+import re
+
+PACKAGE = __name__.rpartition('.')[0]
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# The module-level ACTIONS dict, and its `'action-key': function_name,` entries:
+ACTIONS_DICT_REGEX = re.compile(r"^ACTIONS = \{\n(.*?)^\}", re.MULTILINE | re.DOTALL)
+ACTION_ENTRY_REGEX = re.compile(r"^\s*(['\"])([\w-]+)\1\s*:\s*(\w+),?\s*(#.*)?$")
+
+
+def _read_source(module_name):
+    try:
+        with open(os.path.join(PACKAGE_DIR, module_name + '.py'), encoding='utf-8') as fp:
+            return fp.read()
+    except OSError:
+        return None
+
+
+def _parse_module_actions(source):
+    """ Return dict mapping action keys to function names from an action module's source, without importing it.
+
+    Only the `ACTIONS` dict is parsed (with a regular expression, which is much faster than parsing
+    the whole module). Returns None if the ACTIONS dict is not found or has entries that cannot be parsed.
+    """
+    match = ACTIONS_DICT_REGEX.search(source or '')
+    if match is None:
+        return None
+    actions = {}
+    for line in match.group(1).splitlines():
+        if not line.strip() or line.strip().startswith('#'):
+            continue
+        entry = ACTION_ENTRY_REGEX.match(line)
+        if entry is None:
+            return None
+        actions[entry.group(2)] = entry.group(3)
+    return actions
+
+
+def _parse_docstrings(source):
+    """ Return dict mapping function names to docstrings, for all module-level functions in `source`. """
+    import ast
+    return {node.name: ast.get_docstring(node, clean=False)
+            for node in ast.parse(source).body if isinstance(node, ast.FunctionDef)}
+
+
+class ActionCollection:
+    """ Read-only mapping of action keys to action functions, importing the action module on first lookup. """
+
+    def __init__(self, module_name):
+        self.module_name = module_name
+        self._module = None
+        self._docstrings = None
+        self._source = _read_source(module_name)
+        self._func_names = _parse_module_actions(self._source)
+        if self._func_names is None:
+            # Source not available (e.g. compiled-only install), or ACTIONS is not a plain dict literal.
+            self._func_names = {key: func.__name__ for key, func in self.module.ACTIONS.items()}
+
+    @property
+    def module(self):
+        if self._module is None:
+            self._module = importlib.import_module(f"{PACKAGE}.{self.module_name}")
+        return self._module
+
+    def __contains__(self, action_key):
+        return action_key in self._func_names
+
+    def __iter__(self):
+        return iter(self._func_names)
+
+    def __len__(self):
+        return len(self._func_names)
+
+    def __getitem__(self, action_key):
+        if action_key not in self._func_names:
+            raise KeyError(action_key)
+        return self.module.ACTIONS[action_key]
+
+    def keys(self):
+        return self._func_names.keys()
+
+    def items(self):
+        return ((action_key, self[action_key]) for action_key in self._func_names)
+
+    def docstring(self, action_key):
+        """ Return the docstring of an action's function, without importing the action module. """
+        if self._docstrings is None:
+            try:
+                self._docstrings = _parse_docstrings(self._source)
+            except (TypeError, SyntaxError):
+                self._docstrings = {func.__name__: func.__doc__ for func in self.module.ACTIONS.values()}
+        return self._docstrings.get(self._func_names[action_key])
+
+    def summary(self, action_key):
+        """ Return the first line of an action's docstring. """
+        return (self.docstring(action_key) or '').strip().split('\n', 1)[0].strip()
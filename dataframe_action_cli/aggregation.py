@@ -0,0 +1,172 @@
+# Copyright 2020, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Group-by aggregation, with partial aggregates that can be combined.
+
+Use `-group-by` to give the columns to group by, and `-aggregate` to summarize each group:
+
+    dataframe-action-cli -read-from sales.csv -group-by Plate -aggregate amount:sum price:mean count -print-csv
+    dataframe-action-cli -read-from sales.csv -aggregate total=amount:sum count -print-csv
+
+Each aggregation is given as `<column>:<function>`, where the function is one of
+`sum`, `count` (number of non-missing values), `mean`, `min` or `max`. `count` by itself is the number of rows.
+The result has a column for each aggregation, named e.g. `amount_sum`, or as given by `<name>=<column>:<function>`,
+and one row per group, sorted by the group-by columns. Without `-group-by`, the whole table is summarized in one row.
+
+The groups are found by hashing the group-by columns, and every aggregation is kept as partial states that can be
+combined (sums, counts, minimums and maximums; a mean is kept as a sum and a count). In streaming mode (`-stream`,
+or automatically with `-lazy`), each chunk of the input is aggregated as it is read, and the partial aggregates
+are combined at the end, so the whole table is never held in memory.
+
+"""
+
+import numpy as np
+import pandas as pd
+
+AGGREGATE_FUNCTIONS = ('sum', 'count', 'mean', 'min', 'max', 'size')
+
+# Partial states kept for each aggregate function, and how partial states are combined:
+PARTIAL_STATES = {
+    'sum': ('sum',),
+    'count': ('count',),
+    'mean': ('sum', 'count'),
+    'min': ('min',),
+    'max': ('max',),
+    'size': ('size',),
+}
+COMBINE_STATES = {'sum': 'sum', 'count': 'sum', 'size': 'sum', 'min': 'min', 'max': 'max'}
+
+# Combine the partial aggregates once this many have been collected, to keep memory use bounded:
+MAX_PARTIALS = 16
+
+
+def parse_aggregations(specs):
+    """ Parse aggregation specs, e.g. "amount:sum", "total=amount:sum" or "count".
+
+    Returns:
+        List of (output column, column, function) tuples; the column is None for `count` of rows.
+
+    Examples:
+        >>> parse_aggregations(["amount:sum", "avg=price:mean", "count"])
+        [('amount_sum', 'amount', 'sum'), ('avg', 'price', 'mean'), ('count', None, 'size')]
+    """
+    aggregations = []
+    for spec in specs:
+        name, sep, expr = spec.partition("=")
+        if not sep:
+            name, expr = None, spec
+        column, sep, func = expr.rpartition(":")
+        if not sep:
+            # E.g. "count", the number of rows.
+            column, func = None, expr
+        func = func.strip().lower()
+        if column is None or column == "*":
+            if func not in ('count', 'size'):
+                raise ValueError(f"Invalid aggregation {spec!r}; use <column>:<function>, e.g. amount:sum.")
+            column, func = None, 'size'
+        elif func not in AGGREGATE_FUNCTIONS:
+            raise ValueError(f"Unknown aggregate function {func!r} in {spec!r}; "
+                             f"use one of {', '.join(AGGREGATE_FUNCTIONS[:-1])}.")
+        if name is None:
+            name = "count" if column is None else f"{column}_{func}"
+        aggregations.append((name.strip(), column, func))
+    return aggregations
+
+
+def aggregation_specs(args, kwargs):
+    """ Return the aggregation specs of an `-aggregate` action; named aggregations are parsed as keyword arguments. """
+    return list(args) + [f"{name}={spec}" for name, spec in kwargs.items() if name != 'by']
+
+
+def group_columns(df: pd.DataFrame, by=None):
+    """ Return the group-by columns, given by `by` (a list, or comma-separated string), or a preceding `-group-by`. """
+    if by is None:
+        return list(df.attrs.get('group_by') or [])
+    return [column.strip() for column in by.split(",")] if isinstance(by, str) else list(by)
+
+
+def _state_name(column, state):
+    return f"{state}({column})" if column is not None else state
+
+
+def _partial_states(aggregations):
+    """ Return {state name: (column, state)} for the partial states needed by the aggregations. """
+    states = {}
+    for _, column, func in aggregations:
+        for state in PARTIAL_STATES[func]:
+            states[_state_name(column, state)] = (column, state)
+    return states
+
+
+def partial_aggregate(df: pd.DataFrame, by, aggregations) -> pd.DataFrame:
+    """ Aggregate a table (or a chunk of one) into partial states, one row per group, indexed by the group keys. """
+    states = _partial_states(aggregations)
+    # Without group-by columns, the whole table is one group:
+    keys = list(by) if by else np.zeros(len(df), dtype=np.int8)
+    # Missing values are a group of their own, like in SQL:
+    grouped = df.groupby(keys, sort=False, dropna=False, observed=True)
+    named = {name: pd.NamedAgg(column, state) for name, (column, state) in states.items() if column is not None}
+    sizes = grouped.size()
+    partial = grouped.agg(**named) if named else pd.DataFrame(index=sizes.index)
+    if 'size' in states:
+        # The groups are in the same order for all aggregations:
+        partial['size'] = sizes.to_numpy()
+    return partial
+
+
+def combine_partials(partials):
+    """ Combine partial aggregates (e.g. of different chunks) into one partial aggregate. """
+    if len(partials) == 1:
+        return partials[0]
+    combined = pd.concat(partials)
+    combiners = {name: COMBINE_STATES[name.split("(")[0]] for name in combined.columns}
+    levels = list(range(combined.index.nlevels))
+    return combined.groupby(level=levels, sort=False, dropna=False).agg(combiners)
+
+
+def finalize_aggregate(state: pd.DataFrame, by, aggregations) -> pd.DataFrame:
+    """ Compute the aggregations from the combined partial states, returning one row per group. """
+    if not by and len(state) == 0:
+        # An empty table still gives a summary row, with zero sums and counts:
+        state = state.reindex([0])
+        for name in state.columns:
+            if COMBINE_STATES[name.split("(")[0]] == 'sum':
+                state[name] = state[name].fillna(0).astype(np.int64)
+    result = {}
+    for name, column, func in aggregations:
+        if func == 'mean':
+            count = state[_state_name(column, 'count')]
+            result[name] = state[_state_name(column, 'sum')] / count.where(count > 0)
+        else:
+            result[name] = state[_state_name(column, func)]
+    result = pd.DataFrame(result, index=state.index)
+    if not by:
+        return result.reset_index(drop=True)
+    try:
+        result = result.sort_index(na_position='last')
+    except TypeError:
+        # Group keys of mixed types, e.g. numbers and strings; keep the groups in order of appearance.
+        pass
+    return result.reset_index()
+
+
+class GroupedAggregation:
+    """ Aggregate a table chunk-by-chunk, keeping the combined partial states of the chunks seen so far. """
+
+    def __init__(self, by, aggregations, max_partials=MAX_PARTIALS):
+        self.by = list(by or [])
+        self.aggregations = aggregations
+        self.max_partials = max_partials
+        self.partials = []
+
+    def add(self, chunk: pd.DataFrame):
+        self.partials.append(partial_aggregate(chunk, self.by, self.aggregations))
+        if len(self.partials) >= self.max_partials:
+            self.partials = [combine_partials(self.partials)]
+
+    def result(self) -> pd.DataFrame:
+        if not self.partials:
+            # No chunks at all, e.g. an empty file.
+            columns = self.by + [name for name, _, _ in self.aggregations]
+            return pd.DataFrame(columns=columns)
+        return finalize_aggregate(combine_partials(self.partials), self.by, self.aggregations)
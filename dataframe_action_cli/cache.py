@@ -0,0 +1,195 @@
+# Copyright 2020, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Persistent columnar cache of parsed input files.
+
+When enabled, the first time a csv file is read, the parsed DataFrame is saved in Arrow IPC (Feather)
+format in the cache directory. Later reads of the same, unchanged file (with the same read options)
+memory-map the cached file instead of parsing the csv again.
+
+The cache is enabled in the config file:
+
+    parse_cache:
+      enabled: true
+      directory: ~/.cache/dataframe-action-cli   # Default.
+      max_size: 10GB                              # Least-recently used entries are evicted above this size.
+
+The cache key covers the file's absolute path, size and modification time, and the `read_csv` options,
+so modified files are parsed again. Use the `-cache-stats` and `-cache-clear` actions to inspect and clear the cache.
+
+The cache requires the `pyarrow` package.
+
+"""
+
+import hashlib
+import json
+import os
+import re
+import sys
+import tempfile
+
+DEFAULT_CACHE_DIRECTORY = "~/.cache/dataframe-action-cli"
+DEFAULT_MAX_SIZE = 10 * 1024**3
+CACHE_SUFFIX = ".feather"
+
+# read_csv options that select a subset of the parsed table, and are applied after loading from the cache:
+SUBSET_KWARGS = ('usecols',)
+
+SIZE_UNITS = {'': 1, 'B': 1, 'KB': 1024, 'MB': 1024**2, 'GB': 1024**3, 'TB': 1024**4}
+
+
+def parse_size(size):
+    """ Parse a size, e.g. 1000, "500MB" or "10 GB", to number of bytes.
+
+    Examples:
+        >>> parse_size("500MB")
+        524288000
+        >>> parse_size(1000)
+        1000
+    """
+    if isinstance(size, (int, float)):
+        return int(size)
+    match = re.fullmatch(r"\s*([\d.]+)\s*([KMGT]?B?)\s*", size.upper())
+    if match is None:
+        raise ValueError(f"Could not parse size {size!r}.")
+    number, unit = match.groups()
+    return int(float(number) * SIZE_UNITS[unit if unit in SIZE_UNITS else unit + 'B'])
+
+
+def select_usecols(columns, usecols):
+    """ Return the columns selected by a `read_csv` usecols argument (list of names or callable). """
+    return [col for col in columns if (usecols(col) if callable(usecols) else col in usecols)]
+
+
+class ParseCache:
+    """ Cache of parsed csv files, stored as Feather files in a directory, with LRU eviction. """
+
+    def __init__(self, directory=DEFAULT_CACHE_DIRECTORY, max_size=DEFAULT_MAX_SIZE, verbosity=0):
+        self.directory = os.path.expanduser(directory)
+        self.max_size = parse_size(max_size)
+        self.verbosity = verbosity
+
+    def key(self, filename, read_kwargs):
+        """ Return cache key for a file and read options (excluding options that select a subset). """
+        stat = os.stat(filename)
+        key_data = {
+            'path': os.path.abspath(filename),
+            'size': stat.st_size,
+            'mtime': stat.st_mtime_ns,
+            'kwargs': {key: repr(val) for key, val in sorted(read_kwargs.items()) if key not in SUBSET_KWARGS},
+        }
+        return hashlib.sha256(json.dumps(key_data, sort_keys=True).encode()).hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + CACHE_SUFFIX)
+
+    def entries(self):
+        """ Return list of (path, size, last access time) for all cache entries, least recently used first. """
+        if not os.path.isdir(self.directory):
+            return []
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(CACHE_SUFFIX) and entry.is_file():
+                stat = entry.stat()
+                entries.append((entry.path, stat.st_size, stat.st_mtime))
+        return sorted(entries, key=lambda entry: entry[2])
+
+    def load(self, filename, read_kwargs):
+        """ Load a cached, parsed file, or return None if the file is not in the cache. """
+        from pyarrow import feather
+        cache_fn = self.path(self.key(filename, read_kwargs))
+        if not os.path.isfile(cache_fn):
+            return None
+        # Uncompressed, memory-mapped files are only read from disk when the data is converted:
+        table = feather.read_table(cache_fn, memory_map=True)
+        usecols = read_kwargs.get('usecols')
+        if usecols is not None:
+            table = table.select(select_usecols(table.column_names, usecols))
+        # Touch the file, to keep track of when it was last used (for LRU eviction):
+        os.utime(cache_fn)
+        if self.verbosity >= 2:
+            print(f"Loaded {filename!r} from parse cache {cache_fn!r}.", file=sys.stderr)
+        return table.to_pandas()
+
+    def read(self, filename, read_kwargs, parse):
+        """ Load a parsed file from the cache, or parse it with `parse(filename, **kwargs)` and save it to the cache.
+
+        Options that select a subset of the table (e.g. `usecols`) are applied after parsing,
+        so the whole table is cached and can be reused with other subsets.
+        """
+        df = self.load(filename, read_kwargs)
+        if df is not None:
+            return df
+        df = parse(filename, **{key: val for key, val in read_kwargs.items() if key not in SUBSET_KWARGS})
+        self.store(filename, read_kwargs, df)
+        usecols = read_kwargs.get('usecols')
+        if usecols is not None:
+            df = df[select_usecols(df.columns, usecols)]
+        return df
+
+    def store(self, filename, read_kwargs, df):
+        """ Save a parsed file to the cache, then evict least-recently used entries if the cache is too large. """
+        from pyarrow import feather
+        os.makedirs(self.directory, exist_ok=True)
+        cache_fn = self.path(self.key(filename, read_kwargs))
+        # Write to a temporary file first, so concurrent readers never see a partially written file.
+        fd, tmp_fn = tempfile.mkstemp(suffix=".tmp", dir=self.directory)
+        os.close(fd)
+        try:
+            # Uncompressed, so the file can be memory-mapped when loaded.
+            feather.write_feather(df, tmp_fn, compression='uncompressed')
+            os.replace(tmp_fn, cache_fn)
+        except Exception as exc:
+            os.remove(tmp_fn)
+            if self.verbosity >= 1:
+                print(f"Could not save {filename!r} to parse cache: {exc}", file=sys.stderr)
+            return
+        self.evict()
+
+    def evict(self):
+        """ Remove least-recently used entries until the total cache size is below `max_size`. """
+        entries = self.entries()
+        total_size = sum(size for _, size, _ in entries)
+        for cache_fn, size, _ in entries:
+            if total_size <= self.max_size:
+                break
+            os.remove(cache_fn)
+            total_size -= size
+            if self.verbosity >= 2:
+                print(f"Evicted {cache_fn!r} from parse cache.", file=sys.stderr)
+
+    def clear(self):
+        """ Remove all cache entries, returning the number of entries removed. """
+        entries = self.entries()
+        for cache_fn, _, _ in entries:
+            os.remove(cache_fn)
+        return len(entries)
+
+    def stats(self):
+        entries = self.entries()
+        return {
+            'directory': self.directory,
+            'entries': len(entries),
+            'size': sum(size for _, size, _ in entries),
+            'max_size': self.max_size,
+        }
+
+
+def get_parse_cache(config, require_enabled=True):
+    """ Return a ParseCache as configured by the `parse_cache` config key, or None if the cache is disabled. """
+    cache_config = (config or {}).get('parse_cache') or {}
+    if cache_config is True:
+        cache_config = {'enabled': True}
+    if require_enabled and not cache_config.get('enabled', False):
+        return None
+    if require_enabled:
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            print("WARNING: The parse cache requires the 'pyarrow' package; the cache is disabled.", file=sys.stderr)
+            return None
+    return ParseCache(
+        directory=cache_config.get('directory', DEFAULT_CACHE_DIRECTORY),
+        max_size=cache_config.get('max_size', DEFAULT_MAX_SIZE),
+        verbosity=(config or {}).get('verbosity', 0),
+    )
@@ -0,0 +1,62 @@
+# Copyright 2020, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Cache actions are actions that inspect or modify the persistent parse cache (see `cache.py`),
+or build persistent sidecar indexes of input files (see `indexes.py`).
+
+"""
+
+from .cache import get_parse_cache
+
+
+def _format_size(size):
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+def clear_cache(config, *args, **kwargs):
+    """ Remove all files from the parse cache. """
+    cache = get_parse_cache(config, require_enabled=False)
+    n_removed = cache.clear()
+    print(f"Removed {n_removed} files from parse cache {cache.directory!r}.")
+
+
+def print_cache_stats(config, *args, **kwargs):
+    """ Print the number of files and total size of the parse cache. """
+    cache = get_parse_cache(config, require_enabled=False)
+    stats = cache.stats()
+    enabled = get_parse_cache(config) is not None
+    print(f"Parse cache: {stats['directory']} ({'enabled' if enabled else 'disabled'})")
+    print(f"    Entries:  {stats['entries']}")
+    print(f"    Size:     {_format_size(stats['size'])} of max {_format_size(stats['max_size'])}")
+
+
+def build_index(filename, column, *columns, sep=",", config=None, **kwargs):
+    """ Build sidecar indexes for one or more columns of a csv file, for fast `select-where` lookups.
+
+    Args:
+        filename: The csv file to index.
+        column: The column to index.
+        *columns: Additional columns to index.
+        sep: Column separator.
+        config: App-level config.
+
+    Examples:
+
+        -build-index big.csv sample_id
+        -build-index big.tsv sample_id name sep="\t"
+
+    """
+    from .indexes import build_index as build_column_index
+    for col in (column,) + columns:
+        build_column_index(filename, col, sep=sep, verbosity=max((config or {}).get('verbosity', 1), 1))
+
+
+ACTIONS = {
+    'cache-clear': clear_cache,
+    'cache-stats': print_cache_stats,
+    'build-index': build_index,
+}
@@ -4,20 +4,29 @@
 
 """
 
+import io
+import os
 import sys
-import pandas as pd
 
 from actionista.action_cli_core.action_cli_argv_parser import parse_argv
-from .dataframe_actions import ACTIONS as dataframe_actions
-from .config_actions import ACTIONS as config_actions
-from .help_actions import ACTIONS as help_actions
+from .action_registry import ActionCollection
 from .config import get_config
+from .input_type_conversion import ensure_input_type, STR_TO_BOOL
+from .profiling import get_profiler
 
+# Action modules (and pandas) are only imported when one of their actions is run (see `action_registry`):
 ACTION_COLLECTIONS = {
-    'dataframe': dataframe_actions,
-    'config': config_actions,
-    'help': help_actions,
+    'dataframe': ActionCollection('dataframe_actions'),
+    'config': ActionCollection('config_actions'),
+    'help': ActionCollection('help_actions'),
+    'cache': ActionCollection('cache_actions'),
+    'pipeline': ActionCollection('pipeline'),
 }
+dataframe_actions = ACTION_COLLECTIONS['dataframe']
+config_actions = ACTION_COLLECTIONS['config']
+help_actions = ACTION_COLLECTIONS['help']
+cache_actions = ACTION_COLLECTIONS['cache']
+pipeline_actions = ACTION_COLLECTIONS['pipeline']
 
 
 def get_action(action_key):
@@ -28,7 +37,7 @@ def get_action(action_key):
         raise KeyError(f"action_key '{action_key}' could not be found in any of the action collections.")
 
 
-def action_cli(argv=None, verbose=0):
+def action_cli(argv=None, verbose=0, table_cache=None):
     """ CLI to sort and select data from csv file, inspired by actionista todoist-action-cli.
 
     Examples:
@@ -55,23 +64,187 @@ def action_cli(argv=None, verbose=0):
         dataframe-action-cli -read-from input.csv -create-column <expression>
         dataframe-action-cli -read-from input.csv -create-column "total = amount * price_each"
 
+        # Plan the action chain before running it, only reading the columns and rows needed:
+        dataframe-action-cli -lazy -read-from input.csv -select-where name eq Peter -print-csv
+        dataframe-action-cli -explain -read-from input.csv -select-where name eq Peter -print-csv
+
+        # Only the top 20 rows are selected, instead of sorting the whole table:
+        dataframe-action-cli -read-from input.csv -sort-by total::desc -print-csv limit=20
+
+        # Process a large file one chunk at a time (row-wise actions only):
+        dataframe-action-cli -stream -read-from big.csv -select-where name eq Peter -write-to peter.csv
+
+        # Print time, rows and memory usage for each action:
+        dataframe-action-cli -profile -read-from big.csv -sort-by total -write-to sorted.csv
+        dataframe-action-cli -profile output=profile.jsonl -read-from big.csv -sort-by total -write-to sorted.csv
+
+        # Only process the rows appended to an input file since the last run:
+        dataframe-action-cli -incremental -read-from log.csv -select-where status eq error -write-to errors.csv
+
+        # Run many action chains from a pipeline file, computing shared prefixes only once:
+        dataframe-action-cli -run-pipeline pipeline.yaml
+
+        # Keep parsed tables in memory between runs, using a resident daemon and the thin client:
+        dataframe-action-cli --serve memory_limit=4GB
+        dataframe-action-client -read-from big.csv -select-where name eq Peter -print-csv
+
     """
-    (base_args, base_kwargs), action_groups = parse_argv()
+    if argv is None:
+        argv = sys.argv[1:]
+    if argv and argv[0] == '--serve':
+        from .daemon import serve
+        return serve(argv[1:])
+
+    (base_args, base_kwargs), action_groups = parse_argv(argv)
 
     config = get_config() or {}
     config.update(base_kwargs)
+    if table_cache is not None:
+        # Running in the daemon; `read-from` keeps parsed tables in memory (see `table_cache.py`).
+        config['table_cache'] = table_cache
 
-    config.setdefault('verbosity', 1)
+    config['verbosity'] = int(config.get('verbosity', 1))
 
     if len(action_groups) == 0:
         # Print default help
         action_groups.append(('help', [], {}))
 
+    # Config actions are applied before anything else, since they may change how the chain is run (e.g. `-lazy`).
+    for action_key, action_args, action_kwargs in action_groups:
+        if action_key in config_actions:
+            action_func = config_actions[action_key]
+            if config['verbosity'] >= 1:
+                print(f"\nInvoking '{action_key}' config action with args: {action_args!r}", file=sys.stderr)
+            action_func(*action_args, **action_kwargs, config=config)
+    action_groups = [action_group for action_group in action_groups if action_group[0] not in config_actions]
+
+    if not any(action_key in dataframe_actions for action_key, _, _ in action_groups):
+        # E.g. `-help` or `-cache-stats`: No need to import pandas and the dataframe actions.
+        run_action_chain(action_groups, config=config)
+        return
+
+    from .planner import (
+        merge_read_actions, push_down_indexed_predicates, push_down_row_ranges, push_down_limits, stream_limited_chain,
+        stream_aggregated_chain, external_sort_chain, with_exact_types, plan_action_chain, fuse_row_filters,
+        format_plan,
+    )
+
+    if ensure_input_type(config.get('lazy', False), bool):
+        action_groups = plan_action_chain(action_groups, config=config)
+        if stream_limited_chain(action_groups):
+            # Stream, so reading stops as soon as the limit(s) have been reached.
+            config['stream'] = True
+        elif stream_aggregated_chain(action_groups):
+            # Stream, aggregating chunk-by-chunk, so the whole table is never held in memory.
+            config['stream'] = True
+        elif external_sort_chain(action_groups, config=config):
+            # Sorting files larger than the `sort_memory` budget: Sort chunk-by-chunk, and merge the sorted runs.
+            config['stream'] = True
+        if ensure_input_type(config.get('explain', False), bool):
+            print(format_plan(action_groups))
+            if ensure_input_type(config.get('stream', False), bool):
+                print("(streamed chunk-by-chunk)")
+            return
+        if config['verbosity'] >= 2:
+            print(f"\nOptimized plan:\n{format_plan(action_groups)}", file=sys.stderr)
+    else:
+        # Without `-lazy`, the chain is only rewritten in ways that do not change the output (see `planner`).
+        # Consecutive reads are batched, so the files are read in parallel and concatenated once:
+        action_groups = merge_read_actions(action_groups)
+        # A sort followed by a limited print only has to select the top rows:
+        action_groups = push_down_limits(action_groups)
+        # Lookups on indexed columns (see `-build-index`) only parse the matching rows:
+        action_groups = push_down_indexed_predicates(action_groups, config=config)
+        # ... and row ranges are read by seeking to the first row, using the line offsets saved with the index:
+        action_groups = push_down_row_ranges(action_groups, config=config)
+        # Consecutive row filters are evaluated as one mask, so the rows are only taken once (see `fuse_row_filters`):
+        action_groups = fuse_row_filters(action_groups)
+        if external_sort_chain(action_groups, config=config):
+            # Sorting files larger than the `sort_memory` budget: Sort chunk-by-chunk, and merge the sorted runs.
+            # The chunks are parsed with the column types of the whole file, like reading the whole file.
+            action_groups = with_exact_types(action_groups)
+            config['stream'] = True
+
+    try:
+        incremental = incremental_options(config)
+    except ValueError as exc:
+        print(f"Error: {exc}", file=sys.stderr)
+        sys.exit(2)
+    if incremental is not None:
+        from .incremental import run_incremental
+        run_incremental(action_groups, config=config, state_fn=incremental.get('state'))
+        return
+
+    profiler = get_profiler(config)
+    try:
+        if ensure_input_type(config.get('stream', False), bool):
+            from .streaming import run_streaming, StreamingError
+            try:
+                run_streaming(action_groups, config=config, profiler=profiler)
+            except StreamingError as exc:
+                # E.g. `-stream` with an action that needs the whole table.
+                print(f"Error: {exc}", file=sys.stderr)
+                sys.exit(2)
+        else:
+            run_action_chain(action_groups, config=config, profiler=profiler)
+    except BrokenPipeError:
+        # E.g. `dataframe-action-cli ... -print-csv | head`: Stop quietly, instead of printing a traceback.
+        _silence_stdout()
+        sys.exit(1)
+    finally:
+        if profiler is not None:
+            profiler.report()
+
+
+def incremental_options(config):
+    """ Return the options of incremental mode (e.g. `state`) as a dict, or None if incremental mode is off.
+
+    `-incremental` sets a dict of options; `incremental=True` on the command line (or `incremental: true`
+    in the config file) turns it on with the default options.
+
+    Raises:
+        ValueError, if the `incremental` config value is neither a dict nor a true/false value.
+    """
+    value = (config or {}).get('incremental')
+    if isinstance(value, str) and value.upper() in STR_TO_BOOL:
+        value = STR_TO_BOOL[value.upper()]
+    if value is None or isinstance(value, dict):
+        return value
+    if isinstance(value, (bool, int, float)):
+        return {} if value else None
+    raise ValueError(f"Invalid `incremental` config value {value!r}; "
+                     f"use true or false, or a dict of options, e.g. {{'state': 'errors.state.json'}}.")
+
+
+def _silence_stdout():
+    """ Point stdout to devnull, so Python does not fail to flush it (to a closed pipe) at exit. """
+    try:
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+    except (OSError, ValueError, AttributeError, io.UnsupportedOperation):
+        # E.g. stdout is not a file, when running in the daemon.
+        pass
+
+
+def run_action_chain(action_groups, config, profiler=None, dataframe=None):
+    """ Run a list of (action_key, action_args, action_kwargs) action groups, starting from an empty table.
+
+    Args:
+        action_groups: List of (action_key, action_args, action_kwargs) tuples.
+        config: App-level config.
+        profiler: Optional `profiling.ActionProfiler`, which records timing and memory usage of each dataframe action.
+        dataframe: Table to start from, instead of an empty table (e.g. the result of a previous pipeline step).
+
+    Returns:
+        The resulting DataFrame (or None, if the chain has no dataframe actions).
+    """
     # For each action in the action chain, invoke the action providing the (remaining) tasks as first argument.
-    dataframe = pd.DataFrame()
+    if dataframe is None and any(action_key in dataframe_actions for action_key, _, _ in action_groups):
+        import pandas as pd
+        dataframe = pd.DataFrame()
 
-    for action_key, action_args, action_kwargs in action_groups:
-        n_rows = len(dataframe)
+    for step, (action_key, action_args, action_kwargs) in enumerate(action_groups, start=1):
+        n_rows = 0 if dataframe is None else len(dataframe)
 
         if config['verbosity'] >= 2:
             print(f"\nLooking up action '{action_key}' among the action collections...", file=sys.stderr)
@@ -81,14 +254,24 @@ def action_cli(argv=None, verbose=0):
             if config['verbosity'] >= 1:
                 print(f"\nInvoking '{action_key}' action on {n_rows} rows dataframe with "
                       f"args = {action_args!r}, kwargs = {action_kwargs!r}", file=sys.stderr)
-            dataframe = action_func(dataframe, *action_args, **action_kwargs, config=config)
-        elif action_key in config_actions:
-            action_func = config_actions[action_key]
+            if profiler is None:
+                dataframe = action_func(dataframe, *action_args, **action_kwargs, config=config)
+            else:
+                dataframe = profiler.call(step, action_key, action_func, dataframe, action_args, action_kwargs, config)
+        elif action_key in cache_actions:
+            action_func = cache_actions[action_key]
             if config['verbosity'] >= 1:
-                print(f"\nInvoking '{action_key}' config action with args: {action_args!r}", file=sys.stderr)
+                print(f"\nInvoking '{action_key}' cache action with args: {action_args!r}", file=sys.stderr)
+            action_func(*action_args, **action_kwargs, config=config)
+        elif action_key in pipeline_actions:
+            action_func = pipeline_actions[action_key]
+            if config['verbosity'] >= 1:
+                print(f"\nInvoking '{action_key}' pipeline action with args: {action_args!r}", file=sys.stderr)
             action_func(*action_args, **action_kwargs, config=config)
         elif action_key in help_actions:
             action_func = help_actions[action_key]
             action_func(*action_args, **action_kwargs, config=config)
         else:
             raise KeyError(f"action_key '{action_key}' could not be found in any of the action collections.")
+
+    return dataframe
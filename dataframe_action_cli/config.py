@@ -5,7 +5,6 @@
 """
 
 import os
-import yaml
 
 CONFIG_PATHS = [
     "~/.dataframe_action_cli_config.yaml"
@@ -29,6 +28,7 @@ def get_config(config_fn=None):
         config_fn = get_config_file()
     if config_fn is None:
         return
+    import yaml  # Only imported when there is a config file to load.
     with open(config_fn) as fp:
         config = yaml.safe_load(fp)
     return config
@@ -38,6 +38,7 @@ def get_config_and_filepath():
     config_fn = get_config_file()
     if config_fn is None:
         return None, None
+    import yaml
     with open(config_fn) as fp:
         config = yaml.safe_load(fp)
     return config, config_fn
@@ -5,6 +5,8 @@ Config actions are actions that changes the runtime configuration object.
 
 """
 
+from .input_type_conversion import ensure_input_type
+
 
 def increment_verbosity(config, *args, **kwargs):
     """ Increase program informational output verbosity. """
@@ -13,9 +15,67 @@ def increment_verbosity(config, *args, **kwargs):
     config['verbosity'] = config.get('verbosity', 0) + 1
 
 
+def enable_lazy(config, *args, **kwargs):
+    """ Plan the whole action chain before running it (projection and predicate pushdown). """
+    config['lazy'] = True
+
+
+def enable_explain(config, *args, **kwargs):
+    """ Print the optimized plan for the action chain, instead of running it. """
+    config['lazy'] = True
+    config['explain'] = True
+
+
+def enable_streaming(config, *args, chunksize=None, **kwargs):
+    """ Run row-wise action chains one chunk at a time, using constant memory. """
+    config['stream'] = True
+    if chunksize is not None:
+        config['chunksize'] = int(chunksize)
+
+
+def enable_incremental(config, *args, state=None, **kwargs):
+    """ Only process the rows appended to the input file since the last run (see `incremental`).
+
+    Args:
+        config: App-level config.
+        state: State file, recording how much of the input has been processed.
+            Defaults to `<output file>.incremental.json`.
+    """
+    config['incremental'] = {'state': state}
+
+
+def enable_auto_compact(config, *args, **kwargs):
+    """ Downcast numeric columns and convert low-cardinality string columns to categoricals after reading. """
+    config['auto_compact'] = True
+
+
+def enable_profiling(config, *args, output=None, format=None, cprofile=None, tracemalloc=False, **kwargs):
+    """ Record wall time, CPU time, rows and memory usage for each action in the chain (see `profiling`).
+
+    Args:
+        config: App-level config.
+        output: Write the profile to this file, instead of printing it to stderr.
+        format: 'table' or 'jsonl'. Defaults to 'jsonl' for .jsonl/.json output files, otherwise 'table'.
+        cprofile: Run the first action with this key under cProfile, e.g. `cprofile=natsort`.
+        tracemalloc: Also record the peak memory allocated by Python during each action (slow).
+    """
+    config['profile'] = {
+        'output': output,
+        'format': format,
+        'cprofile': cprofile,
+        'tracemalloc': ensure_input_type(tracemalloc, bool, varname='tracemalloc', args=args),
+    }
+
+
 ACTIONS = {
     'verbose': increment_verbosity,
     'v': increment_verbosity,
+    'lazy': enable_lazy,
+    'explain': enable_explain,
+    'stream': enable_streaming,
+    'auto-compact': enable_auto_compact,
+    'incremental': enable_incremental,
+    'profile': enable_profiling,
 }
 
 
@@ -0,0 +1,206 @@
+# Copyright 2020, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Resident daemon, which keeps parsed tables in memory between runs, and a thin client.
+
+Start the daemon, which listens on a local Unix socket:
+
+    dataframe-action-cli --serve
+    dataframe-action-cli --serve memory_limit=4GB socket=/tmp/my-daemon.sock
+
+Then run action chains through the client, with the same arguments as `dataframe-action-cli`:
+
+    dataframe-action-client -read-from big.csv -select-where name eq Peter -print-csv
+
+The client only imports a few standard library modules, so it starts in a few milliseconds.
+It sends the arguments, the working directory and stdin (if it is piped) to the daemon,
+which runs the action chain with `action_cli`, i.e. through exactly the same dispatch as a one-shot run,
+and streams stdout, stderr and the exit code back. If no daemon is running, the client runs the
+action chain itself.
+
+The daemon caches the tables read by `read-from`, keyed by file path and modification time
+(see `table_cache.py`), so repeated runs against the same files skip parsing.
+Requests are handled one at a time (the daemon is single-threaded).
+
+The socket path defaults to `dataframe-action-cli-<uid>.sock` in the temp directory,
+and can be set with the `DATAFRAME_ACTION_CLI_SOCKET` environment variable (for both daemon and client).
+
+"""
+
+import json
+import os
+import socket
+import struct
+import sys
+import tempfile
+
+SOCKET_ENV_VAR = "DATAFRAME_ACTION_CLI_SOCKET"
+
+# Frames sent from the daemon to the client: 1-byte channel, 4-byte length, data.
+FRAME_HEADER = struct.Struct(">cI")
+STDOUT_CHANNEL = b'o'
+STDERR_CHANNEL = b'e'
+EXIT_CHANNEL = b'x'
+
+
+def default_socket_path():
+    if os.environ.get(SOCKET_ENV_VAR):
+        return os.environ[SOCKET_ENV_VAR]
+    uid = os.getuid() if hasattr(os, 'getuid') else os.getlogin()
+    return os.path.join(tempfile.gettempdir(), f"dataframe-action-cli-{uid}.sock")
+
+
+def _recv_exactly(stream, n_bytes):
+    data = stream.read(n_bytes)
+    if len(data) < n_bytes:
+        raise ConnectionError("Connection closed by the daemon.")
+    return data
+
+
+# Server:
+
+def _frame_stream(wfile, channel):
+    """ Return a text stream (with a binary `.buffer`) that sends everything written to it as frames. """
+    import io
+
+    class FrameWriter(io.RawIOBase):
+        def writable(self):
+            return True
+
+        def write(self, data):
+            data = bytes(data)
+            if data:
+                wfile.write(FRAME_HEADER.pack(channel, len(data)) + data)
+            return len(data)
+
+    return io.TextIOWrapper(io.BufferedWriter(FrameWriter(), buffer_size=1024 * 1024),
+                            encoding='utf-8', newline='', write_through=False)
+
+
+def _stdin_stream(data):
+    import io
+    return io.TextIOWrapper(io.BufferedReader(io.BytesIO(data)), encoding='utf-8')
+
+
+def run_request(request, stdin_data, wfile, table_cache):
+    """ Run one action chain, with stdin/stdout/stderr connected to the client. Returns the exit code. """
+    import contextlib
+    import traceback
+    from .cli import action_cli
+
+    stdout, stderr = _frame_stream(wfile, STDOUT_CHANNEL), _frame_stream(wfile, STDERR_CHANNEL)
+    prev_cwd, prev_stdin = os.getcwd(), sys.stdin
+    exit_code = 0
+    try:
+        os.chdir(request.get('cwd') or prev_cwd)
+        sys.stdin = _stdin_stream(stdin_data)
+        with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr):
+            try:
+                action_cli(request['argv'], table_cache=table_cache)
+            except SystemExit as exc:
+                exit_code = exc.code if isinstance(exc.code, int) else (0 if exc.code is None else 1)
+                if not isinstance(exc.code, (int, type(None))):
+                    print(exc.code, file=sys.stderr)
+            except Exception:
+                traceback.print_exc()
+                exit_code = 1
+            finally:
+                sys.stdout.flush()
+                sys.stderr.flush()
+    finally:
+        os.chdir(prev_cwd)
+        sys.stdin = prev_stdin
+    return exit_code
+
+
+def serve(argv=None):
+    """ Run the daemon: `dataframe-action-cli --serve [memory_limit=2GB] [socket=<path>] [verbosity=1]` """
+    import signal
+    import socketserver
+    from .table_cache import TableCache, DEFAULT_MAX_SIZE
+
+    options = dict(arg.split("=", 1) for arg in (argv or []) if "=" in arg)
+    socket_path = options.get('socket') or default_socket_path()
+    verbosity = int(options.get('verbosity', 1))
+    table_cache = TableCache(max_size=options.get('memory_limit', DEFAULT_MAX_SIZE), verbosity=verbosity)
+
+    class RequestHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            request = json.loads(self.rfile.readline())
+            stdin_data = _recv_exactly(self.rfile, request.get('stdin_size', 0)) if request.get('stdin_size') else b''
+            try:
+                exit_code = run_request(request, stdin_data, self.wfile, table_cache)
+                self.wfile.write(FRAME_HEADER.pack(EXIT_CHANNEL, 4) + struct.pack(">i", exit_code))
+            except (BrokenPipeError, ConnectionResetError):
+                # The client went away, e.g. `dataframe-action-client ... | head`.
+                return
+            if verbosity >= 1:
+                stats = table_cache.stats()
+                print(f"{' '.join(request['argv'])!r} -> exit code {exit_code}; table cache: {stats['tables']} tables, "
+                      f"{stats['size'] / 1024**2:.1f} MB, {stats['hits']} hits, {stats['misses']} misses.",
+                      file=sys.stderr)
+
+    if os.path.exists(socket_path):
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(socket_path)
+        except OSError:
+            # Stale socket file from a daemon that was killed.
+            os.remove(socket_path)
+        else:
+            probe.close()
+            sys.exit(f"A daemon is already listening on {socket_path!r}.")
+    # Import pandas and the actions up front, so the first request is fast as well:
+    from . import dataframe_actions  # noqa: F401
+    server = socketserver.UnixStreamServer(socket_path, RequestHandler)
+    os.chmod(socket_path, 0o600)
+    print(f"dataframe-action-cli daemon listening on {socket_path!r} "
+          f"(table cache limit {table_cache.max_size / 1024**2:.0f} MB).", file=sys.stderr)
+    # Remove the socket file when terminated with e.g. `kill`:
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+
+
+# Client:
+
+def client_main(argv=None):
+    """ Run an action chain in the daemon, or in this process if no daemon is running. """
+    argv = sys.argv[1:] if argv is None else argv
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) if hasattr(socket, 'AF_UNIX') else None
+    try:
+        if sock is None:
+            raise OSError("Unix sockets are not available.")
+        sock.connect(default_socket_path())
+    except OSError:
+        from .cli import action_cli
+        return action_cli(argv)
+
+    # Only send stdin if it is piped and may be read, i.e. "-" is one of the arguments:
+    stdin_data = b''
+    if "-" in argv and not sys.stdin.isatty():
+        stdin_data = sys.stdin.buffer.read()
+    request = {'argv': list(argv), 'cwd': os.getcwd(), 'stdin_size': len(stdin_data)}
+    with sock, sock.makefile('rwb') as stream:
+        stream.write(json.dumps(request).encode() + b"\n" + stdin_data)
+        stream.flush()
+        outputs = {STDOUT_CHANNEL: sys.stdout.buffer, STDERR_CHANNEL: sys.stderr.buffer}
+        while True:
+            channel, size = FRAME_HEADER.unpack(_recv_exactly(stream, FRAME_HEADER.size))
+            data = _recv_exactly(stream, size)
+            if channel == EXIT_CHANNEL:
+                sys.stdout.flush()
+                sys.exit(struct.unpack(">i", data)[0])
+            try:
+                outputs[channel].write(data)
+                if channel == STDERR_CHANNEL:
+                    outputs[channel].flush()
+            except BrokenPipeError:
+                # E.g. piped to `head`; closing the connection tells the daemon to stop.
+                sys.exit(1)
@@ -10,34 +10,427 @@ Examples:
 
 """
 
+import ast
+import concurrent.futures
+import functools
+import glob
+import os
 import sys
+import numpy as np
 import pandas as pd
+from pandas.api.types import is_bool_dtype, is_float_dtype, is_integer_dtype, is_numeric_dtype
 
 from actionista import binary_operators
 from .input_type_conversion import STR_TO_BOOL, ensure_input_type
+from .vectorized_operators import vectorized_mask, coerce_value, NotVectorizable
+from .expressions import evaluate_expression, evaluate_format_expression
+from .cache import get_parse_cache
+from .parallel import resolve_workers, use_parallel, map_row_blocks
+from .natural_sort import natural_sort_order
+from .aggregation import parse_aggregations, aggregation_specs, group_columns, partial_aggregate, finalize_aggregate
+from .joins import join_tables
+from .schemas import apply_schema, compact_dataframe, unify_categories
+from .indexes import read_indexed, read_row_range
+from .writers import write_csv_chunks
+from .readers import ENGINE_READ_KWARGS, read_csv, iter_csv_chunks
+from .file_formats import (
+    BINARY_FORMATS, STDIO_FILENAME, detect_format, output_format,
+    read_table_file, iter_table_file_chunks, write_table_file,
+)
+
+
+# Number of rows per chunk, when reading files chunk-by-chunk:
+DEFAULT_CHUNKSIZE = 100000
+
+# With copy-on-write (always on from pandas 3.0), row selections and new columns share the data of the table
+# they are derived from until either of them is modified, instead of copying the whole table for every action.
+if int(pd.__version__.split(".")[0]) < 3:
+    try:
+        pd.set_option('mode.copy_on_write', True)
+    except KeyError:
+        # pandas < 1.5
+        pass
+
+
+def _iter_chunks(filename, chunksize, sep=",", format=None, config=None, **kwargs):
+    fmt = detect_format(filename, format)
+    if fmt in BINARY_FORMATS:
+        yield from iter_table_file_chunks(
+            filename, fmt, chunksize, usecols=kwargs.get('usecols'), nrows=kwargs.get('nrows'),
+            dtype=kwargs.get('dtype'), parse_dates=kwargs.get('parse_dates'))
+        return
+    yield from iter_csv_chunks(filename, chunksize, sep=sep, config=config, **kwargs)
+
+
+def _value_kind(series: pd.Series):
+    """ Return the kind of values in a parsed column: 'empty' (all missing), 'bool', 'int', 'float' or 'text'. """
+    if series.isna().all():
+        return 'empty'
+    if is_bool_dtype(series) or (series.dtype == object and series.dropna().map(type).eq(bool).all()):
+        # Booleans with missing values are parsed as objects.
+        return 'bool'
+    if is_integer_dtype(series):
+        return 'int'
+    if is_float_dtype(series):
+        return 'float'
+    return 'text'
+
+
+def _whole_file_types(filename, chunksize, sep=",", config=None, **kwargs):
+    """ Return (parse dtypes, casts) that give every chunk of a csv file the column types of the whole file.
+
+    Without them, each chunk's column types are inferred from the rows in the chunk, e.g. a column of numbers
+    with missing values is parsed as integers in chunks without missing values. The file is read once,
+    chunk-by-chunk, to find the kinds of values in each column. Text columns are parsed as strings (so e.g.
+    "007" stays "007"), and the other columns are cast to the type pandas gives the whole column.
+    """
+    given = kwargs.get('dtype') or {}
+    if not isinstance(given, dict):
+        # A single dtype for all columns.
+        return {}, {}
+    kinds, missing = {}, {}
+    for chunk in _iter_chunks(filename, chunksize, sep=sep, config=config, **kwargs):
+        for column in chunk.columns:
+            kinds.setdefault(column, set()).add(_value_kind(chunk[column]))
+            missing[column] = missing.get(column, False) or bool(chunk[column].isna().any())
+    dtypes, casts = {}, {}
+    for column, column_kinds in kinds.items():
+        column_kinds = column_kinds - {'empty'}
+        if column in given or not column_kinds:
+            continue
+        if 'text' in column_kinds or ('bool' in column_kinds and len(column_kinds) > 1):
+            dtypes[column] = str
+        elif column_kinds == {'bool'}:
+            if missing[column]:
+                casts[column] = object
+        elif column_kinds != {'int'} or missing[column]:
+            casts[column] = 'float64'
+    return dtypes, casts
+
+
+def iter_file_chunks(filename, *args, config=None, sep=",", where=None, chunksize=None, row_range=None,
+                     exact_types=False, **kwargs):
+    """ Read a table file chunk-by-chunk, yielding one DataFrame per chunk.
+
+    The chunks' index continues from one chunk to the next, just like when reading the whole file.
+    Only the rows in `row_range`, a `(start, stop)` tuple, are kept (see `read_file`), and the file is
+    not read any further than `stop`.
+    Any `select-where` predicates given by `where` are applied to each chunk before it is yielded.
+    The number of rows per chunk defaults to the `chunksize` config value.
+    Column types are given by the file's schema in the config (if any), see `schemas.py`.
+    Otherwise they are inferred for each chunk, or with `exact_types`, for the whole csv file, which takes
+    an extra pass over the file (see `_whole_file_types`).
+    """
+    if chunksize is None:
+        chunksize = (config or {}).get('chunksize', DEFAULT_CHUNKSIZE)
+    kwargs = apply_schema(filename, kwargs, config)
+    casts = {}
+    if (ensure_input_type(exact_types, bool) and filename != STDIO_FILENAME
+            and detect_format(filename, kwargs.get('format')) == 'csv'):
+        dtypes, casts = _whole_file_types(filename, int(chunksize), sep=sep, config=config, **kwargs)
+        if dtypes:
+            kwargs = dict(kwargs, dtype=dict(dtypes, **(kwargs.get('dtype') or {})))
+    start, stop = row_range or (0, None)
+    start, stop = int(start), (None if stop is None else int(stop))
+    for chunk in _iter_chunks(filename, int(chunksize), sep=sep, config=config, **kwargs):
+        if casts:
+            chunk = chunk.astype(casts)
+        # The chunks' index is the row numbers in the file:
+        end = chunk.index[-1] + 1 if len(chunk) else 0
+        if row_range is not None:
+            chunk = chunk[(chunk.index >= start) & (chunk.index < stop if stop is not None else True)]
+        for where_args, where_kwargs in where or []:
+            chunk = select_where(chunk, *where_args, **where_kwargs, config=config)
+        yield chunk
+        if stop is not None and end >= stop:
+            # The rest of the file is not in the range, and is not read.
+            break
+
+
+def expand_filenames(filenames):
+    """ Expand glob patterns, e.g. "shards/*.csv", into sorted lists of files. Other filenames are kept as-is. """
+    expanded = []
+    for filename in filenames:
+        if any(char in filename for char in "*?["):
+            matches = sorted(glob.glob(os.path.expanduser(filename)))
+            if not matches:
+                raise FileNotFoundError(f"No files matching {filename!r}.")
+            expanded.extend(matches)
+        else:
+            expanded.append(filename)
+    return expanded
+
+
+def _read_table_file(filename, sep=",", where=None, chunksize=None, config=None, format=None, compact=False,
+                     **kwargs):
+    """ Read a single table file, returning (DataFrame, number of rows in file before applying `where`).
+
+    The file's schema (if any) is applied, and the table is compacted if `compact` is true (see `schemas.py`).
+    """
+    config = config or {}
+    kwargs = apply_schema(filename, kwargs, config)
+    table_cache = config.get('table_cache')
+    if table_cache is not None and filename != STDIO_FILENAME and not chunksize:
+        # Running in the daemon (see `daemon.py`): Keep the whole parsed table in memory for later requests.
+        def parse(fn, **parse_kwargs):
+            df = _parse_table_file(fn, config=config, **parse_kwargs)[0]
+            return compact_dataframe(df, verbosity=config.get('verbosity', 1), label=fn) if compact else df
+        return table_cache.read(
+            filename, dict(sep=sep, where=where, format=format, compact=compact, **kwargs),
+            parse=lambda fn, compact=False, **parse_kwargs: parse(fn, **parse_kwargs),
+            select_where=functools.partial(select_where, config=config))
+    df, n_rows = _parse_table_file(filename, sep=sep, where=where, chunksize=chunksize, config=config,
+                                   format=format, **kwargs)
+    if compact:
+        df = compact_dataframe(df, verbosity=config.get('verbosity', 1), label=filename)
+    return df, n_rows
+
+
+def _parse_table_file(filename, sep=",", where=None, chunksize=None, config=None, format=None, row_range=None,
+                      exact_types=False, **kwargs):
+    fmt = detect_format(filename, format)
+    if row_range is not None:
+        # Only the given rows are read (inserted by the planner, see `planner.push_down_row_ranges`):
+        df = _read_row_range(filename, fmt, *row_range, sep=sep, config=config, exact_types=exact_types, **kwargs)
+        return df, len(df)
+    if where and fmt == 'csv' and not chunksize and filename != STDIO_FILENAME:
+        # Only parse the rows selected by the file's sidecar indexes (see `indexes.py`), if any:
+        # The reader engine does not matter when reading individual rows:
+        result = read_indexed(filename, where, sep=sep, verbosity=config.get('verbosity', 0),
+                              **{key: val for key, val in kwargs.items() if key not in ENGINE_READ_KWARGS})
+        if result is not None:
+            df, n_rows = result
+            for where_args, where_kwargs in where:
+                df = select_where(df, *where_args, **where_kwargs, config=config)
+            return df, n_rows
+        if exact_types:
+            # Read the whole file and then filter it, so the column types are the same as without `where`:
+            df = read_csv(filename, sep=sep, config=config, **kwargs)
+            n_rows = len(df)
+            for where_args, where_kwargs in where:
+                df = select_where(df, *where_args, **where_kwargs, config=config)
+            return df, n_rows
+    cache = get_parse_cache(config) if fmt == 'csv' and not chunksize and filename != STDIO_FILENAME else None
+    if fmt in BINARY_FORMATS or cache is not None:
+        if cache is not None:
+            # The block size and number of threads do not change the result, so they are not part of the cache key:
+            read_kwargs = {key: val for key, val in kwargs.items() if key not in ('block_size', 'threads')}
+            parse = functools.partial(read_csv, block_size=kwargs.get('block_size'), threads=kwargs.get('threads'),
+                                      config=config)
+            df = cache.read(filename, dict(sep=sep, **read_kwargs), parse=parse)
+        else:
+            df = read_table_file(filename, fmt, usecols=kwargs.get('usecols'), nrows=kwargs.get('nrows'),
+                                 dtype=kwargs.get('dtype'), parse_dates=kwargs.get('parse_dates'))
+        n_rows = len(df)
+        for where_args, where_kwargs in where or []:
+            df = select_where(df, *where_args, **where_kwargs, config=config)
+        return df, n_rows
+    if not (where or chunksize):
+        df = read_csv(filename, sep=sep, config=config, **kwargs)
+        return df, len(df)
+    chunks, n_rows = [], 0
+    chunksize = int(chunksize or config.get('chunksize', DEFAULT_CHUNKSIZE))
+    for chunk in _iter_chunks(filename, chunksize, sep=sep, format=fmt, config=config, **kwargs):
+        n_rows += len(chunk)
+        for where_args, where_kwargs in where or []:
+            chunk = select_where(chunk, *where_args, **where_kwargs, config=config)
+        chunks.append(chunk)
+    # Categorical columns get different categories in each chunk, which must be unified before concatenating.
+    # An empty file (only header) does not produce any chunks:
+    df = pd.concat(unify_categories(chunks)) if chunks else read_csv(filename, sep=sep, config=config,
+                                                                     **dict(kwargs, nrows=0))
+    return df, n_rows
+
+
+def _read_row_range(filename, fmt, start, stop=None, sep=",", config=None, exact_types=False, **kwargs):
+    """ Read rows `start` to `stop` (exclusive, or to the end if None) of a file, keeping the row numbers as index.
+
+    The rows before `start` are skipped without being parsed, or not read at all if the file has an index
+    (see `indexes.py`). With `exact_types`, the whole file is read if it has no index, so the column types
+    are the same as when reading the whole file.
+    """
+    start, stop = int(start), (None if stop is None else int(stop))
+    if fmt == 'csv' and filename != STDIO_FILENAME:
+        df = read_row_range(filename, start, stop, sep=sep, verbosity=config.get('verbosity', 0),
+                            **{key: val for key, val in kwargs.items() if key not in ENGINE_READ_KWARGS})
+        if df is not None:
+            return df
+        if exact_types:
+            return read_csv(filename, sep=sep, config=config, **kwargs).iloc[start:stop]
+    if fmt in BINARY_FORMATS:
+        df = read_table_file(filename, fmt, usecols=kwargs.get('usecols'), nrows=stop,
+                             dtype=kwargs.get('dtype'), parse_dates=kwargs.get('parse_dates'))
+        return df.iloc[start:]
+    nrows = None if stop is None else max(stop - start, 0)
+    if filename == STDIO_FILENAME:
+        df = read_csv(filename, sep=sep, config=config, skiprows=range(1, start + 1), nrows=nrows, **kwargs)
+    else:
+        # Skipping a number of lines is much faster than skipping a list of line numbers, but skips the header too:
+        columns = list(read_csv(filename, sep=sep, nrows=0).columns)
+        df = read_csv(filename, sep=sep, config=config, skiprows=start + 1, header=None, names=columns,
+                      nrows=nrows, **kwargs)
+    df.index = pd.RangeIndex(start, start + len(df))
+    return df
+
+
+def read_file(df: pd.DataFrame, filename, *args, config=None, sep=",", ignore_index=True, join='outer', copy=True,
+              where=None, chunksize=None, workers=None, pool=None, format=None, compact=None, row_range=None,
+              exact_types=False, **kwargs) -> pd.DataFrame:
+    """ Read data from one or more files, appending it to the existing data (if any).
+
+    Multiple files and glob patterns are read in parallel, and concatenated once at the end.
+    Besides csv, Arrow IPC streams, Feather and Parquet files can be read (see `file_formats`).
+
+    Args:
+        df: DataFrame with the existing data.
+        filename: The file to read, a glob pattern, e.g. "shards/*.csv", or "-" to read from stdin.
+        *args: Additional files or glob patterns to read.
+        config: App-level config.
+        sep: Column separator.
+        ignore_index: Passed to `pd.concat` when appending to existing data.
+        join: Passed to `pd.concat` when appending to existing data.
+        copy: Passed to `pd.concat` when appending to existing data.
+        where: List of `(args, kwargs)` for `select-where` predicates to apply while reading.
+            The file is read chunk-by-chunk and each chunk is filtered before the next is parsed.
+            This is normally inserted by the lazy planner (predicate pushdown).
+        chunksize: Number of rows per chunk, when reading chunk-by-chunk (e.g. in `-stream` mode).
+        workers: Number of files to read in parallel. Defaults to the `read_workers` config value,
+            or the number of CPUs.
+        pool: Use a 'thread' (default) or 'process' pool for reading files in parallel.
+            Defaults to the `read_pool` config value.
+        format: File format, 'csv', 'arrow', 'feather' or 'parquet'.
+            Defaults to the format given by the file extension (or the first bytes of stdin).
+        compact: Downcast numeric columns and convert low-cardinality string columns to categoricals
+            after reading, reporting the memory saved. Defaults to the `auto_compact` config value.
+        row_range: Only read rows `start` to `stop` (exclusive; None for all remaining rows) of a single file,
+            given as a `(start, stop)` tuple. The row numbers are kept as index.
+            This is normally inserted by the planner, for row-range actions following the read.
+        exact_types: Parse the rows selected by `where` or `row_range` with the column types of the whole file.
+            If the file's sidecar index cannot be used, the whole file is read before selecting the rows,
+            instead of reading it chunk-by-chunk (or only the rows in the range), where column types are inferred
+            from the rows read. This is inserted by the planner outside lazy mode, where the output must not change.
+        engine: (in kwargs) Csv reader, 'pandas' or 'pyarrow' (multithreaded), with options `block_size`
+            and `threads`. Defaults to the `read_engine` config value, see `readers`.
+        **kwargs: Passed on to `pd.read_csv`, e.g. `usecols`.
+            Column types can also be given per file by `schemas` in the config, see `schemas.py`.
+
+    Returns:
+        DataFrame
+
+    Examples:
 
+        -read-from input1.csv input2.csv
+        -read-from "shards/*.csv" workers=8
+        -read-from big.csv compact=True
+        -read-from big.csv.gz engine=pyarrow threads=4
 
-def read_file(df: pd.DataFrame, filename, *args, config=None, sep=",", ignore_index=True, join='outer', copy=True, **kwargs) -> pd.DataFrame:
-    df2 = pd.read_csv(filename, sep=sep, **kwargs)
-    if df is None or len(df) == 0:
-        return df2
+    """
+    config = config or {}
+    filenames = expand_filenames([filename, *args])
+    workers = int(workers or config.get('read_workers') or min(len(filenames), os.cpu_count() or 1))
+    pool = pool or config.get('read_pool', 'thread')
+    compact = ensure_input_type(config.get('auto_compact', False) if compact is None else compact, bool)
+    if row_range is not None:
+        if len(filenames) > 1:
+            raise ValueError("`row_range` can only be used when reading a single file.")
+        kwargs['row_range'] = tuple(row_range)
+    if exact_types:
+        kwargs['exact_types'] = ensure_input_type(exact_types, bool)
+    read_kwargs = dict(sep=sep, where=where, chunksize=chunksize, format=format, compact=compact, **kwargs)
+    if len(filenames) == 1 or workers <= 1:
+        results = [_read_table_file(fn, config=config, **read_kwargs) for fn in filenames]
     else:
-        return pd.concat([df, df2], join=join, ignore_index=ignore_index, copy=copy)
+        if pool == 'process':
+            executor_cls = concurrent.futures.ProcessPoolExecutor
+            # Only pass on the (picklable) config values used for reading:
+            worker_config = {key: config[key] for key in ('verbosity', 'chunksize', 'parse_cache', 'schemas')
+                             if key in config}
+        else:
+            executor_cls, worker_config = concurrent.futures.ThreadPoolExecutor, config
+        with executor_cls(max_workers=workers) as executor:
+            results = list(executor.map(
+                functools.partial(_read_table_file, config=worker_config, **read_kwargs), filenames))
+        if config.get('verbosity', 0) >= 1:
+            print(f"Read {len(filenames)} files using {workers} {pool} workers.", file=sys.stderr)
+    frames = [frame for frame, _ in results]
+    if df is not None and len(df) > 0:
+        frames.insert(0, df)
+    elif where and ignore_index and len(frames) > 1:
+        # Number the rows as if the files had been concatenated before being filtered:
+        offsets = np.cumsum([0] + [n_rows for _, n_rows in results[:-1]])
+        frames = [frame.set_axis(frame.index + offset, axis=0) for frame, offset in zip(frames, offsets)]
+        return pd.concat(unify_categories(frames), join=join, copy=copy)
+    # Keep categorical columns (e.g. from schemas or compaction) categorical when concatenating:
+    frames = unify_categories(frames)
+    if len(frames) == 1:
+        return frames[0]
+    return pd.concat(frames, join=join, ignore_index=ignore_index, copy=copy)
+
+
+def write_csv(df: pd.DataFrame, filename, *args, header=True, index=False, index_label=None, append=False,
+              format=None, compression='infer', engine=None, chunksize=None, config=None) -> pd.DataFrame:
+    """ Write table to a csv file (or Arrow/Feather/Parquet file).
+
+    Csv files are written in chunks, and compressed if the file extension is e.g. `.gz` or `.zst` (see `writers`).
+
+    Args:
+        df: DataFrame.
+        filename: The file to write to, or "-" for stdout.
+        *args: Additional arguments, e.g. ['no-header', 'index'].
+        header: Whether to write the column names.
+        index: Whether to write the row index.
+        index_label: Column name for the index column.
+        append: Append to the file (without header), instead of overwriting it.
+        format: File format, 'csv', 'arrow', 'feather' or 'parquet'. Defaults to the format given by the extension.
+        compression: 'gzip', 'bz2', 'xz', 'zstd' or 'none'. Defaults to the compression given by the extension.
+        engine: Csv writer, 'pandas' or 'pyarrow' (multithreaded). Defaults to the `write_engine` config value.
+        chunksize: Number of rows written at a time. Defaults to the `write_chunksize` config value.
+        config: App-level config.
 
+    Returns:
+        DataFrame
+
+    Examples:
 
-def write_csv(df: pd.DataFrame, filename, header=True, index=False, index_label=None, config=None) -> pd.DataFrame:
-    df.to_csv(filename)
+        -write-to output.csv
+        -write-to output.csv.gz engine=pyarrow
+
+    """
+    append = ensure_input_type(append, bool, varname='append', args=args)
+    header = False if append else ensure_input_type(header, bool, varname='header', args=args)
+    index = ensure_input_type(index, bool, varname='index', args=args)
+    fmt = output_format(filename, format)
+    if fmt in BINARY_FORMATS:
+        # In `-stream` mode, binary files are kept open for the following chunks (see `streaming.run_streaming`):
+        write_table_file(df, filename, fmt, index=index, append=append, writers=(config or {}).get('table_writers'))
+    else:
+        write_csv_chunks(df, filename, header=header, index=index, index_label=index_label, append=append,
+                         compression=compression, engine=engine, chunksize=chunksize, config=config)
     return df
 
 
-def print_csv(df: pd.DataFrame, *args, limit=None, header=True, index=False, index_label=None, config=None, **kwargs) -> pd.DataFrame:
-    header = ensure_input_type(header, bool, varname='header', args=args)
+def print_csv(df: pd.DataFrame, *args, limit=None, header=True, index=False, index_label=None, append=False,
+              format=None, engine=None, chunksize=None, config=None, **kwargs) -> pd.DataFrame:
+    """ Print table to stdout as csv. Use `append` to leave out the header, e.g. when printing a continuation.
+
+    Rows are printed in chunks, and stdout is flushed after each chunk,
+    so e.g. `| head` or `| less` shows the first rows right away.
+    Use `format=arrow` to print the table as a binary Arrow IPC stream, e.g. when piping to another
+    `dataframe-action-cli` process, which can read it with `-read-from -`.
+    """
+    append = ensure_input_type(append, bool, varname='append', args=args)
+    header = False if append else ensure_input_type(header, bool, varname='header', args=args)
     index = ensure_input_type(index, bool, varname='index', args=args)
     print_df = df
     if limit:
         limit = int(limit)
         print_df = df.iloc[:limit]
-    print(print_df.to_csv(header=header, index=index, index_label=index_label))
+    if format and format.lower() != 'csv':
+        write_table_file(print_df, STDIO_FILENAME, output_format(STDIO_FILENAME, format), index=index, append=append,
+                         writers=(config or {}).get('table_writers'))
+    else:
+        write_csv_chunks(print_df, STDIO_FILENAME, header=header, index=index, index_label=index_label,
+                         engine=engine, chunksize=chunksize, config=config)
     return df
 
 
@@ -63,15 +456,61 @@ def select_rows_islice(df: pd.DataFrame, from_row, to_row, config=None) -> pd.Da
     return df.iloc[from_row:to_row]
 
 
+def parse_row_spec(spec):
+    """ Parse a row spec, a row label or a slice of row labels (as for `df.loc`), e.g. "8", "2:5", "20:" or "::2".
+
+    Examples:
+        >>> parse_row_spec("2:5")
+        slice(2, 5, None)
+        >>> parse_row_spec("8")
+        8
+    """
+    parts = [part.strip() for part in str(spec).split(":")]
+    if len(parts) > 3 or (len(parts) == 1 and not parts[0]):
+        raise ValueError(f"Invalid row spec {spec!r}; use e.g. 8, 2:5, 20: or ::2.")
+    labels = []
+    for part in parts:
+        try:
+            labels.append(int(part) if part else None)
+        except ValueError:
+            # A non-numeric row label.
+            labels.append(part)
+    return labels[0] if len(labels) == 1 else slice(*labels)
+
+
+def row_spec_positions(index: pd.Index, specs) -> np.ndarray:
+    """ Return the positions of the rows selected by row specs (see `parse_row_spec`), in the order given. """
+    positions = []
+    for spec in specs:
+        # Label slices include the stop label, like `df.loc`:
+        loc = index.slice_indexer(spec.start, spec.stop, spec.step) if isinstance(spec, slice) else index.get_loc(spec)
+        if isinstance(loc, slice):
+            positions.append(np.arange(*loc.indices(len(index))))
+        elif isinstance(loc, np.ndarray):
+            # Duplicate labels (boolean mask).
+            positions.append(np.flatnonzero(loc))
+        else:
+            positions.append(np.array([loc]))
+    return np.concatenate(positions) if positions else np.array([], dtype=np.intp)
+
+
 def select_rows_loc_eval(df: pd.DataFrame, *args, config=None) -> pd.DataFrame:
     """ A more advanced, general-purpose row-selection method.
 
+    The row specs are row labels, or slices of row labels (including the stop label), see `parse_row_spec`.
+    The rows are selected all at once, in the order given.
+
     Examples:
 
         -select-rows 2:5 8 13 20:25
 
     """
-    return pd.concat([eval("df.loc[{arg}]".format(arg=arg)) for arg in args])
+    return df.take(row_spec_positions(df.index, [parse_row_spec(arg) for arg in args]))
+
+
+def select_columns(df: pd.DataFrame, *columns, config=None) -> pd.DataFrame:
+    """ Select columns, discarding all other columns. """
+    return df[list(columns)]
 
 
 def select_query_action(df: pd.DataFrame, *query, config=None) -> pd.DataFrame:
@@ -80,7 +519,46 @@ def select_query_action(df: pd.DataFrame, *query, config=None) -> pd.DataFrame:
     return df.query(query)
 
 
-def select_where(df: pd.DataFrame, column, comparison_method, comparison_value=None, invert=False, config=None) -> pd.DataFrame:
+def apply_operator_rows(block: pd.DataFrame, column, comparison_method, comparison_value):
+    """ Apply a binary operator from `actionista.binary_operators` row-by-row, returning a list of bools. """
+    comparison_func = getattr(binary_operators, comparison_method)
+    return [bool(comparison_func(row_val, comparison_value)) for row_val in block[column].tolist()]
+
+
+def select_where_mask(df: pd.DataFrame, column, comparison_method, comparison_value=None, invert=False,
+                      workers=None, config=None):
+    """ Return a boolean mask (numpy array) for the rows where `column` compares true to `comparison_value`.
+
+    Operators with a vectorized implementation (see `vectorized_operators`) are evaluated for the whole
+    column at once. Other operators from `actionista.binary_operators` are applied row-by-row,
+    optionally split over `workers` processes (see `parallel`).
+    """
+    invert = ensure_input_type(invert, ensure_type=bool)
+    series = df[column]
+    if comparison_method.lower() == 'isna' or (
+            comparison_method == 'is' and comparison_value.lower() in ("na", "n/a", "nan")):
+        mask = series.isna().to_numpy()
+        return ~mask if invert else mask
+    if comparison_method == 'in':
+        if "," in comparison_value:
+            comparison_value = {v.strip() for v in comparison_value.split(",")}
+        if config and config.get('verbosity', 0) >= 2:
+            print(f"Comparison: {column} {comparison_method} {comparison_value}", file=sys.stderr)
+    try:
+        mask = vectorized_mask(series, comparison_method, comparison_value)
+    except (NotVectorizable, TypeError):
+        workers = resolve_workers(workers, config)
+        if use_parallel(df, workers, config):
+            mask = map_row_blocks(apply_operator_rows, df[[column]], workers, column=column,
+                                  comparison_method=comparison_method, comparison_value=comparison_value)
+        else:
+            mask = apply_operator_rows(df, column, comparison_method, comparison_value)
+        mask = np.asarray(mask, dtype=bool)
+    return ~mask if invert else mask
+
+
+def select_where(df: pd.DataFrame, column, comparison_method, comparison_value=None, invert=False,
+                 workers=None, config=None) -> pd.DataFrame:
     """ Select rows where a column matches a given value (using some kind of comparison method).
 
     Args:
@@ -89,6 +567,7 @@ def select_where(df: pd.DataFrame, column, comparison_method, comparison_value=N
         comparison_method: The method to match with, e.g. 'eq', 'matches', 'less-than', etc.
         comparison_value: The value to match/compare against.
         invert: Invert the selection.
+        workers: Number of processes to use for operators that are applied row-by-row.
         config: App-level config.
 
     Returns:
@@ -103,32 +582,104 @@ def select_where(df: pd.DataFrame, column, comparison_method, comparison_value=N
         dataframe-action-cli -read-from input.csv -select-where <columnX> in <list-of-values>
 
     """
-    invert = ensure_input_type(invert, ensure_type=bool)
-    if comparison_method.lower() == 'isna' or (
-            comparison_method == 'is' and comparison_value.lower() in ("na", "n/a", "nan")):
-        return df.loc[df[column].isna()]
-    comparison_func_ = getattr(binary_operators, comparison_method)
-    if invert:
-        def comparison_func(a, b):
-            return not comparison_func_(a, b)
+    return df.loc[select_where_mask(df, column, comparison_method, comparison_value, invert=invert,
+                                    workers=workers, config=config)]
+
+
+def _query_columns(df: pd.DataFrame, query):
+    """ Return the columns used in a `select-query` query (all columns, if the query is not plain Python syntax). """
+    try:
+        names = {node.id for node in ast.walk(ast.parse(query.strip(), mode='eval')) if isinstance(node, ast.Name)}
+    except SyntaxError:
+        # E.g. `column name` in backticks, or @variable.
+        return list(df.columns)
+    return [column for column in df.columns if column in names]
+
+
+def filter_mask(df: pd.DataFrame, filters, config=None) -> np.ndarray:
+    """ Return a boolean mask (numpy array) for the rows passing all filters.
+
+    Args:
+        df: DataFrame.
+        filters: List of `(action_key, action_args, action_kwargs)` for `select-where` and `select-query` actions.
+        config: App-level config.
+
+    Each filter is only evaluated for the rows that passed the filters before it, taking only the columns
+    used by the filter, so the table is not copied for every filter.
+    """
+    mask = np.ones(len(df), dtype=bool)
+    for action_key, action_args, action_kwargs in filters:
+        if ACTIONS[action_key] is select_query_action:
+            query = " ".join(action_args)
+            columns = _query_columns(df, query)
+        else:
+            columns = [action_args[0] if action_args else action_kwargs['column']]
+        positions = np.flatnonzero(mask)
+        rows = df[columns] if len(positions) == len(df) else df[columns].take(positions)
+        if ACTIONS[action_key] is select_query_action:
+            mask[positions] = np.asarray(rows.eval(query), dtype=bool)
+        else:
+            mask[positions] = select_where_mask(rows, *action_args, **action_kwargs, config=config)
+    return mask
+
+
+def select_fused(df: pd.DataFrame, filters=(), config=None) -> pd.DataFrame:
+    """ Select the rows passing all of a list of `select-where` and `select-query` filters, see `filter_mask`.
+
+    The filters are evaluated as a single mask, and the selected rows are only taken once, at the end.
+    This is inserted by the planner for consecutive filter actions (see `planner.fuse_row_filters`).
+    """
+    return df.loc[filter_mask(df, filters, config=config)]
+
+
+def _top_k_candidates(series: pd.Series, k, ascending=True, na_position='last'):
+    """ Return the sorted positions of the rows that may be among the first `k` rows when sorting by `series`.
+
+    The candidates are all rows with a value strictly before the k'th value in sort order,
+    plus all rows tied with the k'th value, so a stable sort of the candidates by all sort columns
+    gives the same first `k` rows as a stable sort of the whole table.
+
+    Returns:
+        Integer array of row positions (in original row order), or None if `series` is not numeric.
+    """
+    if not is_numeric_dtype(series.dtype):
+        return None
+    isna = series.isna().to_numpy()
+    values = series.to_numpy(dtype=float, na_value=np.nan) if isna.any() else series.to_numpy()
+    valid_positions = np.flatnonzero(~isna)
+    na_positions = np.flatnonzero(isna)
+    if na_position == 'first':
+        if len(na_positions) >= k:
+            return na_positions
+        k_valid = k - len(na_positions)
     else:
-        comparison_func = comparison_func_
-    if comparison_method == 'in':
-        if "," in comparison_value:
-            comparison_value = {v.strip() for v in comparison_value.split(",")}
-        print(f"Comparison: {column} {comparison_func} {comparison_value}")
-    # This doesn't cache e.g. regex comparison, maybe optimize for special cases.
-    apply_func = lambda row_val: bool(comparison_func(row_val, comparison_value))
-    return df.loc[df[column].apply(apply_func)]
+        k_valid = k
+        na_positions = na_positions[:0]
+    if k_valid >= len(valid_positions):
+        return None
+    valid = values[valid_positions]
+    if ascending:
+        threshold = np.partition(valid, k_valid - 1)[k_valid - 1]
+        candidates = valid_positions[valid <= threshold]
+    else:
+        threshold = np.partition(valid, len(valid) - k_valid)[len(valid) - k_valid]
+        candidates = valid_positions[valid >= threshold]
+    return np.sort(np.concatenate([na_positions, candidates]))
 
 
-def sort_by(df: pd.DataFrame, *columns, kind='mergesort', na_position='last', config=None) -> pd.DataFrame:
+def sort_by(df: pd.DataFrame, *columns, kind='mergesort', na_position='last', limit=None, config=None) -> pd.DataFrame:
     """
 
     Args:
         df: DataFrame.
         *columns:
             Use <column>::ascending or <column>::descending to control ascending or descending sort order.
+        kind: Sort algorithm, passed to `DataFrame.sort_values`.
+        na_position: 'first' or 'last', where to put rows with missing values.
+        limit: Only return the first `limit` rows of the sorted table.
+            If the first sort column is numeric, the first rows are found by partial selection
+            (`np.partition`), and only those rows (and any ties) are sorted.
+            This is inserted automatically for `-sort-by ... -print-csv limit=N` chains.
         config:
 
     Returns:
@@ -142,55 +693,165 @@ def sort_by(df: pd.DataFrame, *columns, kind='mergesort', na_position='last', co
         (column.split("::")[0], False) if '::des' in column else (column, True)
         for column in columns
     ])
+    if limit is not None:
+        limit = int(limit)
+        candidates = _top_k_candidates(df[sort_by_cols[0]], limit, ascending[0], na_position)
+        if candidates is not None:
+            if config and config.get('verbosity', 0) >= 2:
+                print(f"Sorting {len(candidates)} top-{limit} candidates of {len(df)} rows.", file=sys.stderr)
+            df = df.take(candidates)
     # OBS: When giving multiple columns to sort on, it should be a list, not a tuple.
-    return df.sort_values(by=list(sort_by_cols), ascending=list(ascending), kind=kind, na_position=na_position)
+    df = df.sort_values(by=list(sort_by_cols), ascending=list(ascending), kind=kind, na_position=na_position)
+    return df if limit is None else df.iloc[:limit]
 
 
 def natsort_by(df: pd.DataFrame, *columns, kind='mergesort', na_position='last', config=None) -> pd.DataFrame:
-    """ Sort strings naturally, e.g. sort "A2" before "A10" """
-    try:
-        import natsort
-    except ImportError:
-        print("\n\nERROR!   --> Could not import natsort! <--  "
-              "DataFrame will not be sorted. Please install the 'natsort' package.",
-              file=sys.stderr)
-        return df
+    """ Sort strings naturally, e.g. sort "A2" before "A10".
+
+    Args:
+        df: DataFrame.
+        *columns: Columns to sort by.
+            Use <column>::ascending or <column>::descending to control ascending or descending sort order.
+        kind: Not used; natural sorting is always stable. Accepted for consistency with `sort-by`.
+        na_position: 'first' or 'last', where to put rows with missing values.
+        config: App-level config, used to cache the natural sort keys of each column within the action chain.
+
+    Returns:
+        Sorted DataFrame.
 
+    Examples:
+
+        >>> natsort_by(df, "Plate-name::desc", "Pos")
+
+    """
     sort_by_cols, ascending = zip(*[
         (column.split("::")[0], False) if '::des' in column else (column, True)
         for column in columns
     ])
-    # Should be lists, not tuples, when used as arguments to DataFrame.sort_values().
-    sort_by_cols, ascending = list(sort_by_cols), list(ascending)
+    order = natural_sort_order(df, list(sort_by_cols), list(ascending), na_position=na_position, config=config)
+    # Positional indexing, since the index labels are not row positions after e.g. filtering.
+    return df.take(order)
 
-    keyfunc = natsort.natsort_key
-    keyvalues = pd.DataFrame(data={col: df[col].apply(keyfunc) for col in sort_by_cols})
-    # Alternatively, concatenate the series horizontally to make a dataframe:
-    # keyvalues = pd.concat([df[col].apply(keyfunc) for col in sort_by], axis=1)
-    sorted_keyvalues = keyvalues.sort_values(by=sort_by_cols, ascending=ascending)
-    sorted_idxs = sorted_keyvalues.index
-    return df.iloc[sorted_idxs]
 
+def natsort_by_single(df: pd.DataFrame, column, reverse=False, na_position=None, config=None) -> pd.DataFrame:
+    """ Sort strings naturally by a single column, e.g. sort "A2" before "A10".
 
-def natsort_by_single(df: pd.DataFrame, column, reverse=False, config=None) -> pd.DataFrame:
-    """ Sort strings naturally, e.g. sort "A2" before "A10" """
-    try:
-        import natsort
-    except ImportError:
-        print("\n\nERROR!   --> Could not import natsort! <--  "
-              "DataFrame will not be sorted. Please install the 'natsort' package.",
-              file=sys.stderr)
-        return df
-    sorted_idxs = natsort.index_natsorted(df[column], reverse=reverse)
-    return df.iloc[sorted_idxs]
+    Missing values are placed first, or last with `reverse=True` (like `natsort`), unless `na_position` is given.
+    """
+    reverse = ensure_input_type(reverse, ensure_type=bool)
+    if na_position is None:
+        na_position = 'last' if reverse else 'first'
+    order = natural_sort_order(df, [column], not reverse, na_position=na_position, config=config)
+    return df.take(order)
 
 
-def group_as(df: pd.DataFrame, column, reverse=False, config=None) -> pd.DataFrame:
+def group_as(df: pd.DataFrame, column, *groups, reverse=False, config=None) -> pd.DataFrame:
     """ Sort groups in a particular, custom order.
     This will also remove rows in unlisted groups.
-    For instance, if you want to first list 'Banana', then 'Apple', then 'Citrus'.
+    For instance, if you want to first list 'Banana', then 'Apple', then 'Citrus':
+
+        -group-as fruit Banana Apple Citrus
+
+    The rows are sorted by the position of their group in the list,
+    and the rows within each group keep their order. Use `reverse=True` to list the groups in reverse order.
+    """
+    reverse = ensure_input_type(reverse, ensure_type=bool)
+    series = df[column]
+    categories = []
+    for group in groups:
+        try:
+            group = coerce_value(series, group)
+        except NotVectorizable:
+            # E.g. "abc" for a numeric column, which does not match any rows.
+            pass
+        if group not in categories:
+            categories.append(group)
+    # The position of each row's group in the list, or -1 for unlisted groups:
+    codes = pd.Index(categories).get_indexer(series)
+    listed = np.flatnonzero(codes >= 0)
+    order = np.argsort(-codes[listed] if reverse else codes[listed], kind='stable')
+    return df.take(listed[order])
+
+
+def group_by(df: pd.DataFrame, *columns, config=None) -> pd.DataFrame:
+    """ Group rows by one or more columns, for a following `-aggregate` action (see `aggregation`).
+
+    Examples:
+
+        -group-by Plate name -aggregate amount:sum price:mean count
+
+    """
+    missing = [column for column in columns if column not in df.columns]
+    if missing:
+        raise KeyError(f"Cannot group by {missing}: No such column(s).")
+    df = df.copy(deep=False)
+    df.attrs['group_by'] = list(columns)
+    return df
+
+
+def aggregate(df: pd.DataFrame, *aggregations, by=None, config=None, **named_aggregations) -> pd.DataFrame:
+    """ Summarize each group of rows (see `group_by`), or the whole table, returning one row per group.
+
+    Args:
+        df: DataFrame.
+        *aggregations: `<column>:<function>`, where function is sum, count, mean, min or max,
+            optionally named, `<name>=<column>:<function>`. `count` by itself counts rows.
+        by: Columns to group by (comma-separated), instead of a preceding `-group-by`.
+        config: App-level config.
+        **named_aggregations: Named aggregations, `<name>=<column>:<function>`.
+
+    Returns:
+        DataFrame with the group-by columns and a column for each aggregation, sorted by the group-by columns.
+
+    Examples:
+
+        -aggregate amount:sum price:mean count by=Plate
+        -aggregate total=amount:sum
+
+    """
+    by = group_columns(df, by)
+    aggregations = parse_aggregations(aggregation_specs(aggregations, named_aggregations))
+    return finalize_aggregate(partial_aggregate(df, by, aggregations), by, aggregations)
+
+
+def join_with(df: pd.DataFrame, filename, *args, on=None, how='inner', strategy=None, memory=None, suffix="_right",
+              sep=",", config=None, **kwargs) -> pd.DataFrame:
+    """ Join the table with another table file, keeping the order of the table's rows (see `joins`).
+
+    Args:
+        df: DataFrame.
+        filename: The file to join with (or "-" for stdin), or a glob pattern.
+        *args: Additional files or glob patterns, read as one table.
+        on: Join columns, comma-separated. Defaults to the columns in both tables.
+        how: 'inner' (only rows with a match) or 'left' (all rows of the table).
+        strategy: Join strategy, 'merge', 'hash' or 'partitioned'. Defaults to picking one from the table sizes.
+        memory: Memory budget for the join, e.g. "500MB". Defaults to the `join_memory` config value, or 1 GB.
+        suffix: Suffix for other columns that are in both tables.
+        sep: Column separator of the file.
+        config: App-level config.
+        **kwargs: Read options, passed on to `read_file`, e.g. `usecols` or `engine`.
+
+    Returns:
+        The joined DataFrame, renumbered.
+
+    Examples:
+
+        -join-with plates.csv on=Plate
+        -join-with plates.csv on=Plate,Pos how=left strategy=partitioned
+
     """
-    pass
+    filenames = expand_filenames([filename, *args])
+    # The size of the file(s) on disk is used as an estimate of the table size in memory:
+    right_size = sum(os.path.getsize(fn) for fn in filenames if fn != STDIO_FILENAME)
+
+    def iter_right_chunks():
+        for fn in filenames:
+            yield from iter_file_chunks(fn, config=config, sep=sep, **kwargs)
+
+    return join_tables(
+        df, lambda: read_file(None, *filenames, config=config, sep=sep, **kwargs), iter_right_chunks, right_size,
+        on=on, how=how, strategy=strategy, memory=memory, suffix=suffix, config=config,
+        label=f"join-with {filename}")
 
 
 def create_column_dfeval(df: pd.DataFrame, *args, config=None) -> pd.DataFrame:
@@ -198,30 +859,43 @@ def create_column_dfeval(df: pd.DataFrame, *args, config=None) -> pd.DataFrame:
 
     For more info on using Pandas eval, see:
     https://stackoverflow.com/questions/53779986/dynamic-expression-evaluation-in-pandas-using-pd-eval
+
+    Examples:
+
+        -create-column-fast "total = amount * price"
+        -create-column-fast total "amount * price"
+
     """
 
     # OBS: Slicing is not a supported operation, meaning you cannot do much string manipulation.
     #
-    if args[1] == "=":
+    if len(args) > 1 and args[1] == "=":
         # Forgot quote marks, e.g. `-create-column total = colA + colB`
         args = [" ".join(args)]
+    verbosity = (config or {}).get('verbosity', 0)
     if len(args) == 1:
         # Style: "col3 = col1 + col2"
-        expr, = args[0]
-        print("create-column expr:", expr)
+        expr, = args
+        if verbosity >= 2:
+            print("create-column expr:", expr, file=sys.stderr)
+        # Returns a new DataFrame with the column added; with copy-on-write, the existing columns are not copied.
         return df.eval(expr, engine='python')
     elif len(args) == 2:
         # Style: "col3", "col1 + col2"
         col, expr = args
-        print(f"create-column {col} expr:", expr)
-        df[col] = df.eval(expr, engine='python')
-        return df
+        if verbosity >= 2:
+            print(f"create-column {col} expr:", expr, file=sys.stderr)
+        return df.assign(**{col: df.eval(expr, engine='python')})
     else:
-        raise RuntimeError("`create-column` arguments could not be recognized:", args)
+        raise RuntimeError(f"`create-column-fast` arguments could not be recognized: {args!r}")
+
 
+def create_column_pyeval(df: pd.DataFrame, columnname, expr, *args, use_format=False, workers=None,
+                         config=None) -> pd.DataFrame:
+    """ Create a new column, using a Python expression evaluated with the row's values.
 
-def create_column_pyeval(df: pd.DataFrame, columnname, expr, *args, use_format=False, config=None) -> pd.DataFrame:
-    """ Create a new column, using a `eval(expr)` inside a list comprehension (slow).
+    The expression is compiled once. Simple expressions (arithmetic, comparisons, string slicing,
+    and a few builtins) are evaluated for whole columns at once, other expressions row-by-row.
 
     Args:
         df: DataFrame.
@@ -229,6 +903,7 @@ def create_column_pyeval(df: pd.DataFrame, columnname, expr, *args, use_format=F
         expr: Expression used to create the new column.
         *args: Additional arguments, e.g. ['no-use-format'].
         use_format: Whether to apply string format, e.g. use `eval(expr.format(**row))`.
+        workers: Number of processes to use for expressions that are evaluated row-by-row.
         config: app-wide config object.
 
     Returns:
@@ -251,10 +926,11 @@ def create_column_pyeval(df: pd.DataFrame, columnname, expr, *args, use_format=F
     use_format = ensure_input_type(
         use_format, bool, varname='use-format', args=args)
     if use_format:
-        df[columnname] = [eval(expr.format(**dict(row)), None, dict(row)) for rowidx, row in df.iterrows()]
+        values = evaluate_format_expression(df, expr, config=config, workers=workers)
     else:
-        df[columnname] = [eval(expr, None, dict(row)) for rowidx, row in df.iterrows()]
-    return df
+        values = evaluate_expression(df, expr, config=config, workers=workers)
+    # A new DataFrame (sharing the existing columns), instead of modifying a table that may be a row selection:
+    return df.assign(**{columnname: values})
 
 
 ACTIONS = {
@@ -276,8 +952,13 @@ ACTIONS = {
     'select-rows-to': select_rows_to,
     'select-rows-between': select_rows_between,
     'select-rows-islice': select_rows_islice,
+    'select-rows': select_rows_loc_eval,
     'select-query': select_query_action,
     'select-where': select_where,
+    'select-fused': select_fused,
+
+    # Column selection:
+    'select-columns': select_columns,
 
     # Row sorting:
     'sort-by': sort_by,
@@ -285,6 +966,16 @@ ACTIONS = {
     'natsort-by': natsort_by,
     'natsort': natsort_by,
     'sort-natural': natsort_by,
+    'group-as': group_as,
+
+    # Aggregation:
+    'group-by': group_by,
+    'aggregate': aggregate,
+    'agg': aggregate,
+
+    # Joining tables:
+    'join-with': join_with,
+    'join': join_with,
 
     # Column creation:
     'create-column-fast': create_column_dfeval,
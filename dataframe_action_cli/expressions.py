@@ -0,0 +1,260 @@
+# Copyright 2020, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Evaluation of Python expressions for `create-column`.
+
+Expressions are parsed and compiled once. Expressions that only use column names, constants,
+arithmetic, comparisons, string indexing/slicing, a few builtins (`str`, `int`, `float`, `len`, `abs`)
+and common string methods (e.g. `.upper()`, `.strip()`) are evaluated as whole-column operations.
+All other expressions are evaluated row-by-row, using the pre-compiled expression and
+the column values as plain lists (which is still much faster than `df.iterrows()`).
+
+Examples:
+
+    >>> df = pd.DataFrame({'Pos': ['A1', 'B12'], 'amount': [2, 3], 'price_each': [1.5, 2.0]})
+    >>> list(evaluate_expression(df, "amount * price_each"))
+    [3.0, 6.0]
+    >>> list(evaluate_expression(df, "str(int(Pos[1:])) + ' ' + Pos[0]"))
+    ['1 A', '12 B']
+
+"""
+
+import ast
+import functools
+import operator
+import string
+import sys
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import infer_dtype, is_bool_dtype, is_integer_dtype
+
+from .parallel import resolve_workers, use_parallel, map_row_blocks
+
+# Globals available to expressions evaluated row-by-row (in addition to the builtins):
+EVAL_GLOBALS = {'pd': pd, 'np': np}
+
+
+class NotVectorizable(Exception):
+    """ Raised when an expression cannot be evaluated as whole-column operations. """
+
+
+BINARY_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+}
+DIVISION_OPERATORS = (ast.Div, ast.FloorDiv, ast.Mod)
+# Operators whose result may not fit in int64, when applied to integers:
+OVERFLOW_OPERATORS = (ast.Add, ast.Sub, ast.Mult, ast.Pow)
+INT64_LIMIT = 2.0 ** 63
+UNARY_OPERATORS = {
+    ast.USub: operator.neg,
+    ast.UAdd: operator.pos,
+}
+COMPARISON_OPERATORS = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+}
+# String methods that can be applied with `Series.str.<method>(*args)`, when called on a column:
+STRING_METHODS = {
+    'upper', 'lower', 'title', 'capitalize', 'swapcase', 'casefold',
+    'strip', 'lstrip', 'rstrip', 'zfill', 'center', 'ljust', 'rjust',
+    'startswith', 'endswith', 'isdigit', 'isalpha', 'isalnum', 'isspace', 'isupper', 'islower',
+}
+
+
+@functools.lru_cache(maxsize=256)
+def compile_expression(expr):
+    """ Parse and compile an expression once, returning (ast tree, code object). """
+    tree = ast.parse(expr.strip(), mode='eval')
+    return tree, compile(tree, '<create-column>', 'eval')
+
+
+def _as_series(value, df):
+    return value if isinstance(value, pd.Series) else pd.Series(value, index=df.index)
+
+
+def _is_str_series(value):
+    """ Return True if value is a column of strings, without any missing values. """
+    # With pandas' string dtypes (the default from pandas 3), `infer_dtype` ignores missing values:
+    return isinstance(value, pd.Series) and infer_dtype(value, skipna=False) == 'string' and not value.isna().any()
+
+
+def _is_integer(value):
+    """ Return True if value is an integer column or constant (not booleans). """
+    if isinstance(value, pd.Series):
+        return is_integer_dtype(value) and not is_bool_dtype(value)
+    return isinstance(value, (int, np.integer)) and not isinstance(value, (bool, np.bool_))
+
+
+def _check_overflow(op, left, right):
+    """ Raise NotVectorizable if an integer operation could overflow int64 (Python ints do not overflow). """
+    as_float = [value.astype('float64') if isinstance(value, pd.Series) else float(value) for value in (left, right)]
+    with np.errstate(over='ignore', invalid='ignore'):
+        result = BINARY_OPERATORS[type(op)](*as_float)
+    if np.any(np.abs(result) >= INT64_LIMIT):
+        raise NotVectorizable("Integer overflow.")
+
+
+def _call_builtin(name, args):
+    if len(args) != 1:
+        raise NotVectorizable(f"{name}() with {len(args)} arguments.")
+    arg, = args
+    if not isinstance(arg, pd.Series):
+        return {'str': str, 'int': int, 'float': float, 'len': len, 'abs': abs}[name](arg)
+    if name == 'str':
+        # Series.astype(str) may keep missing values as NaN, whereas str(nan) is 'nan'.
+        return arg if _is_str_series(arg) else arg.map(str)
+    if name == 'int':
+        return arg.astype('int64')
+    if name == 'float':
+        return arg.astype('float64')
+    if name == 'len':
+        if not _is_str_series(arg):
+            raise NotVectorizable("len() of non-string column.")
+        return arg.str.len()
+    if name == 'abs':
+        return arg.abs()
+    raise NotVectorizable(f"Builtin {name}() is not vectorized.")
+
+
+def _vectorize(node, df):
+    """ Evaluate an expression AST node as whole-column operations. """
+    if isinstance(node, ast.Expression):
+        return _vectorize(node.body, df)
+    if isinstance(node, ast.Constant):
+        return node.value
+    if isinstance(node, ast.Name):
+        if node.id in df.columns:
+            return df[node.id]
+        raise NotVectorizable(f"Name {node.id!r} is not a column.")
+    if isinstance(node, ast.BinOp) and type(node.op) in BINARY_OPERATORS:
+        left, right = _vectorize(node.left, df), _vectorize(node.right, df)
+        if isinstance(node.op, DIVISION_OPERATORS) and np.any(_as_series(right, df) == 0):
+            # Python raises ZeroDivisionError, where numpy would silently produce inf/nan.
+            raise NotVectorizable("Division by zero.")
+        if (isinstance(node.op, OVERFLOW_OPERATORS) and _is_integer(left) and _is_integer(right)
+                and (isinstance(left, pd.Series) or isinstance(right, pd.Series))):
+            # numpy's int64 operations silently wrap around; the float64 result tells if they would.
+            _check_overflow(node.op, left, right)
+        return BINARY_OPERATORS[type(node.op)](left, right)
+    if isinstance(node, ast.UnaryOp) and type(node.op) in UNARY_OPERATORS:
+        return UNARY_OPERATORS[type(node.op)](_vectorize(node.operand, df))
+    if isinstance(node, ast.Compare) and all(type(op) in COMPARISON_OPERATORS for op in node.ops):
+        # Chained comparisons, e.g. `a < b < c`, are evaluated pairwise and combined.
+        operands = [_vectorize(operand, df) for operand in [node.left] + node.comparators]
+        result = None
+        for op, left, right in zip(node.ops, operands[:-1], operands[1:]):
+            comparison = COMPARISON_OPERATORS[type(op)](left, right)
+            result = comparison if result is None else (result & comparison)
+        return result
+    if isinstance(node, ast.Subscript):
+        value = _vectorize(node.value, df)
+        if not _is_str_series(value):
+            raise NotVectorizable("Indexing is only vectorized for string columns.")
+        index = node.slice.value if type(node.slice).__name__ == 'Index' else node.slice  # Python < 3.9
+        if isinstance(index, ast.Slice):
+            start, stop, step = (None if part is None else _vectorize(part, df)
+                                 for part in (index.lower, index.upper, index.step))
+            if any(isinstance(part, pd.Series) for part in (start, stop, step)):
+                raise NotVectorizable("Slicing with column values.")
+            return value.str[start:stop:step]
+        position = _vectorize(index, df)
+        if not isinstance(position, int):
+            raise NotVectorizable("Indexing with non-integer constant.")
+        lengths = value.str.len()
+        if np.any(lengths <= position if position >= 0 else lengths < -position):
+            # Python raises IndexError, where `.str[i]` would silently produce NaN.
+            raise NotVectorizable("String index out of range.")
+        return value.str[position]
+    if isinstance(node, ast.Call) and not node.keywords:
+        args = [_vectorize(arg, df) for arg in node.args]
+        if isinstance(node.func, ast.Name) and node.func.id not in df.columns:
+            return _call_builtin(node.func.id, args)
+        if isinstance(node.func, ast.Attribute) and node.func.attr in STRING_METHODS:
+            value = _vectorize(node.func.value, df)
+            if not _is_str_series(value) or any(isinstance(arg, pd.Series) for arg in args):
+                raise NotVectorizable(f"String method {node.func.attr}() on non-string column.")
+            return getattr(value.str, node.func.attr)(*args)
+    raise NotVectorizable(f"{type(node).__name__} expressions are not vectorized.")
+
+
+def _evaluate_rows(df, code):
+    """ Evaluate a compiled expression for each row, passing only the columns used by the expression. """
+    names = [name for name in df.columns if name in code.co_names]
+    columns = [df[name].tolist() for name in names]
+    if not names:
+        return [eval(code, EVAL_GLOBALS, {}) for _ in range(len(df))]
+    return [eval(code, EVAL_GLOBALS, dict(zip(names, values))) for values in zip(*columns)]
+
+
+def evaluate_rows_block(block, expr):
+    """ Evaluate an expression row-by-row for a block of rows (used by worker processes). """
+    _, code = compile_expression(expr)
+    return _evaluate_rows(block, code)
+
+
+def evaluate_expression(df: pd.DataFrame, expr, config=None, workers=None):
+    """ Evaluate a Python expression for each row of `df`, with the row's values available by column name.
+
+    Args:
+        df: DataFrame.
+        expr: Python expression, e.g. "amount * price_each" or "Pos[0] + str(int(Pos[1:]))".
+        config: App-level config.
+        workers: Number of processes to use for expressions that must be evaluated row-by-row.
+            Defaults to the `workers` config value (see `parallel`).
+
+    Returns:
+        Series or list with one value per row, or a scalar if the expression does not use any columns.
+    """
+    tree, code = compile_expression(expr)
+    try:
+        return _vectorize(tree, df)
+    except Exception as exc:
+        # Row-by-row evaluation defines the semantics, e.g. which errors are raised for invalid values.
+        if config and config.get('verbosity', 0) >= 2:
+            print(f"Evaluating expression {expr!r} row-by-row: {exc}", file=sys.stderr)
+    workers = resolve_workers(workers, config)
+    names = [name for name in df.columns if name in code.co_names]
+    if names and use_parallel(df, workers, config):
+        return map_row_blocks(evaluate_rows_block, df[names], workers, expr=expr)
+    return _evaluate_rows(df, code)
+
+
+def evaluate_format_rows(df, expr):
+    """ Format and evaluate `expr` for each row, compiling each distinct formatted expression only once. """
+    names = list(df.columns)
+    compiled = {}
+    values = []
+    for row_values in zip(*[df[name].tolist() for name in names]):
+        row = dict(zip(names, row_values))
+        formatted = expr.format_map(row)
+        code = compiled.get(formatted)
+        if code is None:
+            code = compiled[formatted] = compile(formatted.strip(), '<create-column>', 'eval')
+        values.append(eval(code, EVAL_GLOBALS, row))
+    return values
+
+
+def evaluate_format_expression(df: pd.DataFrame, expr, config=None, workers=None):
+    """ Format `expr` with each row's values, e.g. "{row}{column:02}", then evaluate the formatted expression.
+
+    The format string is parsed once; if it has no replacement fields, it is evaluated like any other expression.
+    Otherwise each distinct formatted expression is only compiled once.
+    """
+    fields = [field for _, field, _, _ in string.Formatter().parse(expr) if field is not None]
+    if not fields:
+        return evaluate_expression(df, expr.format(), config=config, workers=workers)
+    workers = resolve_workers(workers, config)
+    if len(df.columns) and use_parallel(df, workers, config):
+        return map_row_blocks(evaluate_format_rows, df, workers, expr=expr)
+    return evaluate_format_rows(df, expr)
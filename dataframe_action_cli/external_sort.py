@@ -0,0 +1,235 @@
+# Copyright 2020, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+External merge sort, for sorting tables that are larger than memory with `-sort-by` and `-natsort`.
+
+When streaming (`-stream`), a `-sort-by` (or `-natsort`) in the action chain sorts the input chunk-by-chunk:
+The chunks are collected until they take up half of the memory budget, sorted, and written to a temporary
+Arrow file ("run"). After the last chunk, the runs are merged, reading one batch of rows from each run at a time,
+and the merged rows are passed on to the rest of the chain (e.g. `-write-to` or `-print-csv`) as they are sorted.
+If all chunks fit in the memory budget, they are simply sorted in memory.
+
+The result is the same as sorting the whole table: The runs are sorted by the sort action itself, and the sort is
+stable, with rows of equal sort keys in the order of the input (by run number, then position in the run).
+The merge only compares each run's loaded block of rows with the other runs' last loaded rows (see `_merge_sources`),
+so each row is sorted once when its run is written, and once more when it is merged.
+
+The memory budget is given by the `sort_memory` config value (default 1 GB). External sorting is switched on
+automatically (also without `-stream`) when the size of the input files exceeds the budget. Without `-lazy`,
+the files are then read with the column types of the whole file, which takes an extra pass over each file.
+The runs are written to the `spill_dir` config directory (default: the system's temporary directory).
+
+Examples:
+
+    dataframe-action-cli -read-from huge.csv -sort-by Plate price::desc -write-to sorted.csv
+    dataframe-action-cli -stream -read-from "shards/*.csv" -natsort Pos -print-csv
+
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from .cache import parse_size
+from .file_formats import table_to_frame
+from .schemas import unify_categories
+
+DEFAULT_SORT_MEMORY = "1GB"
+
+# Number of rows per record batch in the run files:
+RUN_BATCH_ROWS = 8192
+
+# Temporary columns with the run number and position of each row in its run, for stable merging:
+RUN_COLUMN = "__sort_run__"
+POSITION_COLUMN = "__sort_position__"
+
+
+class ExternalSort:
+    """ Sort a table chunk-by-chunk, spilling sorted runs to temporary files and merging them (see module docstring).
+
+    Args:
+        sort: Function that sorts a DataFrame stably, e.g. `sort-by` with its arguments and `kind='mergesort'`.
+            Rows with equal sort keys must be kept in order, since the runs are merged by sorting rows from
+            different runs together.
+        limit: Only return the first `limit` rows of the sorted table.
+        memory: Memory budget, e.g. "500MB". Half of it is used for collecting chunks before sorting them.
+        spill_dir: Directory for the temporary run files.
+        verbosity: Print the number of runs and the timings on stderr, if >= 1.
+    """
+
+    def __init__(self, sort, limit=None, memory=DEFAULT_SORT_MEMORY, spill_dir=None, verbosity=0):
+        self.sort = sort
+        self.limit = int(limit) if limit is not None else None
+        self.memory = parse_size(memory)
+        self.spill_dir = spill_dir
+        self.verbosity = verbosity
+        self.chunks = []
+        self.chunks_size = 0
+        self.template = None
+        self.directory = None
+        self.runs = []
+        self.n_rows = 0
+        self.row_size = 0
+        self.timings = {'sort': 0.0, 'spill': 0.0, 'merge': 0.0}
+
+    def add(self, chunk: pd.DataFrame):
+        """ Add a chunk of the table; the collected chunks are sorted and written as a run when the budget is full. """
+        if self.template is None:
+            self.template = chunk.iloc[:0]
+        self.n_rows += len(chunk)
+        self.chunks.append(chunk)
+        self.chunks_size += chunk.memory_usage(deep=True).sum()
+        if self.chunks_size >= self.memory // 2:
+            self._write_run()
+
+    def _sort_chunks(self) -> pd.DataFrame:
+        start = time.perf_counter()
+        table = self.chunks[0] if len(self.chunks) == 1 else pd.concat(unify_categories(self.chunks))
+        self.row_size = max(self.row_size, self.chunks_size / max(len(table), 1))
+        self.chunks, self.chunks_size = [], 0
+        table = self.sort(table)
+        if self.limit is not None:
+            # The first rows of the whole table are among the first rows of the runs:
+            table = table.iloc[:self.limit]
+        self.timings['sort'] += time.perf_counter() - start
+        return table
+
+    def _write_run(self):
+        import pyarrow as pa
+        run = self._sort_chunks()
+        start = time.perf_counter()
+        if self.directory is None:
+            self.directory = tempfile.TemporaryDirectory(prefix="dataframe-action-cli-sort-", dir=self.spill_dir)
+        filename = os.path.join(self.directory.name, f"run-{len(self.runs)}.arrow")
+        table = pa.Table.from_pandas(run, preserve_index=True)
+        with pa.OSFile(filename, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table, max_chunksize=RUN_BATCH_ROWS)
+        self.runs.append(filename)
+        self.timings['spill'] += time.perf_counter() - start
+
+    def result_chunks(self):
+        """ Yield the sorted table, chunk-by-chunk (at least one chunk, if any chunks were added). """
+        if self.template is None:
+            return
+        try:
+            if not self.runs:
+                # Everything fits in the memory budget:
+                yield self._sort_chunks() if self.chunks else self.template
+            else:
+                if self.chunks:
+                    self._write_run()
+                yield from self._merge_runs()
+        finally:
+            if self.directory is not None:
+                self.directory.cleanup()
+                self.directory = None
+        if self.verbosity >= 1:
+            runs = f"{len(self.runs)} sorted runs, spilled to disk" if self.runs else "in memory"
+            timing = ", ".join(f"{step} {seconds:.2f} s" for step, seconds in self.timings.items() if seconds)
+            print(f"External sort: {self.n_rows} rows ({runs}); {timing}.", file=sys.stderr)
+
+    def _merge_runs(self):
+        """ Merge the sorted runs, yielding the merged rows a batch at a time. """
+        import pyarrow as pa
+        sources = [pa.OSFile(filename) for filename in self.runs]
+        try:
+            yield from self._merge_sources([pa.ipc.open_file(source) for source in sources])
+        finally:
+            # Close the run files before the temporary directory is removed:
+            for source in sources:
+                source.close()
+
+    def _count_before(self, loaded, bounds, boundary):
+        """ Return the number of rows in each run's block that are sorted before the boundary row.
+
+        Args:
+            loaded: The loaded rows, in order of run and position.
+            bounds: Dict with the (start, end) positions of each run's block in `loaded`.
+            boundary: The position of the boundary row in `loaded` (of a run not in `bounds`).
+
+        The blocks are sorted, so this is a binary search in each block. The searches are done together:
+        At each step, the middle rows of all blocks are sorted together with the boundary row.
+        """
+        runs = list(bounds)
+        lo = np.array([bounds[run][0] for run in runs])
+        hi = np.array([bounds[run][1] for run in runs])
+        boundary_run = loaded[RUN_COLUMN].iat[boundary]
+        while (lo < hi).any():
+            searching = np.flatnonzero(lo < hi)
+            middle = (lo[searching] + hi[searching]) // 2
+            # In order of run, so the rows with equal sort keys stay in input order:
+            probes = self.sort(loaded.take(np.sort(np.append(middle, boundary))))
+            probe_runs = probes[RUN_COLUMN].to_numpy()
+            before = np.isin(np.array(runs)[searching], probe_runs[:np.flatnonzero(probe_runs == boundary_run)[0]])
+            lo[searching] = np.where(before, middle + 1, lo[searching])
+            hi[searching] = np.where(before, hi[searching], middle)
+        return {run: count - bounds[run][0] for run, count in zip(runs, lo)}
+
+    def _merge_sources(self, readers):
+        """ Merge the sorted runs of the given Arrow file readers.
+
+        A block of rows is loaded from each run at a time. The last loaded row of each run that has more rows
+        on disk bounds what can be merged: Rows sorted after it may still be preceded by rows not loaded yet.
+        At each step, the first of these last loaded rows (the "boundary") is found, the rows up to it are taken
+        from each block (by binary search, since the blocks are sorted), sorted and emitted, and the next block
+        of the boundary's run is loaded. Each row is thus sorted once more, together with the rows emitted with it.
+        """
+        import pyarrow as pa
+        # Rows loaded from each run at a time, so the loaded blocks take up about a quarter of the budget:
+        n_batches = max(int(self.memory // 4 / max(self.row_size, 1) / len(readers) / RUN_BATCH_ROWS), 1)
+        n_loaded = [0] * len(readers)
+        n_rows_loaded = [0] * len(readers)
+
+        def more(run):
+            return n_loaded[run] < readers[run].num_record_batches
+
+        def load(run):
+            frames = []
+            while more(run) and not sum(len(frame) for frame in frames):
+                stop = min(n_loaded[run] + n_batches, readers[run].num_record_batches)
+                batches = [readers[run].get_batch(idx) for idx in range(n_loaded[run], stop)]
+                n_loaded[run] = stop
+                frames.append(table_to_frame(pa.Table.from_batches(batches)))
+            df = pd.concat(frames) if len(frames) > 1 else frames[0]
+            positions = np.arange(n_rows_loaded[run], n_rows_loaded[run] + len(df))
+            n_rows_loaded[run] += len(df)
+            return df.assign(**{RUN_COLUMN: run, POSITION_COLUMN: positions})
+
+        blocks = {run: load(run) for run in range(len(readers)) if more(run)}
+        blocks = {run: block for run, block in blocks.items() if len(block)}
+        if not blocks:
+            yield self.template
+            return
+        n_emitted = 0
+        while blocks and (self.limit is None or n_emitted < self.limit):
+            start = time.perf_counter()
+            # The blocks are kept in order of run, so the loaded rows are in input order:
+            loaded = pd.concat(unify_categories(list(blocks.values())))
+            ends = dict(zip(blocks, np.cumsum([len(block) for block in blocks.values()])))
+            bounds = {run: (end - len(blocks[run]), end) for run, end in ends.items()}
+            open_runs = [run for run in blocks if more(run)]
+            if not open_runs:
+                # All rows are loaded:
+                merged = self.sort(loaded)
+                blocks = {}
+            else:
+                boundary_run = self.sort(loaded.take([ends[run] - 1 for run in open_runs]))[RUN_COLUMN].iat[0]
+                # The boundary is the last loaded row of its run, so the whole block is emitted:
+                counts = self._count_before(
+                    loaded, {run: bound for run, bound in bounds.items() if run != boundary_run},
+                    ends[boundary_run] - 1)
+                counts[boundary_run] = len(blocks[boundary_run])
+                merged = self.sort(loaded.take(np.concatenate(
+                    [np.arange(bounds[run][0], bounds[run][0] + counts[run]) for run in blocks])))
+                blocks = {run: block.iloc[counts[run]:] for run, block in blocks.items()}
+                blocks[boundary_run] = load(boundary_run)
+                blocks = {run: block for run, block in blocks.items() if len(block)}
+            if self.limit is not None:
+                merged = merged.iloc[:self.limit - n_emitted]
+            n_emitted += len(merged)
+            self.timings['merge'] += time.perf_counter() - start
+            yield merged.drop(columns=[RUN_COLUMN, POSITION_COLUMN])
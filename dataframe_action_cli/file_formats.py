@@ -0,0 +1,303 @@
+# Copyright 2020, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Binary table file formats: Arrow IPC (streams and Feather files) and Parquet.
+
+Binary formats preserve column types, and avoid formatting and re-parsing csv text,
+e.g. when piping tables between `dataframe-action-cli` processes:
+
+    dataframe-action-cli -read-from big.csv -select-where name eq Peter -print format=arrow \
+        | dataframe-action-cli -read-from - -sort-by age -print-csv
+
+The format is inferred from the file extension, or from the first bytes of stdin (`-`),
+and can be given explicitly with `format=<csv|arrow|feather|parquet>`.
+
+Output printed to stdout as `arrow` is written as an Arrow IPC stream, which can be read
+batch-by-batch as it arrives. In `-stream` mode, each output file (or stdout) is kept open while the chunks
+are written to it, as parts of a single stream or file, and is closed after the last chunk
+(see `TableFileWriter`). Consecutive IPC streams, e.g. from separate processes, are read one after the other.
+
+Reading and writing binary formats requires the `pyarrow` package.
+
+"""
+
+import os
+import sys
+
+import pandas as pd
+
+STDIO_FILENAME = "-"
+
+FORMAT_EXTENSIONS = {
+    '.feather': 'feather',
+    '.fea': 'feather',
+    # Arrow IPC files are the same as Feather (version 2) files:
+    '.arrow': 'feather',
+    '.arrows': 'arrow',
+    '.ipc': 'arrow',
+    '.parquet': 'parquet',
+    '.pq': 'parquet',
+}
+BINARY_FORMATS = ('arrow', 'feather', 'parquet')
+
+# Magic bytes at the start of binary files/streams:
+ARROW_FILE_MAGIC = b"ARROW1"
+ARROW_STREAM_MAGIC = b"\xff\xff\xff\xff"
+PARQUET_MAGIC = b"PAR1"
+
+
+def detect_format(filename, format=None):
+    """ Return the table format ('csv', 'arrow', 'feather' or 'parquet') for a filename.
+
+    Examples:
+        >>> detect_format("data.parquet")
+        'parquet'
+        >>> detect_format("data.csv.gz")
+        'csv'
+        >>> detect_format("data.txt", format="Feather")
+        'feather'
+    """
+    if format:
+        format = format.lower()
+        if format not in ('csv',) + BINARY_FORMATS:
+            raise ValueError(f"Unsupported table format {format!r}.")
+        return format
+    if filename == STDIO_FILENAME:
+        return detect_stdin_format()
+    return FORMAT_EXTENSIONS.get(os.path.splitext(filename)[1].lower(), 'csv')
+
+
+def output_format(filename, format=None):
+    """ Return the table format to write to a filename; stdout (`-`) defaults to csv. """
+    if format or filename != STDIO_FILENAME:
+        return detect_format(filename, format)
+    return 'csv'
+
+
+def detect_stdin_format():
+    """ Detect the format of data on stdin, by peeking at the first bytes (without consuming them). """
+    head = sys.stdin.buffer.peek(len(ARROW_FILE_MAGIC))[:len(ARROW_FILE_MAGIC)]
+    if head.startswith(ARROW_STREAM_MAGIC):
+        return 'arrow'
+    if head.startswith(ARROW_FILE_MAGIC):
+        return 'feather'
+    if head.startswith(PARQUET_MAGIC):
+        return 'parquet'
+    return 'csv'
+
+
+def input_source(filename):
+    """ Return a file path, or the binary stdin file object for `-`. """
+    if filename != STDIO_FILENAME:
+        return filename
+    return sys.stdin.buffer
+
+
+def _select_columns(names, usecols):
+    if usecols is None:
+        return None
+    return [col for col in names if (usecols(col) if callable(usecols) else col in usecols)]
+
+
+def _iter_arrow_batches(filename, format, usecols=None, batch_size=None):
+    """ Yield pyarrow RecordBatches from an Arrow IPC stream, IPC (Feather) file or Parquet file. """
+    import pyarrow as pa
+    source = input_source(filename)
+    if format == 'parquet':
+        import pyarrow.parquet as pq
+        if not isinstance(source, str):
+            # Parquet needs random access, i.e. we must read all of stdin first.
+            source = pa.BufferReader(source.read())
+        parquet_file = pq.ParquetFile(source)
+        columns = _select_columns(parquet_file.schema_arrow.names, usecols)
+        yield from parquet_file.iter_batches(batch_size=batch_size or 65536, columns=columns)
+        return
+    if format == 'feather':
+        if isinstance(source, str):
+            reader = pa.ipc.open_file(pa.memory_map(source))
+        else:
+            reader = pa.ipc.open_file(pa.BufferReader(source.read()))
+        columns = _select_columns(reader.schema.names, usecols)
+        for idx in range(reader.num_record_batches):
+            batch = reader.get_batch(idx)
+            yield batch.select(columns) if columns is not None else batch
+        return
+    # Arrow IPC stream; there may be several consecutive streams, e.g. from `-stream` mode output.
+    stream = pa.OSFile(source) if isinstance(source, str) else pa.PythonFile(source, mode='r')
+    while True:
+        try:
+            reader = pa.ipc.open_stream(stream)
+        except (pa.ArrowInvalid, StopIteration):
+            # No more streams.
+            return
+        columns = _select_columns(reader.schema.names, usecols)
+        for batch in reader:
+            yield batch.select(columns) if columns is not None else batch
+
+
+def _convert_columns(df, dtype=None, parse_dates=None):
+    """ Convert columns to the types given by `dtype` and `parse_dates` (as for `pd.read_csv`), if present. """
+    dtype = {column: val for column, val in (dtype or {}).items() if column in df.columns}
+    if dtype:
+        df = df.astype(dtype)
+    for column in parse_dates or []:
+        if column in df.columns:
+            df[column] = pd.to_datetime(df[column])
+    return df
+
+
+def table_to_frame(table, dtype=None, parse_dates=None):
+    """ Convert a pyarrow Table to a DataFrame, releasing the table's memory column by column while converting.
+
+    The table must not be used afterwards.
+    """
+    # `split_blocks` avoids consolidating columns of the same type into one (copied) block:
+    df = table.to_pandas(split_blocks=True, self_destruct=True)
+    return _convert_columns(df, dtype, parse_dates)
+
+
+def read_batches(batches, nrows=None, schema=None):
+    """ Collect RecordBatches into a pyarrow Table, optionally only the first `nrows` rows. """
+    import pyarrow as pa
+    collected, n_rows = [], 0
+    for batch in batches:
+        collected.append(batch)
+        n_rows += batch.num_rows
+        if nrows is not None and n_rows >= nrows:
+            # Stop reading as soon as we have enough rows.
+            break
+    if not collected and schema is None:
+        return None
+    table = pa.Table.from_batches(collected, schema=schema)
+    del collected
+    return table.slice(0, nrows) if nrows is not None else table
+
+
+def iter_batch_chunks(batches, chunksize, nrows=None, dtype=None, parse_dates=None):
+    """ Re-chunk RecordBatches into DataFrames of `chunksize` rows, with a continuous index. """
+    import pyarrow as pa
+    offset = 0
+    pending, n_pending = [], 0
+    for batch in batches:
+        if nrows is not None:
+            if offset + n_pending >= nrows:
+                break
+            batch = batch.slice(0, nrows - offset - n_pending)
+        pending.append(batch)
+        n_pending += batch.num_rows
+        if n_pending >= chunksize:
+            table = pa.Table.from_batches(pending)
+            for start in range(0, table.num_rows - chunksize + 1, chunksize):
+                chunk = _convert_columns(table.slice(start, chunksize).to_pandas(), dtype, parse_dates)
+                chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+                offset += len(chunk)
+                yield chunk
+            remainder = table.slice(table.num_rows - table.num_rows % chunksize)
+            pending, n_pending = remainder.to_batches(), remainder.num_rows
+    if n_pending:
+        chunk = _convert_columns(pa.Table.from_batches(pending).to_pandas(), dtype, parse_dates)
+        chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+        yield chunk
+
+
+def read_table_file(filename, format, usecols=None, nrows=None, dtype=None, parse_dates=None):
+    """ Read a binary table file (or stdin, `-`) into a DataFrame, optionally only the first `nrows` rows.
+
+    Columns are converted to the types given by `dtype` and `parse_dates` (e.g. from a schema), if any.
+    """
+    table = read_batches(_iter_arrow_batches(filename, format, usecols=usecols), nrows=nrows)
+    if table is None:
+        return pd.DataFrame()
+    return table_to_frame(table, dtype, parse_dates)
+
+
+def iter_table_file_chunks(filename, format, chunksize, usecols=None, nrows=None, dtype=None, parse_dates=None):
+    """ Read a binary table file chunk-by-chunk, yielding DataFrames with a continuous index. """
+    batches = _iter_arrow_batches(filename, format, usecols=usecols, batch_size=chunksize)
+    yield from iter_batch_chunks(batches, chunksize, nrows=nrows, dtype=dtype, parse_dates=parse_dates)
+
+
+class TableFileWriter:
+    """ Write a table to a binary table file (or to stdout as an Arrow IPC stream) in parts, e.g. chunk-by-chunk.
+
+    The file is created when the first part is written, with the schema of the first part;
+    the following parts are converted to that schema. The file is complete when the writer is closed.
+    """
+
+    def __init__(self, filename, format, index=False):
+        if filename == STDIO_FILENAME and format != 'arrow':
+            raise ValueError(f"Only the 'arrow' (IPC stream) binary format can be written to stdout, not {format!r}.")
+        self.filename = filename
+        self.format = format
+        self.index = index
+        self.schema = None
+        self.sink = None
+        self.writer = None
+
+    def _open(self):
+        import pyarrow as pa
+        if self.filename == STDIO_FILENAME:
+            sys.stdout.flush()
+            self.writer = pa.ipc.new_stream(sys.stdout.buffer, self.schema)
+        elif self.format == 'parquet':
+            import pyarrow.parquet as pq
+            self.writer = pq.ParquetWriter(self.filename, self.schema)
+        else:
+            self.sink = pa.OSFile(self.filename, 'wb')
+            if self.format == 'feather':
+                # Feather (version 2) files are Arrow IPC files, compressed like `feather.write_feather` does:
+                compression = 'lz4' if pa.Codec.is_available('lz4') else None
+                self.writer = pa.ipc.new_file(self.sink, self.schema,
+                                              options=pa.ipc.IpcWriteOptions(compression=compression))
+            else:
+                self.writer = pa.ipc.new_stream(self.sink, self.schema)
+
+    def write(self, df):
+        import pyarrow as pa
+        table = pa.Table.from_pandas(df, schema=self.schema, preserve_index=self.index)
+        if self.writer is None:
+            self.schema = table.schema
+            self._open()
+        self.writer.write_table(table)
+        if self.filename == STDIO_FILENAME:
+            # So the receiving process gets each part right away:
+            sys.stdout.buffer.flush()
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+        if self.sink is not None:
+            self.sink.close()
+            self.sink = None
+        if self.filename == STDIO_FILENAME:
+            sys.stdout.buffer.flush()
+
+
+def write_table_file(df, filename, format, index=False, append=False, writers=None):
+    """ Write a DataFrame to a binary table file, or to stdout (`-`) as an Arrow IPC stream.
+
+    Args:
+        df: DataFrame.
+        filename: The file to write to, or "-" for stdout.
+        format: 'arrow', 'feather' or 'parquet'.
+        index: Whether to write the row index.
+        append: Write the table as the next part of a file that is still open in `writers`.
+        writers: Dict of open `TableFileWriter`s by filename, which are kept open for appending
+            (e.g. in `-stream` mode, where they are closed after the last chunk).
+            If None, the file is written and closed right away.
+    """
+    writer = writers.get(filename) if append and writers is not None else None
+    if writer is None:
+        # Consecutive IPC streams on stdout are read one after the other, so they can always be appended:
+        if append and filename != STDIO_FILENAME:
+            raise ValueError(f"Cannot append to {format!r} file {filename!r}; "
+                             f"appending is only supported for csv files.")
+        writer = TableFileWriter(filename, format, index=index)
+        if writers is not None:
+            if filename in writers:
+                writers.pop(filename).close()
+            writers[filename] = writer
+    writer.write(df)
+    if writers is None:
+        writer.close()
@@ -1,27 +1,27 @@
 # Copyright 2019, Rasmus Sorensen <rasmusscholer@gmail.com>
 """
 
+Help actions print usage information.
 
-"""
-
-from actionista import binary_operators
+Help is printed from the actions' docstrings, as read by the action registry,
+so printing help does not import pandas or the action modules.
 
-
-NEWLINE = '\n'
+"""
 
 
-def print_help(tasks, cmd=None, *, verbose=0):
+def print_help(cmd=None, *args, config=None, **kwargs):
     """ Print help messages. Use `-help <action>` to get help on a particular action. """
     # import re
     # print(repr(action_cli.__doc__))  # Nope, escapes proper line breaks.
     # print(re.escape(action_cli.__doc__))  # Nope, escapes whitespace.
+    from .cli import action_cli, ACTION_COLLECTIONS
     if cmd is None:
         print(action_cli.__doc__)  # Works, if you are using r""" for your docstrings (which you probably should).
         print("    Complete list of available actions:")
         print("    -------------------------------------\n")
         print("\n".join(
-            f"      -{action:20} {(func.__doc__ or '').split(NEWLINE, 1)[0]}"
-            for action, func in list(ACTIONS.items())))
+            f"      -{action:20} {collection.summary(action)}"
+            for collection in ACTION_COLLECTIONS.values() for action in collection))
         print("\n")
     elif cmd == "operators":
         print("""
@@ -33,6 +33,7 @@ For example: "1 eq 2" returns False ("no match"), while "2 eq 2" returns True ("
 
 Tasks where the two operands compare to true are included/kept in the list, while non-matching items are discarted.
 """)
+        from actionista import binary_operators
         print("\nAvailable operators include:")
         print(", ".join(sorted(op for op in dir(binary_operators) if not op.startswith('_'))))
         print("""
@@ -45,11 +46,13 @@ argument to convert input values to e.g. integers.
 """)
         print(binary_operators.__doc__)
     else:
-        if cmd not in ACTIONS:
+        cmd = cmd.lstrip('-')
+        collection = next((collection for collection in ACTION_COLLECTIONS.values() if cmd in collection), None)
+        if collection is None:
             print(f"\nERROR: {cmd!r} command not recognized.\n")
-            return print_help(tasks)
+            return print_help(config=config)
         else:
-            print(ACTIONS[cmd].__doc__)
+            print(collection.docstring(cmd))
 
 
 ACTIONS = {
@@ -0,0 +1,298 @@
+# Copyright 2020, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Incremental mode, for append-only input files, e.g. instrument logs that grow over time.
+
+    dataframe-action-cli -incremental -read-from log.csv -select-where status eq error \
+        -create-column duration "end - start" -write-to errors.csv
+
+The first run processes the whole file, and saves a state file next to the output (`errors.csv.incremental.json`),
+recording how many bytes of the input have been processed, and checksums of the start of the file
+and of the data just before that offset. Later runs only parse the lines appended since the last run,
+run the actions on those rows, and append the result to the output file.
+
+The action chain must read a single csv file, followed by row-local actions (`select-where`, `select-query`,
+`select-columns`, `create-column`), optionally a `sort-by`, and end by writing to a csv file.
+With a `sort-by`, the sorted new rows are merged into the (already sorted) output,
+instead of sorting all rows again; the merged output is the same as when sorting all rows.
+
+The whole chain is recomputed if the input file no longer starts with the processed data
+(e.g. if it was rotated, truncated or rewritten), or if the action chain, the output file or the
+state file has changed. Only the start of the file and the data just before the recorded offset
+are checked, not every byte. New rows are parsed with the same column types as the first run.
+An incomplete last line (still being written) is left for the next run.
+
+"""
+
+import hashlib
+import io
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from .cli import run_action_chain
+from .dataframe_actions import ACTIONS, expand_filenames, read_file, write_csv, sort_by, select_where
+from .file_formats import STDIO_FILENAME, detect_format, output_format
+from .input_type_conversion import ensure_input_type
+from .schemas import apply_schema, unify_categories
+from .streaming import ROW_LOCAL_ACTIONS, IN_MEMORY_READ_KWARGS
+from .readers import ENGINE_READ_KWARGS
+
+STATE_VERSION = 1
+STATE_SUFFIX = ".incremental.json"
+
+# Size of the blocks at the start of the file and before the processed offset, which are checksummed:
+CHECKSUM_BLOCK_SIZE = 64 * 1024
+
+# `read_file` arguments that are not passed on to `pd.read_csv` (new rows are always parsed by pandas):
+READ_FILE_KWARGS = IN_MEMORY_READ_KWARGS + ENGINE_READ_KWARGS + ('where', 'chunksize', 'format')
+
+
+def split_incremental_chain(action_groups):
+    """ Split an action chain into (read, row-local actions, sort or None, write).
+
+    Raises:
+        ValueError, if the action chain cannot be run incrementally.
+    """
+    if len(action_groups) < 2:
+        raise ValueError("Incremental mode requires an action chain from `-read-from` to `-write-to`.")
+    read, *actions, write = action_groups
+    sort = None
+    if actions and ACTIONS.get(actions[-1][0]) is sort_by:
+        sort = actions.pop()
+        if sort[2].get('limit') is not None:
+            raise ValueError("Incremental mode does not support `-sort-by` with a limit.")
+        if _writes_index(write):
+            raise ValueError("Incremental mode with `-sort-by` does not support writing the index.")
+    if ACTIONS.get(read[0]) is not read_file:
+        raise ValueError("Incremental mode requires the action chain to start with `-read-from`.")
+    filenames = expand_filenames(read[1])
+    if (len(filenames) != 1 or filenames[0] == STDIO_FILENAME
+            or detect_format(filenames[0], read[2].get('format')) != 'csv'):
+        raise ValueError("Incremental mode requires reading a single csv file (not stdin).")
+    if {'nrows', 'chunksize'} & set(read[2]):
+        raise ValueError("Incremental mode does not support `nrows` or `chunksize` when reading.")
+    not_row_local = [action_key for action_key, _, _ in actions if ACTIONS.get(action_key) not in ROW_LOCAL_ACTIONS]
+    if not_row_local:
+        raise ValueError(f"Incremental mode only supports row-local actions (and a final `-sort-by`), "
+                         f"not {', '.join(f'-{key}' for key in not_row_local)}.")
+    if (ACTIONS.get(write[0]) is not write_csv or not write[1] or write[1][0] == STDIO_FILENAME
+            or output_format(write[1][0], write[2].get('format')) != 'csv'):
+        raise ValueError("Incremental mode requires the action chain to end by writing to a csv file.")
+    return (read[0], filenames, read[2]), actions, sort, write
+
+
+def _writes_index(write):
+    _, write_args, write_kwargs = write
+    return ensure_input_type(write_kwargs.get('index', False), bool, varname='index', args=write_args[1:])
+
+
+def _checksums(filename, offset):
+    """ Checksums of the start of the file, and of the data just before `offset`. """
+    with open(filename, 'rb') as fp:
+        head = fp.read(min(offset, CHECKSUM_BLOCK_SIZE))
+        fp.seek(max(0, offset - CHECKSUM_BLOCK_SIZE))
+        tail = fp.read(offset - fp.tell())
+    return hashlib.sha1(head).hexdigest(), hashlib.sha1(tail).hexdigest()
+
+
+def _complete_lines_end(filename, size):
+    """ Return the offset just after the last line break in the file (0 if there is none). """
+    with open(filename, 'rb') as fp:
+        end = size
+        while end > 0:
+            start = max(0, end - CHECKSUM_BLOCK_SIZE)
+            fp.seek(start)
+            pos = fp.read(end - start).rfind(b"\n")
+            if pos >= 0:
+                return start + pos + 1
+            end = start
+    return 0
+
+
+def _read_csv_range(filename, start, end, sep=",", **kwargs):
+    """ Parse the header line and the lines between byte offsets `start` and `end` of a csv file. """
+    with open(filename, 'rb') as fp:
+        header = fp.readline()
+        fp.seek(max(start, fp.tell()))
+        data = fp.read(max(0, end - fp.tell()))
+    return pd.read_csv(io.BytesIO(header + data), sep=sep, **kwargs)
+
+
+def _chain_signature(action_groups):
+    return hashlib.sha1(repr([(key, [str(arg) for arg in args], sorted((k, str(v)) for k, v in kwargs.items()))
+                              for key, args, kwargs in action_groups]).encode()).hexdigest()
+
+
+def _file_signature(filename):
+    stat = os.stat(filename)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def _read_kwargs(dtypes):
+    """ `read_csv` options to parse columns with the given (saved) dtypes. """
+    parse_dates = [column for column, dtype in dtypes.items() if dtype.startswith('datetime64')]
+    kwargs = {'dtype': {column: dtype for column, dtype in dtypes.items() if column not in parse_dates}}
+    if parse_dates:
+        kwargs['parse_dates'] = parse_dates
+    return kwargs
+
+
+def _dtypes(df):
+    return {str(column): str(dtype) for column, dtype in df.dtypes.items()}
+
+
+def load_state(state_fn):
+    try:
+        with open(state_fn) as fp:
+            return json.load(fp)
+    except (OSError, ValueError):
+        return None
+
+
+def save_state(state_fn, state):
+    with open(state_fn + ".tmp", 'w') as fp:
+        json.dump(state, fp, indent=1)
+    os.replace(state_fn + ".tmp", state_fn)
+
+
+def check_state(state, input_fn, output_fn, signature):
+    """ Return the reason the state cannot be used for an incremental run, or None if it can. """
+    if state is None:
+        return "no previous state"
+    if state.get('version') != STATE_VERSION or state.get('chain') != signature:
+        return "the action chain has changed"
+    if state.get('input') != os.path.abspath(input_fn):
+        return "the input file has changed"
+    if not os.path.isfile(output_fn) or _file_signature(output_fn) != state.get('output_signature'):
+        return "the output file has been modified"
+    if os.path.getsize(input_fn) < state['offset']:
+        return "the input file is shorter than before"
+    if list(_checksums(input_fn, state['offset'])) != state.get('checksums'):
+        return "the processed part of the input file has changed"
+    return None
+
+
+def _search_range(values, isna, lo, hi, value, ascending, na_position):
+    """ Return the range [lo, hi) of rows within sorted `values[lo:hi]` that sort equal to `value`. """
+    n_na = int(isna[lo:hi].sum())
+    if na_position == 'last':
+        data_lo, data_hi = lo, hi - n_na
+    else:
+        data_lo, data_hi = lo + n_na, hi
+    if pd.isna(value):
+        return (data_hi, hi) if na_position == 'last' else (lo, data_lo)
+    sub = values[data_lo:data_hi]
+    if ascending:
+        return data_lo + np.searchsorted(sub, value, 'left'), data_lo + np.searchsorted(sub, value, 'right')
+    reverse = sub[::-1]
+    return (data_hi - np.searchsorted(reverse, value, 'right'), data_hi - np.searchsorted(reverse, value, 'left'))
+
+
+def merge_sorted(old, new, columns, ascending, na_position='last'):
+    """ Merge sorted new rows into a sorted table, keeping old rows before new rows with the same sort keys.
+
+    The result is the same as a stable sort of the concatenated tables, but only needs a binary search
+    (per sort column) for each new row.
+    """
+    old_values = [old[column].to_numpy() for column in columns]
+    old_isna = [old[column].isna().to_numpy() for column in columns]
+    positions = np.empty(len(new), dtype=np.int64)
+    new_values = [new[column].to_numpy() for column in columns]
+    for idx in range(len(new)):
+        lo, hi = 0, len(old)
+        for values, isna, new_col, asc in zip(old_values, old_isna, new_values, ascending):
+            lo, hi = _search_range(values, isna, lo, hi, new_col[idx], asc, na_position)
+        # After any old rows with the same keys:
+        positions[idx] = hi
+    is_new = np.zeros(len(old) + len(new), dtype=bool)
+    is_new[positions + np.arange(len(new))] = True
+    order = np.empty(len(old) + len(new), dtype=np.int64)
+    order[~is_new] = np.arange(len(old))
+    order[is_new] = len(old) + np.arange(len(new))
+    return pd.concat(unify_categories([old, new])).take(order)
+
+
+def _process(input_fn, start, end, read_kwargs, where, actions, config, dtypes=None, first_row=0):
+    """ Parse the lines between `start` and `end` and run the row-local actions on them. """
+    read_kwargs = apply_schema(input_fn, read_kwargs, config)
+    sep = read_kwargs.pop('sep', ",")
+    if dtypes is not None:
+        saved = _read_kwargs(dtypes)
+        read_kwargs = dict(read_kwargs, dtype=dict(saved['dtype'], **(read_kwargs.get('dtype') or {})))
+        if saved.get('parse_dates') and 'parse_dates' not in read_kwargs:
+            read_kwargs['parse_dates'] = saved['parse_dates']
+    df = _read_csv_range(input_fn, start, end, sep=sep, **read_kwargs)
+    df.index = pd.RangeIndex(first_row, first_row + len(df))
+    n_rows, input_dtypes = len(df), _dtypes(df)
+    for where_args, where_kwargs in where or []:
+        df = select_where(df, *where_args, **where_kwargs, config=config)
+    if actions:
+        df = run_action_chain(actions, config=config, dataframe=df)
+    return df, n_rows, input_dtypes
+
+
+def run_incremental(action_groups, config, state_fn=None):
+    """ Run an action chain incrementally, only processing the rows appended to the input since the last run.
+
+    Args:
+        action_groups: List of (action_key, action_args, action_kwargs) tuples.
+        config: App-level config.
+        state_fn: State file. Defaults to `<output file>.incremental.json`.
+    """
+    (_, (input_fn,), read_kwargs), actions, sort, write = split_incremental_chain(action_groups)
+    output_fn = write[1][0]
+    state_fn = state_fn or output_fn + STATE_SUFFIX
+    verbosity = config.get('verbosity', 0)
+    where = read_kwargs.get('where')
+    csv_kwargs = {key: val for key, val in read_kwargs.items() if key not in READ_FILE_KWARGS}
+    signature = _chain_signature(action_groups)
+    state = load_state(state_fn)
+    end = _complete_lines_end(input_fn, os.path.getsize(input_fn))
+
+    reason = check_state(state, input_fn, output_fn, signature)
+    if reason is None and end <= state['offset']:
+        if verbosity >= 1:
+            print(f"Incremental: No new rows in {input_fn!r}.", file=sys.stderr)
+        return
+    if reason is None:
+        try:
+            new, n_new, _ = _process(input_fn, state['offset'], end, csv_kwargs, where, actions, config,
+                                     dtypes=state['input_dtypes'], first_row=state['n_rows'])
+        except ValueError as exc:
+            # E.g. new values that cannot be parsed with the column types of the first run.
+            reason = f"the new rows could not be parsed as before ({exc})"
+    if reason is None:
+        if sort is not None:
+            if len(new):
+                new = run_action_chain([sort], config=config, dataframe=new)
+                old = pd.read_csv(output_fn, **_read_kwargs(state['output_dtypes']))
+                columns, ascending = zip(*[(column.split("::")[0], '::des' not in column) for column in sort[1]])
+                result = merge_sorted(old, new, columns, ascending, na_position=sort[2].get('na_position', 'last'))
+                # Keep the extension, so the same format and compression are used:
+                tmp_fn = os.path.join(os.path.dirname(output_fn), ".tmp-" + os.path.basename(output_fn))
+                run_action_chain([(write[0], [tmp_fn] + list(write[1][1:]), write[2])], config=config,
+                                 dataframe=result)
+                os.replace(tmp_fn, output_fn)
+        else:
+            run_action_chain([(write[0], write[1], dict(write[2], append=True))], config=config, dataframe=new)
+        if verbosity >= 1:
+            print(f"Incremental: Processed {n_new} new rows of {input_fn!r}, "
+                  f"{'merged' if sort is not None else 'appended'} {len(new)} rows to {output_fn!r}.",
+                  file=sys.stderr)
+        state = dict(state, offset=end, n_rows=state['n_rows'] + n_new)
+    else:
+        if verbosity >= 1:
+            print(f"Incremental: Processing all of {input_fn!r}, since {reason}.", file=sys.stderr)
+        df, n_rows, input_dtypes = _process(input_fn, 0, end, csv_kwargs, where, actions, config)
+        if sort is not None:
+            df = run_action_chain([sort], config=config, dataframe=df)
+        run_action_chain([write], config=config, dataframe=df)
+        state = {'version': STATE_VERSION, 'chain': signature, 'input': os.path.abspath(input_fn),
+                 'offset': end, 'n_rows': n_rows, 'input_dtypes': input_dtypes, 'output_dtypes': _dtypes(df)}
+    state['checksums'] = list(_checksums(input_fn, end))
+    state['output_signature'] = _file_signature(output_fn)
+    save_state(state_fn, state)
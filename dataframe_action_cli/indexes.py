@@ -0,0 +1,356 @@
+# Copyright 2020, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Persistent sidecar indexes of csv files, for fast `select-where` lookups.
+
+An index for a column of a csv file is built with:
+
+    dataframe-action-cli -build-index big.csv sample_id
+
+which saves the index in a sidecar directory next to the file, `big.csv.idx/`.
+The index consists of the column's (non-missing) values, sorted, with the row number and byte offset
+of each row in the csv file, saved as numpy `.npy` files that are memory-mapped when used,
+and a small json file with the file's size and modification time and the column types.
+
+When reading a file with `select-where` predicates on an indexed column (pushed into the read,
+e.g. by `-lazy`, or automatically for `select-where` actions directly following `read-from`),
+the matching rows are found by binary search in the sorted keys, and only those rows are read and parsed:
+
+    dataframe-action-cli -read-from big.csv -select-where sample_id eq 1234 -print-csv
+    dataframe-action-cli -read-from big.csv -select-where sample_id in 12,34,56 -print-csv
+    dataframe-action-cli -read-from big.csv -select-where sample_id ge 1000 -select-where sample_id lt 1100 -print-csv
+
+The operators `eq`, `in` (with a comma-separated list of values), `lt`, `le`, `gt` and `ge` can use the index.
+
+The byte offset of every line is also saved, so row ranges following `read-from`
+(e.g. `-select-rows-between 5000000 5000999`) are read by seeking directly to the first row:
+
+    dataframe-action-cli -read-from big.csv -select-rows-between 5000000 5000999 -print-csv
+
+The rows are parsed with the column types of the whole file, so the result is the same as when
+reading and filtering the whole file.
+An index is ignored (and the file is read as usual) if the file's size or modification time has changed
+since the index was built, or if the lookup would select a large part of the file anyway.
+
+Files with quoted line breaks in values cannot be indexed.
+
+"""
+
+import io
+import json
+import os
+import sys
+import urllib.parse
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_integer_dtype, is_float_dtype, is_string_dtype, is_object_dtype
+
+INDEX_VERSION = 1
+INDEX_DIRECTORY_SUFFIX = ".idx"
+
+# Operators that can be answered from the sorted keys:
+INDEXED_OPERATORS = {
+    'eq': 'eq', 'equal': 'eq', 'equals': 'eq',
+    'lt': 'lt', 'lessthan': 'lt',
+    'le': 'le', 'lessthanorequal': 'le',
+    'gt': 'gt', 'greaterthan': 'gt',
+    'ge': 'ge', 'greaterthanorequal': 'ge',
+    'in': 'in',
+}
+
+# Read options that are compatible with reading individual rows by byte offset:
+INDEXED_READ_KWARGS = ('usecols', 'dtype', 'parse_dates', 'nrows')
+
+# Above this fraction of rows, reading the whole file is faster than seeking to each matching row:
+MAX_INDEXED_FRACTION = 0.25
+
+# Block size used when scanning the file for line breaks:
+SCAN_BLOCK_SIZE = 64 * 1024**2
+
+# Byte offsets of all lines; "@" is always quoted in column index names, so this cannot clash with a column:
+LINE_OFFSETS_NAME = "@lines.offsets.npy"
+
+
+def index_directory(filename):
+    return filename + INDEX_DIRECTORY_SUFFIX
+
+
+def _index_path(filename, column, suffix):
+    return os.path.join(index_directory(filename), urllib.parse.quote(column, safe='') + suffix)
+
+
+def _line_offsets_path(filename):
+    return os.path.join(index_directory(filename), LINE_OFFSETS_NAME)
+
+
+def _file_signature(filename):
+    stat = os.stat(filename)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def _line_offsets(filename):
+    """ Return the byte offset of the start of every line in a file. """
+    offsets, pos = [np.zeros(1, dtype=np.int64)], 0
+    with open(filename, 'rb') as fp:
+        while True:
+            block = fp.read(SCAN_BLOCK_SIZE)
+            if not block:
+                break
+            offsets.append(np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == ord("\n")) + (pos + 1))
+            pos += len(block)
+    offsets = np.concatenate(offsets)
+    if offsets[-1] == pos:
+        # The last line ends with a line break.
+        offsets = offsets[:-1]
+    return offsets
+
+
+def _key_kind(dtype):
+    if is_integer_dtype(dtype):
+        return 'int'
+    if is_float_dtype(dtype):
+        return 'float'
+    if is_string_dtype(dtype) or is_object_dtype(dtype):
+        return 'str'
+    raise ValueError(f"Cannot index columns of type {dtype}; only integer, float and string columns are supported.")
+
+
+def build_index(filename, column, sep=",", verbosity=1):
+    """ Build a sidecar index for a column of a csv file, see module docstring.
+
+    Returns:
+        Path of the index metadata (json) file.
+    """
+    signature = _file_signature(filename)
+    df = pd.read_csv(filename, sep=sep)
+    if column not in df.columns:
+        raise KeyError(f"Column {column!r} not found in {filename!r}.")
+    offsets = _line_offsets(filename)
+    if len(offsets) != len(df) + 1:
+        raise ValueError(f"Cannot index {filename!r}: The number of lines does not match the number of rows, "
+                         f"e.g. because of quoted line breaks or blank lines.")
+    kind = _key_kind(df[column].dtype)
+    notna = df[column].notna().to_numpy()
+    rows = np.flatnonzero(notna)
+    keys = df[column].to_numpy()[notna]
+    keys = keys.astype(str) if kind == 'str' else keys.astype(np.int64 if kind == 'int' else np.float64)
+    order = np.argsort(keys, kind='stable')
+    if _file_signature(filename) != signature:
+        raise RuntimeError(f"{filename!r} was modified while building the index.")
+
+    os.makedirs(index_directory(filename), exist_ok=True)
+    np.save(_line_offsets_path(filename), offsets)
+    np.save(_index_path(filename, column, ".keys.npy"), keys[order])
+    np.save(_index_path(filename, column, ".rows.npy"), rows[order].astype(np.int64))
+    # Data row N is on line N+1, after the header:
+    np.save(_index_path(filename, column, ".offsets.npy"), offsets[rows[order] + 1])
+    meta = dict(signature, version=INDEX_VERSION, column=column, sep=sep, n_rows=len(df), kind=kind,
+                dtypes={str(name): str(dtype) for name, dtype in df.dtypes.items()})
+    meta_path = _index_path(filename, column, ".json")
+    # The metadata is written last (atomically), so a partially written index is never used:
+    with open(meta_path + ".tmp", 'w') as fp:
+        json.dump(meta, fp)
+    os.replace(meta_path + ".tmp", meta_path)
+    if verbosity >= 1:
+        print(f"Indexed column {column!r} of {filename!r}: {len(keys)} keys ({len(df) - len(keys)} missing).",
+              file=sys.stderr)
+    return meta_path
+
+
+def load_index_meta(filename, column, sep=",", verbosity=0):
+    """ Return the metadata of a valid index for a column of a file, or None if there is no up-to-date index. """
+    meta_path = _index_path(filename, column, ".json")
+    try:
+        with open(meta_path) as fp:
+            meta = json.load(fp)
+        signature = _file_signature(filename)
+    except (OSError, ValueError):
+        return None
+    if meta.get('version') != INDEX_VERSION or meta.get('column') != column or meta.get('sep') != sep:
+        return None
+    if {key: meta.get(key) for key in signature} != signature:
+        if verbosity >= 1:
+            print(f"Ignoring outdated index {meta_path!r}; {filename!r} has been modified since it was built.",
+                  file=sys.stderr)
+        return None
+    return meta
+
+
+def _lookup_value(value, kind):
+    if kind == 'str':
+        return value
+    try:
+        return int(value) if kind == 'int' else float(value)
+    except ValueError:
+        # E.g. comparing an int column with "1.5".
+        return float(value)
+
+
+def _predicate(where_args, where_kwargs):
+    """ Return (column, operator, value) for a `select-where` predicate that may use an index, or None. """
+    if len(where_args) != 3 or set(where_kwargs) - {'workers'}:
+        # E.g. `invert=True`.
+        return None
+    column, method, value = where_args
+    operator = INDEXED_OPERATORS.get(method)
+    if operator is None or not isinstance(value, str):
+        return None
+    if operator == 'in' and "," not in value:
+        # `in` with a single value is a substring test (see `select_where_mask`).
+        return None
+    return column, operator, value
+
+
+def indexed_predicates(filename, where, sep=",", verbosity=0):
+    """ Return [(column, operator, value, meta)] for the `where` predicates that can use an index of the file. """
+    usable = []
+    for where_args, where_kwargs in where or []:
+        predicate = _predicate(where_args, where_kwargs)
+        if predicate is None:
+            continue
+        meta = load_index_meta(filename, predicate[0], sep=sep, verbosity=verbosity)
+        if meta is not None:
+            usable.append(predicate + (meta,))
+    return usable
+
+
+def _positions(keys, operator, value):
+    """ Return the positions of the sorted keys selected by an operator (a slice, or an array for `in`). """
+    if operator == 'in':
+        return np.concatenate([np.arange(np.searchsorted(keys, val, 'left'), np.searchsorted(keys, val, 'right'))
+                               for val in value])
+    if operator == 'eq':
+        return slice(np.searchsorted(keys, value, 'left'), np.searchsorted(keys, value, 'right'))
+    if operator == 'lt':
+        return slice(0, np.searchsorted(keys, value, 'left'))
+    if operator == 'le':
+        return slice(0, np.searchsorted(keys, value, 'right'))
+    if operator == 'gt':
+        return slice(np.searchsorted(keys, value, 'right'), len(keys))
+    return slice(np.searchsorted(keys, value, 'left'), len(keys))
+
+
+def lookup_rows(filename, column, operator, value, kind):
+    """ Return (row numbers, byte offsets) of the rows matching a predicate, in file order. """
+    keys = np.load(_index_path(filename, column, ".keys.npy"), mmap_mode='r')
+    if operator == 'in':
+        value = sorted({_lookup_value(val.strip(), kind) for val in value.split(",")})
+    else:
+        value = _lookup_value(value, kind)
+    positions = _positions(keys, operator, value)
+    rows = np.load(_index_path(filename, column, ".rows.npy"), mmap_mode='r')[positions]
+    offsets = np.load(_index_path(filename, column, ".offsets.npy"), mmap_mode='r')[positions]
+    order = np.argsort(rows, kind='stable')
+    return np.asarray(rows[order]), np.asarray(offsets[order])
+
+
+def read_rows(filename, rows, offsets, dtypes, sep=",", **kwargs):
+    """ Read and parse only the given rows (at the given byte offsets) of a csv file. """
+    with open(filename, 'rb') as fp:
+        lines = [fp.readline()]
+        for offset in offsets.tolist():
+            fp.seek(offset)
+            lines.append(fp.readline())
+    lines = [line if line.endswith(b"\n") else line + b"\n" for line in lines]
+    df = _parse_lines(b"".join(lines), dtypes, sep=sep, **kwargs)
+    df.index = pd.Index(rows)
+    return df
+
+
+def _parse_lines(data, dtypes, sep=",", **kwargs):
+    # Parse with the column types of the whole file; types given explicitly take precedence:
+    kwargs['dtype'] = dict(dtypes, **(kwargs.get('dtype') or {}))
+    return pd.read_csv(io.BytesIO(data), sep=sep, **kwargs)
+
+
+def _file_dtypes(meta, kwargs):
+    """ Return the column types of the whole file, except for columns parsed as dates. """
+    parse_dates = kwargs.get('parse_dates') or []
+    return {column: dtype for column, dtype in meta['dtypes'].items() if column not in parse_dates}
+
+
+def read_indexed(filename, where, sep=",", verbosity=0, **kwargs):
+    """ Read the rows of a csv file that may match the `where` predicates, using the file's sidecar indexes.
+
+    The returned rows match the indexed predicates; all predicates must still be applied to the result.
+
+    Returns:
+        (DataFrame, number of rows in the file), or None if no index can be used.
+    """
+    if set(kwargs) - set(INDEXED_READ_KWARGS):
+        return None
+    predicates = indexed_predicates(filename, where, sep=sep, verbosity=verbosity)
+    if not predicates:
+        return None
+    rows = offsets = None
+    for column, operator, value, meta in predicates:
+        try:
+            matched_rows, matched_offsets = lookup_rows(filename, column, operator, value, meta['kind'])
+        except ValueError:
+            # The value cannot be compared with the column's values, e.g. "abc" for a numeric column.
+            return None
+        if rows is None:
+            rows, offsets = matched_rows, matched_offsets
+        else:
+            keep = np.isin(rows, matched_rows, assume_unique=True)
+            rows, offsets = rows[keep], offsets[keep]
+    n_rows = meta['n_rows']
+    nrows = kwargs.pop('nrows', None)
+    if nrows is not None:
+        n_rows = min(n_rows, int(nrows))
+        keep = rows < n_rows
+        rows, offsets = rows[keep], offsets[keep]
+    if len(rows) > MAX_INDEXED_FRACTION * n_rows:
+        return None
+    if verbosity >= 2:
+        print(f"Reading {len(rows)} of {n_rows} rows from {filename!r} using index on "
+              f"{', '.join(repr(column) for column, *_ in predicates)}.", file=sys.stderr)
+    return read_rows(filename, rows, offsets, _file_dtypes(meta, kwargs), sep=sep, **kwargs), n_rows
+
+
+def load_line_index_meta(filename, sep=",", verbosity=0):
+    """ Return the metadata of an up-to-date index of the file (any column), if the line offsets were saved with it.
+
+    The line offsets are saved with every column index, and are up to date if the column index is.
+    """
+    directory = index_directory(filename)
+    if not os.path.exists(_line_offsets_path(filename)):
+        return None
+    for name in sorted(os.listdir(directory)):
+        if name.endswith(".json"):
+            meta = load_index_meta(filename, urllib.parse.unquote(name[:-len(".json")]), sep=sep, verbosity=verbosity)
+            if meta is not None:
+                return meta
+    return None
+
+
+def read_row_range(filename, start, stop=None, sep=",", verbosity=0, **kwargs):
+    """ Read rows `start` to `stop` (exclusive) of a csv file, seeking directly to the first row using the index.
+
+    Returns:
+        DataFrame, indexed by row number, or None if the file has no up-to-date index.
+    """
+    if set(kwargs) - set(INDEXED_READ_KWARGS) or 'nrows' in kwargs:
+        return None
+    meta = load_line_index_meta(filename, sep=sep, verbosity=verbosity)
+    if meta is None:
+        return None
+    n_rows = meta['n_rows']
+    stop = n_rows if stop is None else min(stop, n_rows)
+    start = min(start, stop)
+    # Line 0 is the header, so data row N starts at line offset N+1:
+    offsets = np.load(_line_offsets_path(filename), mmap_mode='r')
+    with open(filename, 'rb') as fp:
+        header = fp.readline()
+        begin = int(offsets[start + 1]) if start < n_rows else os.fstat(fp.fileno()).st_size
+        end = int(offsets[stop + 1]) if stop < n_rows else os.fstat(fp.fileno()).st_size
+        fp.seek(begin)
+        data = fp.read(end - begin)
+    if verbosity >= 2:
+        print(f"Reading rows {start} to {stop} of {filename!r} ({len(data)} bytes) using index.", file=sys.stderr)
+    if not header.endswith(b"\n"):
+        header += b"\n"
+    df = _parse_lines(header + data, _file_dtypes(meta, kwargs), sep=sep, **kwargs)
+    df.index = pd.RangeIndex(start, start + len(df))
+    return df
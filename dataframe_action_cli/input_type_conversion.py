@@ -53,7 +53,7 @@ def ensure_input_type(input_val, ensure_type, varname=None, args=tuple()):
         if varname and args:
             if f'no-{varname}' in args or f'no{varname}' in args:
                 input_val = False
-            elif 'header' in args:
+            elif varname in args:
                 input_val = True
         if isinstance(input_val, str):
             input_val = STR_TO_BOOL[input_val.upper()]
@@ -0,0 +1,303 @@
+# Copyright 2020, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Joining the table with another table file, with `-join-with`:
+
+    dataframe-action-cli -read-from samples.csv -join-with plates.csv on=Plate -print-csv
+    dataframe-action-cli -read-from samples.csv -join-with plates.csv on=Plate,Pos how=left -print-csv
+
+Rows are matched on the `on` columns (comma-separated; default: the columns in both tables).
+With `how=inner` (default), only rows with a match are kept; with `how=left`, all rows of the table are kept,
+with missing values for the other table's columns where there is no match.
+The joined rows are in the order of the table (and for multiple matches, in the order of the other file),
+followed by the other table's columns. Other columns in both tables get the suffix `_right` (`suffix=...`).
+
+The join strategy is picked from the size of the tables, compared to the memory budget for joins
+(the `join_memory` config value, or `memory=...`, default 1 GB):
+
+* `merge`: If both tables are sorted by the join column (a single column), the sorted keys are matched
+  directly with a sort-merge join, without building a hash table.
+* `hash`: If the other file fits in the memory budget, it is read and joined with a hash join.
+  If it does not, but the table does, the other file is read chunk-by-chunk, and each chunk is joined
+  with the table, so only one chunk of the other file is in memory at a time.
+* `partitioned`: If neither fits, the other file is read chunk-by-chunk and split into partitions by hashing
+  the join columns. The partitions are written to temporary files (in the `spill_dir` config directory,
+  default the system's temporary directory), and joined one at a time with the matching rows of the table.
+
+Use `strategy=<merge|hash|partitioned>` to pick a strategy. The chosen strategy, with its timings,
+is printed on stderr with `-v`.
+
+"""
+
+import itertools
+import os
+import pickle
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_bool_dtype, is_numeric_dtype
+
+from .cache import parse_size
+
+JOIN_HOWS = ('inner', 'left')
+JOIN_STRATEGIES = ('merge', 'hash', 'partitioned')
+DEFAULT_JOIN_MEMORY = "1GB"
+RIGHT_SUFFIX = "_right"
+
+# Number of partitions for partitioned joins (each partition should fit in half the memory budget):
+MIN_PARTITIONS = 2
+MAX_PARTITIONS = 64
+
+# Temporary column with the position of each row in the table, to restore the row order after joining:
+ROW_POSITION = "__join_row__"
+
+
+def join_columns(on, left_columns, right_columns):
+    """ Return the join columns, given by `on` (a list, or comma-separated string), or the columns in both tables.
+
+    Examples:
+        >>> join_columns("Plate, Pos", ["Pos", "Plate", "name"], ["Plate", "Pos", "conc"])
+        ['Plate', 'Pos']
+        >>> join_columns(None, ["Pos", "Plate", "name"], ["Plate", "conc"])
+        ['Plate']
+    """
+    if on is None:
+        on = [column for column in left_columns if column in set(right_columns)]
+        if not on:
+            raise ValueError("The tables have no columns in common; use `on=<columns>` to give the join columns.")
+        return on
+    on = [column.strip() for column in on.split(",")] if isinstance(on, str) else list(on)
+    for side, columns in (("table", left_columns), ("file to join with", right_columns)):
+        missing = [column for column in on if column not in set(columns)]
+        if missing:
+            raise KeyError(f"Cannot join on {missing}: No such column(s) in the {side}.")
+    return on
+
+
+def is_sorted_on(df: pd.DataFrame, on) -> bool:
+    """ Return True if the table is sorted by a single join column (without missing values). """
+    return len(on) == 1 and df[on[0]].is_monotonic_increasing and not df[on[0]].hasnans
+
+
+def _merge(left, right, on, how, suffix):
+    # `pd.merge` keeps the order of the left rows, with multiple matches in the order of the right rows.
+    return pd.merge(left, right, on=on, how=how, sort=False, suffixes=("", suffix))
+
+
+def _with_positions(df: pd.DataFrame) -> pd.DataFrame:
+    return df.reset_index(drop=True).assign(**{ROW_POSITION: np.arange(len(df))})
+
+
+def _restore_order(parts, columns) -> pd.DataFrame:
+    """ Concatenate joined parts and sort the rows back into the order of the table. """
+    result = pd.concat(parts, ignore_index=True)
+    # A stable sort keeps multiple matches of a row in the order of the other file:
+    order = np.argsort(result[ROW_POSITION].to_numpy(), kind='stable')
+    return result.take(order).reindex(columns=columns).reset_index(drop=True)
+
+
+def _joined_columns(left, right, on, how, suffix):
+    return _merge(left.iloc[:0], right.iloc[:0], on, how, suffix).columns
+
+
+def hash_join(left: pd.DataFrame, right: pd.DataFrame, on, how='inner', suffix=RIGHT_SUFFIX) -> pd.DataFrame:
+    """ Join two tables in memory, by building a hash table of the join keys. """
+    return _merge(left, right, on, how, suffix)
+
+
+def sort_merge_join(left: pd.DataFrame, right: pd.DataFrame, on, how='inner', suffix=RIGHT_SUFFIX) -> pd.DataFrame:
+    """ Join two tables that are both sorted by a single join column, by matching the sorted keys.
+
+    Examples:
+        >>> left = pd.DataFrame({'k': [1, 2, 2, 4], 'a': list("wxyz")})
+        >>> right = pd.DataFrame({'k': [2, 2, 3, 4], 'b': [10, 20, 30, 40]})
+        >>> sort_merge_join(left, right, ['k'], how='left')
+           k  a     b
+        0  1  w   NaN
+        1  2  x  10.0
+        2  2  x  20.0
+        3  2  y  10.0
+        4  2  y  20.0
+        5  4  z  40.0
+    """
+    key, = on
+    right_keys = right[key].to_numpy()
+    left_keys = left[key].to_numpy()
+    # The matches of each left row are a contiguous range of the sorted right rows:
+    starts = np.searchsorted(right_keys, left_keys, side='left')
+    n_matches = np.searchsorted(right_keys, left_keys, side='right') - starts
+    n_rows = np.maximum(n_matches, 1) if how == 'left' else n_matches
+    left_positions = np.repeat(np.arange(len(left)), n_rows)
+    first_row = np.repeat(np.cumsum(n_rows) - n_rows, n_rows)
+    right_positions = np.repeat(starts, n_rows) + (np.arange(n_rows.sum()) - first_row)
+    # Rows without a match (left joins only) get missing values:
+    right_positions[np.repeat(n_matches == 0, n_rows)] = -1
+    right = right.drop(columns=on).reset_index(drop=True)
+    right = right.rename(columns={column: column + suffix for column in right.columns if column in left.columns})
+    return pd.concat([left.take(left_positions).reset_index(drop=True),
+                      right.reindex(right_positions).reset_index(drop=True)], axis=1)
+
+
+def streamed_hash_join(left: pd.DataFrame, right_chunks, on, how='inner', suffix=RIGHT_SUFFIX) -> pd.DataFrame:
+    """ Join a table with another table read chunk-by-chunk, joining each chunk with the table (in memory). """
+    left = _with_positions(left)
+    matched = np.zeros(len(left), dtype=bool)
+    parts, columns = [], None
+    for chunk in right_chunks:
+        if columns is None:
+            columns = _joined_columns(left.drop(columns=ROW_POSITION), chunk, on, how, suffix)
+        part = _merge(left, chunk, on, 'inner', suffix)
+        matched[part[ROW_POSITION].to_numpy()] = True
+        parts.append(part)
+    if how == 'left':
+        parts.append(left[~matched])
+    if columns is None:
+        # The other file has no rows.
+        return left.drop(columns=ROW_POSITION).iloc[:0 if how == 'inner' else None]
+    return _restore_order(parts, columns)
+
+
+def _hashable_key(series: pd.Series) -> pd.Series:
+    # The same value must give the same hash in both tables (and in every chunk), e.g. 1 in an integer column
+    # and 1.0 in a float column, or "A" in a categorical and a string column.
+    if is_numeric_dtype(series) and not is_bool_dtype(series):
+        return series.astype(np.float64)
+    return series.astype(object)
+
+
+def partition_ids(df: pd.DataFrame, on, n_partitions) -> np.ndarray:
+    """ Return the partition of each row, by hashing the join columns. """
+    keys = pd.DataFrame({column: _hashable_key(df[column]) for column in on})
+    return (pd.util.hash_pandas_object(keys, index=False).to_numpy() % np.uint64(n_partitions)).astype(np.intp)
+
+
+def partition_count(right_size, memory) -> int:
+    """ Return the number of partitions for a partitioned join, so each partition fits in half the memory budget. """
+    return int(min(max(-(-right_size // max(memory // 2, 1)), MIN_PARTITIONS), MAX_PARTITIONS))
+
+
+def _load_partition(filename):
+    frames = []
+    with open(filename, 'rb') as fp:
+        while True:
+            try:
+                frames.append(pickle.load(fp))
+            except EOFError:
+                break
+    return pd.concat(frames, ignore_index=True) if frames else None
+
+
+def partitioned_join(left: pd.DataFrame, right_chunks, on, how='inner', suffix=RIGHT_SUFFIX, n_partitions=8,
+                     spill_dir=None, timings=None) -> pd.DataFrame:
+    """ Join a table with another table read chunk-by-chunk, partitioning the other table into temporary files.
+
+    Each chunk of the other table is split into partitions by hashing the join columns, and appended to the
+    partition's file. The partitions are then joined one at a time with the rows of the table in the same partition.
+    """
+    timings = {} if timings is None else timings
+    start = time.perf_counter()
+    columns = None
+    with tempfile.TemporaryDirectory(prefix="dataframe-action-cli-join-", dir=spill_dir) as directory:
+        filenames = [os.path.join(directory, f"partition-{i}.pickle") for i in range(n_partitions)]
+        files = [open(filename, 'wb') for filename in filenames]
+        try:
+            for chunk in right_chunks:
+                if columns is None:
+                    columns = _joined_columns(left, chunk, on, how, suffix)
+                for i, part in chunk.groupby(partition_ids(chunk, on, n_partitions), sort=False):
+                    pickle.dump(part, files[i], protocol=pickle.HIGHEST_PROTOCOL)
+        finally:
+            for fp in files:
+                fp.close()
+        timings['spill'] = time.perf_counter() - start
+        start = time.perf_counter()
+        if columns is None:
+            # The other file has no rows.
+            return left.reset_index(drop=True).iloc[:0 if how == 'inner' else None]
+        left = _with_positions(left)
+        left_partitions = partition_ids(left, on, n_partitions)
+        parts = []
+        for i, filename in enumerate(filenames):
+            right = _load_partition(filename)
+            os.remove(filename)
+            rows = left[left_partitions == i]
+            if right is not None:
+                parts.append(_merge(rows, right, on, how, suffix))
+            elif how == 'left':
+                parts.append(rows)
+        result = _restore_order(parts, columns) if parts else pd.DataFrame(columns=columns)
+    timings['join'] = time.perf_counter() - start
+    return result
+
+
+def join_tables(left: pd.DataFrame, read_right, iter_right_chunks, right_size, on=None, how='inner', strategy=None,
+                memory=None, suffix=RIGHT_SUFFIX, config=None, label="join-with") -> pd.DataFrame:
+    """ Join a table with another table, picking the join strategy (see module docstring).
+
+    Args:
+        left: The table.
+        read_right: Function that reads the whole other table.
+        iter_right_chunks: Function that returns an iterator over chunks of the other table.
+        right_size: Estimated size of the other table in memory, in bytes (e.g. its file size).
+        on: Join columns (list, or comma-separated string). Defaults to the columns in both tables.
+        how: 'inner' or 'left'.
+        strategy: 'merge', 'hash' or 'partitioned', or None to pick a strategy from the table sizes.
+        memory: Memory budget for the join. Defaults to the `join_memory` config value.
+        suffix: Suffix for other columns in both tables.
+        config: App-level config.
+        label: Name of the join, printed with the strategy and timings.
+
+    Returns:
+        The joined table, in the order of the left table, renumbered.
+    """
+    config = config or {}
+    how = how.lower()
+    if how not in JOIN_HOWS:
+        raise ValueError(f"Unsupported join {how!r}; use one of {', '.join(JOIN_HOWS)}.")
+    if strategy is not None and strategy.lower() not in JOIN_STRATEGIES:
+        raise ValueError(f"Unknown join strategy {strategy!r}; use one of {', '.join(JOIN_STRATEGIES)}.")
+    strategy = strategy and strategy.lower()
+    memory = parse_size(memory or config.get('join_memory') or DEFAULT_JOIN_MEMORY)
+    timings = {}
+    start = time.perf_counter()
+    if strategy is None and right_size > memory:
+        strategy = 'hash' if left.memory_usage(deep=True).sum() <= memory else 'partitioned'
+    if strategy == 'partitioned' or (strategy == 'hash' and right_size > memory):
+        # Peek at the first chunk for the column names, then continue with the remaining chunks:
+        chunks = iter(iter_right_chunks())
+        first = next(chunks, None)
+        on = join_columns(on, left.columns, first.columns if first is not None else left.columns)
+        if first is not None:
+            chunks = itertools.chain([first], chunks)
+        if strategy == 'partitioned':
+            n_partitions = partition_count(right_size, memory)
+            result = partitioned_join(left, chunks, on, how, suffix, n_partitions, config.get('spill_dir'), timings)
+            description = f"partitioned join ({n_partitions} partitions, spilled to disk)"
+        else:
+            result = streamed_hash_join(left, chunks, on, how, suffix)
+            timings['read+join'] = time.perf_counter() - start
+            description = "hash join (the other file read chunk-by-chunk)"
+    else:
+        right = read_right()
+        timings['read'] = time.perf_counter() - start
+        start = time.perf_counter()
+        on = join_columns(on, left.columns, right.columns)
+        sorted_inputs = strategy in (None, 'merge') and is_sorted_on(left, on) and is_sorted_on(right, on)
+        if strategy == 'merge' and not sorted_inputs:
+            raise ValueError("A sort-merge join requires both tables to be sorted by a single join column; "
+                             "use -sort-by first, or strategy=hash.")
+        if sorted_inputs:
+            result = sort_merge_join(left, right, on, how, suffix)
+            description = "sort-merge join (both tables sorted)"
+        else:
+            result = hash_join(left, right, on, how, suffix)
+            description = "hash join (in memory)"
+        timings['join'] = time.perf_counter() - start
+    if config.get('verbosity', 0) >= 1:
+        timing = ", ".join(f"{step} {seconds:.2f} s" for step, seconds in timings.items())
+        print(f"{label}: {description} on {', '.join(on)} ({how}): {len(left)} rows -> {len(result)} rows; {timing}.",
+              file=sys.stderr)
+    return result
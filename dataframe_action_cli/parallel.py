@@ -0,0 +1,101 @@
+# Copyright 2020, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Process-pool parallel evaluation of row-wise Python code.
+
+Actions that have to run Python code for every row, e.g. `create-column` expressions that cannot
+be vectorized, or `select-where` with operators that have no vectorized implementation,
+can split the table into row blocks and evaluate the blocks on a `ProcessPoolExecutor`.
+The results are put back together in the original row order.
+
+Blocks are sent to the worker processes as Arrow IPC buffers (if `pyarrow` is installed),
+or as pickled DataFrames, i.e. column-by-column, never row-by-row.
+
+Use `workers=<n>` on the action, or the `workers` config key, to set the number of processes.
+`workers=auto` uses all CPUs. Tables with fewer than `parallel_min_rows` rows (default 20000)
+are always evaluated in the main process.
+
+"""
+
+import concurrent.futures
+import os
+import pickle
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import is_numeric_dtype
+
+DEFAULT_MIN_ROWS = 20000
+
+
+def resolve_workers(workers=None, config=None):
+    """ Return the number of worker processes, from the `workers` argument or the `workers` config value. """
+    if workers is None:
+        workers = (config or {}).get('workers', 1)
+    if isinstance(workers, str) and workers.lower() in ('auto', 'all', '0'):
+        return os.cpu_count() or 1
+    return max(int(workers), 1)
+
+
+def use_parallel(df, workers, config=None):
+    """ Return True if row-wise evaluation of `df` should be split over `workers` processes. """
+    min_rows = int((config or {}).get('parallel_min_rows', DEFAULT_MIN_ROWS))
+    return workers > 1 and len(df) >= min_rows
+
+
+def serialize_block(block: pd.DataFrame):
+    """ Serialize a DataFrame block column-wise, as an Arrow IPC buffer if possible, otherwise by pickling. """
+    try:
+        import pyarrow as pa
+        if any(block[col].isna().any() for col in block.columns if not is_numeric_dtype(block[col].dtype)):
+            # Arrow would turn missing values in object columns into None instead of NaN.
+            raise ValueError("Missing values in non-numeric columns.")
+        table = pa.Table.from_pandas(block, preserve_index=False)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return 'arrow', sink.getvalue()
+    except Exception:
+        # pyarrow not installed, or a column could not be converted (e.g. mixed-type object columns).
+        return 'pickle', pickle.dumps(block.reset_index(drop=True), protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def deserialize_block(payload):
+    kind, data = payload
+    if kind == 'arrow':
+        import pyarrow as pa
+        return pa.ipc.open_stream(data).read_all().to_pandas()
+    return pickle.loads(data)
+
+
+def _run_block(func, payload, kwargs):
+    """ Worker: deserialize a block and apply `func` to it. """
+    return func(deserialize_block(payload), **kwargs)
+
+
+def map_row_blocks(func, df: pd.DataFrame, workers, **kwargs):
+    """ Apply `func(block, **kwargs)` to row blocks of `df` in worker processes.
+
+    Args:
+        func: Module-level (picklable) function, taking a DataFrame block and returning a sequence
+            with one value per row of the block.
+        df: DataFrame, containing only the columns needed by `func`.
+        workers: Number of worker processes.
+        **kwargs: Passed on to `func` (must be picklable).
+
+    Returns:
+        List of values, one per row of `df`, in the original order.
+    """
+    # A few blocks per worker evens out differences in evaluation time between blocks:
+    n_blocks = min(workers * 4, len(df))
+    bounds = np.linspace(0, len(df), n_blocks + 1, dtype=int)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(_run_block, func, serialize_block(df.iloc[start:stop]), kwargs)
+            for start, stop in zip(bounds[:-1], bounds[1:])
+        ]
+        results = []
+        # Collecting the results in submission order keeps the original row order:
+        for future in futures:
+            results.extend(future.result())
+    return results
@@ -0,0 +1,363 @@
+# Copyright 2020, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Pipeline files: Many named action chains, run together, sharing common work.
+
+A pipeline file (yaml) defines named action chains, using the same action syntax as the command line.
+A chain can continue from the result of another chain with `from`, so the chains form a DAG:
+
+    persist: true                   # Optional: Save intermediate results (see below).
+    cache_dir: .pipeline-cache      # Default: `.pipeline-cache` next to the pipeline file.
+    workers: 4                      # Number of branches run concurrently. Default: number of CPUs.
+    chains:
+      peter: -read-from big.csv -select-where name eq Peter
+      peter-by-price:
+        from: peter
+        actions: -sort-by price::desc -write-to peter-by-price.csv
+      peter-top:
+        from: peter
+        actions:
+          - -sort-by amount::desc
+          - -print-csv limit=10
+      anna: -read-from big.csv -select-where name eq Anna -write-to anna.csv
+
+Run all chains, or only some of them (and the chains they continue from), with:
+
+    dataframe-action-cli -run-pipeline pipeline.yaml
+    dataframe-action-cli -run-pipeline pipeline.yaml peter-top anna
+
+All chains are merged into a tree of steps (a trie), where chains that start with the same actions
+share the steps for their common prefix. E.g. above, `big.csv` is read only once, and the rows for
+Peter are selected only once, for both `peter-by-price` and `peter-top`.
+Each step is run once, and its result is passed on to all following steps.
+Independent branches of the tree are run concurrently, in a thread pool.
+Output actions (`write-to`, `print-csv`) are run one at a time, so printed tables are not interleaved.
+
+With `persist: true`, the results of reads, and of steps where chains branch off or end, are saved in the
+cache directory (in Arrow/Feather format, which requires `pyarrow`). Each result is saved under a key covering
+the actions leading up to it, and the size and modification time of the files read by them.
+When the pipeline is run again, the cache is checked before anything is run: For each branch, the run
+starts from the deepest saved result, and the steps before it (e.g. parsing the input files) are skipped
+entirely, so only the steps whose inputs changed are recomputed. Output actions are always run.
+Old results are not removed automatically; delete the cache directory to clear it.
+
+"""
+
+import concurrent.futures
+import hashlib
+import os
+import shlex
+import sys
+import threading
+import time
+
+DEFAULT_CACHE_DIRECTORY = ".pipeline-cache"
+PIPELINE_KEYS = ('chains', 'persist', 'cache_dir', 'workers')
+CHAIN_KEYS = ('from', 'actions')
+
+# Output actions are run one at a time, so tables printed by concurrent branches are not interleaved:
+_OUTPUT_LOCK = threading.Lock()
+
+
+class PipelineStep:
+    """ Node in the tree of steps: One action, following the parent step's action. """
+
+    def __init__(self, action_group=None, parent=None):
+        self.action_group = action_group
+        self.parent = parent
+        self.children = {}
+        self.chains = []  # Names of the chains ending with this step.
+        self.cache_key = None
+        self.persist = False
+        self.mode = 'run'  # 'run', 'load' (from the cache) or 'skip', see `resolve_cached_steps`.
+
+    def child(self, action_group):
+        action_key, action_args, action_kwargs = action_group
+        key = (action_key, tuple(str(arg) for arg in action_args),
+               tuple(sorted((name, str(val)) for name, val in action_kwargs.items())))
+        if key not in self.children:
+            self.children[key] = PipelineStep(action_group, parent=self)
+        return self.children[key]
+
+    def iter_steps(self):
+        for child in self.children.values():
+            yield child
+            yield from child.iter_steps()
+
+
+def _parse_actions(actions):
+    """ Parse the actions of a chain (a command line string, or a list of strings) into action groups. """
+    from actionista.action_cli_core.action_cli_argv_parser import parse_argv
+    if isinstance(actions, str):
+        actions = [actions]
+    argv = [arg for line in actions or [] for arg in shlex.split(str(line))]
+    (base_args, base_kwargs), action_groups = parse_argv(argv)
+    if base_args or base_kwargs:
+        raise ValueError(f"Pipeline chains must start with an action, not {argv[0]!r}.")
+    return action_groups
+
+
+def load_pipeline(filename):
+    """ Load a pipeline file, returning a dict with `chains` as {name: {'from': name, 'actions': action_groups}}. """
+    import yaml
+    with open(filename) as fp:
+        pipeline = yaml.safe_load(fp) or {}
+    unknown = set(pipeline) - set(PIPELINE_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown key(s) {sorted(unknown)} in pipeline {filename!r}; "
+                         f"use one of {', '.join(PIPELINE_KEYS)}.")
+    chains = {}
+    for name, chain in (pipeline.get('chains') or {}).items():
+        if not isinstance(chain, dict):
+            chain = {'actions': chain}
+        unknown = set(chain) - set(CHAIN_KEYS)
+        if unknown:
+            raise ValueError(f"Unknown key(s) {sorted(unknown)} in chain {name!r}; use one of {', '.join(CHAIN_KEYS)}.")
+        chains[str(name)] = {'from': chain.get('from'), 'actions': _parse_actions(chain.get('actions'))}
+    # Relative to the pipeline file:
+    cache_dir = os.path.join(os.path.dirname(filename), pipeline.get('cache_dir') or DEFAULT_CACHE_DIRECTORY)
+    return dict(pipeline, chains=chains, cache_dir=cache_dir)
+
+
+def expand_chains(chains, names=None):
+    """ Return {name: action_groups} with the complete actions of each chain, including the chains it continues.
+
+    Args:
+        chains: Dict with chains, as returned by `load_pipeline`.
+        names: Only return these chains (and the chains they continue from). Default: All chains.
+    """
+    expanded = {}
+
+    def expand(name, seen=()):
+        if name in seen:
+            raise ValueError(f"Pipeline chains form a cycle: {' -> '.join(seen + (name,))}.")
+        if name not in chains:
+            raise KeyError(f"No chain named {name!r} in pipeline; available chains: {', '.join(chains)}.")
+        if name not in expanded:
+            parent = chains[name]['from']
+            prefix = expand(str(parent), seen + (name,)) if parent is not None else []
+            expanded[name] = prefix + list(chains[name]['actions'])
+        return expanded[name]
+
+    for name in names or chains:
+        expand(name)
+    return expanded
+
+
+def build_step_tree(expanded_chains):
+    """ Merge chains into a tree of steps, where chains with a common prefix of actions share those steps. """
+    root = PipelineStep()
+    for name, action_groups in expanded_chains.items():
+        step = root
+        for action_group in action_groups:
+            step = step.child(action_group)
+        step.chains.append(name)
+    return root
+
+
+def _file_signatures(filenames):
+    from .dataframe_actions import expand_filenames
+    from .file_formats import STDIO_FILENAME
+    signatures = []
+    for filename in expand_filenames(filenames):
+        if filename == STDIO_FILENAME:
+            return None
+        stat = os.stat(filename)
+        signatures.append((os.path.abspath(filename), stat.st_size, stat.st_mtime_ns))
+    return signatures
+
+
+def assign_cache_keys(root):
+    """ Give each step a cache key, covering its actions and the files read by them, and mark steps to persist.
+
+    Steps following a read from stdin get no cache key, and are never loaded from the cache.
+    """
+    from .dataframe_actions import ACTIONS, read_file
+    from .streaming import OUTPUT_ACTIONS
+    for step in root.iter_steps():
+        parent_key = step.parent.cache_key if step.parent is not root else ""
+        if parent_key is None:
+            continue
+        action_key, action_args, action_kwargs = step.action_group
+        signatures = _file_signatures(action_args) if ACTIONS.get(action_key) is read_file else []
+        if signatures is None:
+            continue
+        step.cache_key = hashlib.sha1(repr((parent_key, action_key, [str(arg) for arg in action_args],
+                                            sorted((k, str(v)) for k, v in action_kwargs.items()),
+                                            signatures)).encode()).hexdigest()
+        if ACTIONS.get(action_key) is read_file:
+            # Save the parsed files, so parsing is skipped if only later steps changed:
+            step.persist = True
+        elif ACTIONS.get(action_key) not in OUTPUT_ACTIONS:
+            # Save the results where chains branch off or end (before any output actions):
+            step.persist = bool(step.chains or len(step.children) > 1 or any(
+                ACTIONS.get(child.action_group[0]) in OUTPUT_ACTIONS for child in step.children.values()))
+
+
+def resolve_cached_steps(root, cache_dir=None):
+    """ Decide for each step whether it is run, loaded from the cache, or skipped, before anything is run.
+
+    A step with a saved result is loaded if a following step is run, and skipped otherwise.
+    Other steps are run if they are output actions, end a chain, should be saved, or a following step is run.
+    So each branch starts from its deepest saved result, and steps whose subtree is covered by saved results
+    are skipped, e.g. reading and parsing the input files.
+
+    Returns:
+        Number of steps to (run, load, skip).
+    """
+    from .dataframe_actions import ACTIONS
+    from .streaming import OUTPUT_ACTIONS
+
+    def resolve(step):
+        for child in step.children.values():
+            resolve(child)
+        needed = any(child.mode == 'run' for child in step.children.values())
+        if cache_dir is not None and step.persist and os.path.isfile(_cache_path(cache_dir, step.cache_key)):
+            step.mode = 'load' if needed else 'skip'
+        elif needed or step.persist or step.chains or ACTIONS.get(step.action_group[0]) in OUTPUT_ACTIONS:
+            step.mode = 'run'
+        else:
+            step.mode = 'skip'
+
+    for child in root.children.values():
+        resolve(child)
+    modes = [step.mode for step in root.iter_steps()]
+    return tuple(modes.count(mode) for mode in ('run', 'load', 'skip'))
+
+
+class StepResult:
+    """ The result of a step, either in memory or saved in the cache. Each `get()` returns a separate copy. """
+
+    def __init__(self, df=None, path=None):
+        self.df = df
+        self.path = path
+
+    def get(self):
+        import pandas as pd
+        if self.df is None and self.path is None:
+            return pd.DataFrame()
+        if self.df is None:
+            from pyarrow import feather
+            return feather.read_table(self.path, memory_map=True).to_pandas()
+        # Following steps may modify their input (e.g. `create-column`), so each one gets its own copy.
+        # With copy-on-write (pandas 3), a shallow copy is enough.
+        copy_on_write = int(pd.__version__.split(".")[0]) >= 3 or getattr(pd.options.mode, 'copy_on_write', False)
+        return self.df.copy(deep=copy_on_write is not True)
+
+
+def _cache_path(cache_dir, cache_key):
+    return os.path.join(cache_dir, cache_key + ".feather")
+
+
+def _save_result(df, cache_dir, cache_key):
+    import pyarrow as pa
+    from pyarrow import feather
+    os.makedirs(cache_dir, exist_ok=True)
+    path = _cache_path(cache_dir, cache_key)
+    # Write to a temporary file first, so an interrupted run never leaves a partial result:
+    feather.write_feather(pa.Table.from_pandas(df), path + ".tmp", compression='uncompressed')
+    os.replace(path + ".tmp", path)
+
+
+def run_step(step, source, config, cache_dir=None):
+    """ Run a single step, with the result of the parent step as input.
+
+    Returns:
+        (step, StepResult)
+    """
+    from .cli import run_action_chain
+    from .dataframe_actions import ACTIONS
+    from .streaming import OUTPUT_ACTIONS
+    is_output = ACTIONS.get(step.action_group[0]) in OUTPUT_ACTIONS
+    df = source.get()
+    if is_output:
+        with _OUTPUT_LOCK:
+            df = run_action_chain([step.action_group], config=config, dataframe=df)
+    else:
+        df = run_action_chain([step.action_group], config=config, dataframe=df)
+    if cache_dir is not None and step.persist:
+        _save_result(df, cache_dir, step.cache_key)
+    return step, StepResult(df=df)
+
+
+def _chain_names(step):
+    """ Names of the chains passing through a step. """
+    names = list(step.chains)
+    for child in step.children.values():
+        names.extend(_chain_names(child))
+    return names
+
+
+def run_pipeline(filename, *chains, workers=None, config=None, **kwargs):
+    """ Run the action chains defined in a pipeline file (yaml), computing shared prefixes only once.
+
+    Args:
+        filename: The pipeline file, see `pipeline.py`.
+        *chains: Only run these chains (and the chains they continue from). Default: Run all chains.
+        workers: Number of branches to run concurrently. Defaults to the pipeline's `workers`,
+            or the number of CPUs.
+        config: App-level config.
+
+    Examples:
+
+        -run-pipeline pipeline.yaml
+        -run-pipeline pipeline.yaml peter-top anna workers=1
+
+    """
+    config = config or {}
+    start = time.perf_counter()
+    pipeline = load_pipeline(filename)
+    expanded = expand_chains(pipeline['chains'], names=chains)
+    from .cli import dataframe_actions
+    for name, action_groups in expanded.items():
+        for action_key, _, _ in action_groups:
+            if action_key not in dataframe_actions:
+                raise ValueError(f"Chain {name!r}: Only dataframe actions can be used in pipelines, not -{action_key}.")
+    root = build_step_tree(expanded)
+    cache_dir = None
+    if pipeline.get('persist'):
+        cache_dir = pipeline['cache_dir']
+        assign_cache_keys(root)
+    n_run, n_loaded, n_skipped = resolve_cached_steps(root, cache_dir)
+    workers = int(workers or pipeline.get('workers') or os.cpu_count() or 1)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        def schedule(step, source):
+            """ Submit the step to be run, or continue from its saved result; returns the submitted futures. """
+            if step.mode == 'run':
+                return {executor.submit(run_step, step, source, config, cache_dir=cache_dir)}
+            if step.mode == 'load':
+                if config.get('verbosity', 0) >= 2:
+                    print(f"Loaded result of -{step.action_group[0]} (chains {', '.join(_chain_names(step))}) "
+                          f"from pipeline cache.", file=sys.stderr)
+                source = StepResult(path=_cache_path(cache_dir, step.cache_key))
+            else:
+                # Skipped: None of the following steps that are run need this step's result.
+                source = None
+            return set().union(*(schedule(child, source) for child in step.children.values()))
+
+        pending = set().union(*(schedule(step, StepResult()) for step in root.children.values()))
+        try:
+            while pending:
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    step, result = future.result()
+                    if step.chains and config.get('verbosity', 0) >= 1:
+                        print(f"Pipeline chain(s) {', '.join(map(repr, step.chains))} done.", file=sys.stderr)
+                    pending |= set().union(*(schedule(child, result) for child in step.children.values()))
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            raise
+
+    if config.get('verbosity', 0) >= 1:
+        n_steps = sum(1 for _ in root.iter_steps())
+        n_chain_steps = sum(len(action_groups) for action_groups in expanded.values())
+        print(f"Pipeline {filename!r}: {len(expanded)} chains, {n_steps} steps ({n_chain_steps - n_steps} shared), "
+              f"{n_run} run, {n_loaded} loaded from cache, {n_skipped} skipped, "
+              f"in {time.perf_counter() - start:.2f} s.", file=sys.stderr)
+
+
+ACTIONS = {
+    'run-pipeline': run_pipeline,
+}
@@ -0,0 +1,547 @@
+# Copyright 2020, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Lazy action-chain planner.
+
+When running in lazy mode (`-lazy`), the parsed action groups are collected into a logical plan,
+which is optimized before anything is executed:
+
+* Consecutive read actions are merged into a single read, which reads the files in parallel.
+* Projection pushdown: Only the columns that are referenced by later actions are read from file,
+  by passing a `usecols` filter to `read_file`.
+* Predicate pushdown: `select-where` actions directly following the first `read-from` are moved
+  into the read, so rows are filtered chunk-by-chunk while the file is being parsed.
+  Predicates on columns with a sidecar index (see `indexes.py`) are pushed down also outside lazy mode,
+  with the column types of the whole file.
+* Row-range pushdown: A row-range action (e.g. `-select-rows-between 5000000 5001000`) directly following
+  a read of a single file is pushed into the read (`row_range`), so the rows before the range are skipped
+  without being parsed, and reading stops after the range. If the file has a sidecar index, the read seeks
+  directly to the first row; this is done also outside lazy mode (with the column types of the whole file).
+* Limit pushdown: A `-print-csv limit=N` at the end of the chain is pushed into a preceding `sort-by`
+  (which then only selects the top N rows, instead of sorting the whole table), or into a preceding read
+  (`nrows=N`), as long as the actions in between do not remove or reorder rows.
+  Chains where the limit follows only row-local actions, e.g. `select-where`, are run in streaming mode,
+  which stops reading as soon as enough rows have been printed.
+* Chains with `-aggregate` following only row-local actions are run in streaming mode,
+  aggregating the input chunk-by-chunk (see `aggregation.py`).
+* Chains that sort input files larger than the `sort_memory` budget (following and followed by only
+  row-local actions) are run in streaming mode, with an external merge sort (see `external_sort.py`).
+  This is done also outside lazy mode, where the files are read with the column types of the whole file.
+* Filter fusion: Consecutive `select-where` and `select-query` actions are evaluated as a single row mask,
+  so the selected rows are only taken from the table once (see `dataframe_actions.filter_mask`).
+  This is done also outside lazy mode.
+
+Outside lazy mode, only the rewrites that do not change the output are made: merging consecutive reads,
+pushing a print limit into `sort-by` (top-k, which keeps ties in order like a full stable sort),
+the sidecar-index pushdowns, filter fusion, and the external sort of large inputs (with `exact_types` reads).
+Rewrites that read only part of a file chunk-by-chunk (where column types are inferred per chunk)
+are only made in lazy mode.
+
+The plan has the same form as the action groups produced by `parse_argv`, i.e. a list of
+`(action_key, action_args, action_kwargs)` tuples, and is executed the same way.
+Use `-explain` to print the optimized plan instead of executing it.
+
+Examples:
+
+    dataframe-action-cli -lazy -read-from big.csv -select-where name eq Peter -print-csv
+    dataframe-action-cli -explain -read-from big.csv -select-where name eq Peter -sort-by age -print-csv
+
+"""
+
+import ast
+import os
+
+from . import dataframe_actions
+from .file_formats import STDIO_FILENAME, detect_format
+from .indexes import indexed_predicates, load_line_index_meta
+from .input_type_conversion import ensure_input_type
+from .aggregation import parse_aggregations, aggregation_specs, group_columns
+from .streaming import (
+    StreamingError, split_streamable_chain, final_actions_index, OUTPUT_ACTIONS, AGGREGATE_ACTIONS, SORT_ACTIONS,
+)
+from .external_sort import DEFAULT_SORT_MEMORY
+from .cache import parse_size
+
+
+# Marker for "all columns are needed" (the set of columns cannot be narrowed down):
+ALL_COLUMNS = None
+
+
+class UseColumns(frozenset):
+    """ Column set usable as `read_csv(usecols=...)` callable, tolerant to columns missing from the file. """
+
+    def __call__(self, column):
+        return column in self
+
+    def __repr__(self):
+        return repr(sorted(self))
+
+
+def _action_func(action_key):
+    return dataframe_actions.ACTIONS.get(action_key)
+
+
+def _strip_sort_order(column):
+    # "total::desc" -> "total"
+    return column.split("::")[0]
+
+
+def _expression_names(expr):
+    """ Return the set of names used in a Python expression, or ALL_COLUMNS if it cannot be parsed. """
+    try:
+        tree = ast.parse(expr.strip(), mode='eval')
+    except SyntaxError:
+        return ALL_COLUMNS
+    return {node.id for node in ast.walk(tree) if isinstance(node, ast.Name)}
+
+
+def _dfeval_created_and_names(args):
+    """ Return (created column, referenced names) for `create-column-fast` arguments. """
+    if len(args) > 1 and args[1] == "=":
+        args = [" ".join(args)]
+    if len(args) == 1:
+        # Style: "col3 = col1 + col2"
+        target, sep, expr = args[0].partition("=")
+        if not sep:
+            return None, ALL_COLUMNS
+        return target.strip(), _expression_names(expr)
+    elif len(args) == 2:
+        # Style: "col3", "col1 + col2"
+        return args[0], _expression_names(args[1])
+    return None, ALL_COLUMNS
+
+
+def _pyeval_created_and_names(args, kwargs):
+    """ Return (created column, referenced names) for `create-column` arguments. """
+    if len(args) < 2:
+        return None, ALL_COLUMNS
+    columnname, expr, *extra = args
+    if ensure_input_type(kwargs.get('use_format', False), bool, varname='use-format', args=extra):
+        # The expression is only known after formatting each row, so it may reference any column.
+        return columnname, ALL_COLUMNS
+    return columnname, _expression_names(expr)
+
+
+def referenced_columns(action_key, action_args, action_kwargs):
+    """ Determine which columns an action reads, and which column (if any) it creates.
+
+    Returns:
+        (referenced, created, resets) tuple, where
+        `referenced` is the set of columns read by the action (or ALL_COLUMNS),
+        `created` is the name of a column created by the action (or None), and
+        `resets` is True if the action discards all columns except the referenced ones.
+    """
+    func = _action_func(action_key)
+    if func in (dataframe_actions.write_csv, dataframe_actions.print_csv):
+        return ALL_COLUMNS, None, False
+    if func is dataframe_actions.select_columns:
+        return set(action_args), None, True
+    if func is dataframe_actions.select_where:
+        column = action_args[0] if action_args else action_kwargs.get('column')
+        return ({column} if column else ALL_COLUMNS), None, False
+    if func in (dataframe_actions.sort_by, dataframe_actions.natsort_by):
+        return {_strip_sort_order(col) for col in action_args}, None, False
+    if func is dataframe_actions.natsort_by_single:
+        return set(action_args[:1]), None, False
+    if func in (dataframe_actions.select_rows_from, dataframe_actions.select_rows_to,
+                dataframe_actions.select_rows_between, dataframe_actions.select_rows_islice,
+                dataframe_actions.select_rows_loc_eval):
+        return set(), None, False
+    if func is dataframe_actions.select_query_action:
+        return _expression_names(" ".join(action_args)), None, False
+    if func is dataframe_actions.select_fused:
+        filter_columns = [referenced_columns(*action_group)[0] for action_group in action_kwargs.get('filters', [])]
+        return (set().union(*filter_columns) if ALL_COLUMNS not in filter_columns else ALL_COLUMNS), None, False
+    if func is dataframe_actions.group_by:
+        return set(action_args), None, False
+    if func is dataframe_actions.group_as:
+        return set(action_args[:1]), None, False
+    if func is dataframe_actions.aggregate:
+        try:
+            aggregations = parse_aggregations(aggregation_specs(action_args, action_kwargs))
+        except ValueError:
+            return ALL_COLUMNS, None, False
+        by = group_columns(None, action_kwargs['by']) if action_kwargs.get('by') is not None else []
+        # The result only has the group-by columns (from a preceding `-group-by`) and the aggregates:
+        return {column for _, column, _ in aggregations if column is not None} | set(by), None, True
+    if func is dataframe_actions.create_column_dfeval:
+        created, names = _dfeval_created_and_names(action_args)
+        return names, created, False
+    if func is dataframe_actions.create_column_pyeval:
+        created, names = _pyeval_created_and_names(action_args, action_kwargs)
+        return names, created, False
+    # Unknown action: We have to assume that it may use any column.
+    return ALL_COLUMNS, None, False
+
+
+def merge_read_actions(action_groups):
+    """ Merge consecutive read actions with the same options into a single read of multiple files.
+
+    Multiple files are read in parallel by a single `read_file` call, and concatenated once,
+    instead of re-concatenating the growing table for every file.
+    """
+    merged = []
+    for action_key, action_args, action_kwargs in action_groups:
+        if (merged and _action_func(action_key) is dataframe_actions.read_file
+                and _action_func(merged[-1][0]) is dataframe_actions.read_file
+                and merged[-1][2] == action_kwargs):
+            prev_key, prev_args, prev_kwargs = merged[-1]
+            merged[-1] = (prev_key, list(prev_args) + list(action_args), prev_kwargs)
+        else:
+            merged.append((action_key, action_args, action_kwargs))
+    return merged
+
+
+def push_down_projections(action_groups):
+    """ Add `usecols` to read actions, so only columns used by later actions are parsed.
+
+    The action chain is traversed backwards, keeping track of which columns are needed
+    by the remaining part of the chain.
+    """
+    needed = set()
+    planned = []
+    for action_key, action_args, action_kwargs in reversed(action_groups):
+        func = _action_func(action_key)
+        if func is dataframe_actions.read_file:
+            # Keep user-provided column selections, and don't risk breaking column-referencing read options.
+            if needed is not ALL_COLUMNS and not {'usecols', 'index_col', 'parse_dates'} & set(action_kwargs):
+                # Pushed-down predicates are applied while reading, so their columns must be read too:
+                where_columns = [referenced_columns('select-where', where_args, where_kwargs)[0]
+                                 for where_args, where_kwargs in action_kwargs.get('where') or []]
+                read_columns = needed.union(*where_columns) if ALL_COLUMNS not in where_columns else ALL_COLUMNS
+                # With no columns at all (e.g. `-aggregate count`), the rows would not be read either:
+                if read_columns:
+                    action_kwargs = dict(action_kwargs, usecols=UseColumns(read_columns))
+            planned.append((action_key, action_args, action_kwargs))
+            continue
+        referenced, created, resets = referenced_columns(action_key, action_args, action_kwargs)
+        if resets:
+            needed = set(referenced)
+        elif referenced is ALL_COLUMNS or needed is ALL_COLUMNS:
+            needed = ALL_COLUMNS
+        else:
+            needed = (needed - {created}) | referenced
+        planned.append((action_key, action_args, action_kwargs))
+    return list(reversed(planned))
+
+
+def push_down_predicates(action_groups):
+    """ Move `select-where` actions directly following the first read action into the read.
+
+    Only the first read action is considered: `select-where` actions following later reads
+    apply to the concatenation of all files read so far, not just the last file.
+    """
+    if not action_groups or _action_func(action_groups[0][0]) is not dataframe_actions.read_file:
+        return action_groups
+    read_key, read_args, read_kwargs = action_groups[0]
+    if {'chunksize', 'nrows', 'row_range'} & set(read_kwargs):
+        return action_groups
+    where = list(read_kwargs.get('where') or [])
+    n_pushed = 0
+    for action_key, action_args, action_kwargs in action_groups[1:]:
+        if _action_func(action_key) is not dataframe_actions.select_where:
+            break
+        where.append((tuple(action_args), dict(action_kwargs)))
+        n_pushed += 1
+    if n_pushed == 0:
+        return action_groups
+    read_step = (read_key, read_args, dict(read_kwargs, where=where))
+    return [read_step] + list(action_groups[1 + n_pushed:])
+
+
+def push_down_indexed_predicates(action_groups, config=None):
+    """ Push `select-where` actions following the first read into the read, if they can use a sidecar index.
+
+    This is done also outside lazy mode, since the indexed rows are read without parsing the whole file
+    (see `indexes.py`). Only done if every file read has an up-to-date index for the predicate's column.
+    The read is given `exact_types`, so the result is the same as reading and filtering the whole file,
+    also if the index is not used after all (e.g. when most rows match).
+    """
+    if len(action_groups) < 2 or _action_func(action_groups[1][0]) is not dataframe_actions.select_where:
+        return action_groups
+    read_key, read_args, read_kwargs = action_groups[0]
+    if _action_func(read_key) is not dataframe_actions.read_file or read_kwargs.get('format') not in (None, 'csv'):
+        return action_groups
+    where = [(tuple(action_groups[1][1]), dict(action_groups[1][2]))]
+    try:
+        filenames = dataframe_actions.expand_filenames(read_args)
+    except FileNotFoundError:
+        return action_groups
+    sep = read_kwargs.get('sep', ",")
+    verbosity = (config or {}).get('verbosity', 0)
+    if all(detect_format(filename) == 'csv' and filename != STDIO_FILENAME
+           and indexed_predicates(filename, where, sep, verbosity=verbosity) for filename in filenames):
+        (read_key, read_args, read_kwargs), *rest = push_down_predicates(action_groups)
+        return [(read_key, read_args, dict(read_kwargs, exact_types=True))] + rest
+    return action_groups
+
+
+def _int_labels(values):
+    """ Return the values as non-negative ints, or None if any of them is not (e.g. a string label). """
+    try:
+        values = [int(value) for value in values]
+    except (TypeError, ValueError):
+        return None
+    return values if all(value >= 0 for value in values) else None
+
+
+def _row_spec_range(args):
+    """ Return the (start, stop) range of rows covering `select-rows` specs, or None if it cannot be determined. """
+    start, stop = None, 0
+    for arg in args:
+        try:
+            spec = dataframe_actions.parse_row_spec(arg)
+        except ValueError:
+            return None
+        if not isinstance(spec, slice):
+            spec = slice(spec, spec, None)
+        elif spec.step is not None and _int_labels([spec.step]) is None:
+            # Slices with a negative step go backwards.
+            return None
+        bounds = _int_labels([spec.start or 0] + ([] if spec.stop is None else [spec.stop]))
+        if bounds is None:
+            return None
+        start = bounds[0] if start is None else min(start, bounds[0])
+        # Label slices include the stop label:
+        stop = None if stop is None or spec.stop is None else max(stop, bounds[1] + 1)
+    return None if start is None else (start, stop)
+
+
+def row_range(action_key, action_args):
+    """ Return the range of rows (start, stop) selected by a row-range action, or None.
+
+    Returns:
+        (start, stop, exact) tuple, where `stop` may be None (all remaining rows), and `exact` is True if the
+        action selects exactly the rows in the range (by position), so it is not needed after reading the range.
+        The other row-range actions select by row label, and still apply after reading the range.
+    """
+    func = _action_func(action_key)
+    if func is dataframe_actions.select_rows_loc_eval:
+        bounds = _row_spec_range(action_args)
+        return None if bounds is None else bounds + (False,)
+    n_args = {dataframe_actions.select_rows_from: 1, dataframe_actions.select_rows_to: 1,
+              dataframe_actions.select_rows_between: 2, dataframe_actions.select_rows_islice: 2}.get(func)
+    if n_args is None or len(action_args) != n_args:
+        return None
+    values = _int_labels(action_args)
+    if values is None:
+        return None
+    if func is dataframe_actions.select_rows_from:
+        return values[0], None, False
+    if func is dataframe_actions.select_rows_to:
+        return 0, values[0] + 1, False
+    if func is dataframe_actions.select_rows_between:
+        return values[0], max(values[0], values[1] + 1), False
+    return values[0], max(values[0], values[1]), True
+
+
+def push_down_row_ranges(action_groups, into_reads=False, config=None):
+    """ Push a row-range action directly following the first read into the read, as `row_range`.
+
+    Args:
+        action_groups: List of (action_key, action_args, action_kwargs) tuples.
+        into_reads: Push the range into the read also if the file does not have a sidecar index.
+            The column types are then inferred only from the rows read, so it is only done in lazy mode.
+            Otherwise, the read is given `exact_types`, so the result is the same as reading the whole file.
+        config: App-level config.
+
+    Returns:
+        List of (action_key, action_args, action_kwargs) tuples.
+    """
+    if len(action_groups) < 2 or _action_func(action_groups[0][0]) is not dataframe_actions.read_file:
+        return action_groups
+    read_key, read_args, read_kwargs = action_groups[0]
+    # Options that change which lines of the file are rows:
+    if {'where', 'chunksize', 'nrows', 'skiprows', 'skipfooter', 'header', 'names', 'index_col', 'comment',
+            'row_range'} & set(read_kwargs):
+        return action_groups
+    bounds = row_range(*action_groups[1][:2])
+    if bounds is None:
+        return action_groups
+    try:
+        filenames = dataframe_actions.expand_filenames(read_args)
+    except FileNotFoundError:
+        return action_groups
+    if len(filenames) != 1:
+        # The row numbers continue from one file to the next.
+        return action_groups
+    filename = filenames[0]
+    if not into_reads and (filename == STDIO_FILENAME or detect_format(filename, read_kwargs.get('format')) != 'csv'
+                           or load_line_index_meta(filename, sep=read_kwargs.get('sep', ","),
+                                                   verbosity=(config or {}).get('verbosity', 0)) is None):
+        return action_groups
+    start, stop, exact = bounds
+    read_kwargs = dict(read_kwargs, row_range=(start, stop))
+    if not into_reads:
+        read_kwargs['exact_types'] = True
+    read_step = (read_key, read_args, read_kwargs)
+    return [read_step] + list(action_groups[2 if exact else 1:])
+
+
+# Actions that keep all rows, in the same order:
+ROW_PRESERVING_ACTIONS = (
+    dataframe_actions.select_columns, dataframe_actions.create_column_pyeval, dataframe_actions.create_column_dfeval,
+)
+
+
+def push_down_limits(action_groups, into_reads=False):
+    """ Push the `limit` of a final `print-csv` action into a preceding `sort-by` or read action.
+
+    Args:
+        action_groups: List of (action_key, action_args, action_kwargs) tuples.
+        into_reads: Also push the limit into a preceding read action, as `nrows`.
+            This changes how column types are inferred (only from the rows read), so it is only done in lazy mode.
+
+    Returns:
+        List of (action_key, action_args, action_kwargs) tuples.
+    """
+    if not action_groups or _action_func(action_groups[-1][0]) is not dataframe_actions.print_csv:
+        return action_groups
+    limit = action_groups[-1][2].get('limit')
+    if not limit:
+        return action_groups
+    limit = int(limit)
+    idx = len(action_groups) - 2
+    while idx >= 0 and _action_func(action_groups[idx][0]) in ROW_PRESERVING_ACTIONS:
+        idx -= 1
+    if idx < 0:
+        return action_groups
+    action_key, action_args, action_kwargs = action_groups[idx]
+    func = _action_func(action_key)
+    if func is dataframe_actions.sort_by and action_kwargs.get('limit') is None:
+        action_kwargs = dict(action_kwargs, limit=limit)
+    elif (into_reads and func is dataframe_actions.read_file
+          and not {'where', 'chunksize', 'nrows', 'row_range'} & set(action_kwargs)):
+        action_kwargs = dict(action_kwargs, nrows=limit)
+    else:
+        return action_groups
+    return action_groups[:idx] + [(action_key, action_args, action_kwargs)] + action_groups[idx + 1:]
+
+
+def stream_limited_chain(action_groups):
+    """ Return True if the chain can be streamed, and all its outputs have a limit, so reading can stop early.
+
+    Chains that sort or aggregate must read the whole table before the first row can be printed, so they are not
+    streamed for their limit (sorting with a limit is done in memory, with a partial sort, see `sort_by`).
+    """
+    try:
+        _, actions = split_streamable_chain(action_groups)
+    except StreamingError:
+        return False
+    if final_actions_index(actions) < len(actions):
+        return False
+    outputs = [action_kwargs for action_key, _, action_kwargs in actions
+               if _action_func(action_key) in OUTPUT_ACTIONS]
+    return bool(outputs) and all(action_kwargs.get('limit') for action_kwargs in outputs)
+
+
+def stream_aggregated_chain(action_groups):
+    """ Return True if the chain can be streamed, aggregating chunk-by-chunk (see `aggregation.py`). """
+    try:
+        _, actions = split_streamable_chain(action_groups)
+    except StreamingError:
+        return False
+    idx = final_actions_index(actions)
+    return idx < len(actions) and _action_func(actions[idx][0]) in AGGREGATE_ACTIONS
+
+
+def input_size(action_groups):
+    """ Return the total size of the files read by the read actions (0 for stdin), as an estimate of the table size. """
+    size = 0
+    for action_key, action_args, _ in action_groups:
+        if _action_func(action_key) is dataframe_actions.read_file:
+            size += sum(os.path.getsize(filename) for filename in dataframe_actions.expand_filenames(action_args)
+                        if filename != STDIO_FILENAME and os.path.isfile(filename))
+    return size
+
+
+def external_sort_chain(action_groups, config=None):
+    """ Return True if the chain sorts an input larger than the `sort_memory` budget, and can be streamed
+    with an external merge sort (see `external_sort.py`).
+    """
+    try:
+        reads, actions = split_streamable_chain(action_groups)
+    except StreamingError:
+        return False
+    idx = final_actions_index(actions)
+    if idx == len(actions) or _action_func(actions[idx][0]) not in SORT_ACTIONS:
+        return False
+    try:
+        size = input_size(reads)
+    except FileNotFoundError:
+        return False
+    return size > parse_size((config or {}).get('sort_memory') or DEFAULT_SORT_MEMORY)
+
+
+def with_exact_types(action_groups):
+    """ Give the reads at the start of a streamable chain `exact_types`, so the files are read chunk-by-chunk
+    with the column types of the whole file (see `dataframe_actions.iter_file_chunks`).
+
+    Used outside lazy mode when switching to an external sort, so the output is the same as sorting the whole table.
+    """
+    reads, actions = split_streamable_chain(action_groups)
+    return [(read_key, read_args, dict(read_kwargs, exact_types=True))
+            for read_key, read_args, read_kwargs in reads] + actions
+
+
+FILTER_ACTIONS = (dataframe_actions.select_where, dataframe_actions.select_query_action)
+
+
+def fuse_row_filters(action_groups):
+    """ Replace runs of consecutive `select-where` and `select-query` actions by a single `select-fused` action.
+
+    Each filter action would otherwise take the selected rows from the table, copying all columns,
+    only for the next filter to take a subset of those rows. The fused filters are evaluated as a single mask,
+    and the rows are only taken once.
+    """
+    fused, filters = [], []
+    for action_key, action_args, action_kwargs in action_groups + [(None, [], {})]:
+        if _action_func(action_key) in FILTER_ACTIONS:
+            filters.append((action_key, tuple(action_args), dict(action_kwargs)))
+            continue
+        if len(filters) > 1:
+            fused.append(('select-fused', [], {'filters': filters}))
+        else:
+            fused.extend(filters)
+        filters = []
+        if action_key is not None:
+            fused.append((action_key, action_args, action_kwargs))
+    return fused
+
+
+def plan_action_chain(action_groups, config=None):
+    """ Create an optimized plan from a list of dataframe action groups.
+
+    Args:
+        action_groups: List of (action_key, action_args, action_kwargs) tuples.
+        config: App-level config.
+
+    Returns:
+        List of (action_key, action_args, action_kwargs) tuples, the optimized plan.
+    """
+    plan = [(key, list(args), dict(kwargs)) for key, args, kwargs in action_groups]
+    plan = merge_read_actions(plan)
+    plan = push_down_predicates(plan)
+    plan = push_down_row_ranges(plan, into_reads=True, config=config)
+    plan = push_down_limits(plan, into_reads=True)
+    plan = push_down_projections(plan)
+    plan = fuse_row_filters(plan)
+    return plan
+
+
+def format_plan(plan):
+    """ Format a plan as text, one action per line (with pushed-down predicates and fused filters indented). """
+    lines = []
+    for action_key, action_args, action_kwargs in plan:
+        where = action_kwargs.get('where') or []
+        filters = action_kwargs.get('filters') or []
+        words = [f"-{action_key}"] + [str(arg) for arg in action_args] + [
+            f"{key}={val!r}" for key, val in action_kwargs.items() if key not in ('where', 'filters')]
+        lines.append(" ".join(words))
+        for where_args, where_kwargs in where:
+            lines.append("    where: " + " ".join(
+                [str(arg) for arg in where_args] + [f"{key}={val}" for key, val in where_kwargs.items()]))
+        for filter_key, filter_args, filter_kwargs in filters:
+            lines.append(f"    -{filter_key} " + " ".join(
+                [str(arg) for arg in filter_args] + [f"{key}={val}" for key, val in filter_kwargs.items()]))
+    return "\n".join(lines)
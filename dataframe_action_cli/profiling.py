@@ -0,0 +1,214 @@
+# Copyright 2020, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Per-action profiling of action chains (`-profile`).
+
+For every dataframe action in the chain, the profiler records:
+
+* wall time and CPU time (of the main process, including threads),
+* number of rows before and after the action,
+* DataFrame memory usage before and after the action (`df.memory_usage(deep=True)`),
+* peak RSS of the process after the action, and (with `tracemalloc=True`)
+  the peak memory allocated by Python during the action.
+
+In streaming mode, each action is called once per chunk, and the numbers are summed over all chunks
+(memory usage is the maximum over all chunks).
+
+The report is printed as a table to stderr, or written to a file, as a table or as JSON lines
+(one JSON object per action). With `cprofile=<action>`, the first action with that key is also
+run under `cProfile`, and the top functions are added to the report (or the stats are saved to
+a `.prof` file, if an output file is given).
+
+Examples:
+
+    dataframe-action-cli -profile -read-from big.csv -sort-by total -write-to sorted.csv
+    dataframe-action-cli -profile output=profile.jsonl -read-from big.csv -natsort Pos -print-csv
+    dataframe-action-cli -profile cprofile=natsort tracemalloc=True -read-from big.csv -natsort Pos -print-csv
+
+When profiling is not enabled, actions are called directly, without any overhead.
+
+"""
+
+import json
+import os
+import sys
+import time
+
+# Number of functions to print from cProfile stats:
+CPROFILE_TOP_N = 25
+
+
+def _memory_usage(df):
+    try:
+        return int(df.memory_usage(index=True, deep=True).sum())
+    except AttributeError:
+        return None
+
+
+def _n_rows(df):
+    try:
+        return len(df)
+    except TypeError:
+        return None
+
+
+def peak_rss():
+    """ Return the peak resident set size of the process in bytes, or None if not available (e.g. on Windows). """
+    try:
+        import resource
+    except ImportError:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux, and in bytes on macOS.
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+def _format_bytes(size):
+    if size is None:
+        return '-'
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if abs(size) < 1024:
+            return f"{size:.0f} {unit}" if unit == 'B' else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TB"
+
+
+class ActionProfiler:
+    """ Records timing and memory for each action in an action chain. """
+
+    def __init__(self, output=None, format=None, cprofile=None, tracemalloc=False):
+        self.output = output
+        if format is None:
+            format = 'jsonl' if output and os.path.splitext(output)[1].lower() in ('.jsonl', '.json') else 'table'
+        self.format = format
+        self.cprofile_action = cprofile.lstrip('-') if cprofile else None
+        self.cprofile_stats = None
+        self.tracemalloc = tracemalloc
+        # Records by step number (position of the action in the chain):
+        self.records = {}
+        if self.tracemalloc:
+            import tracemalloc as _tracemalloc
+            _tracemalloc.start()
+
+    def call(self, step, action_key, action_func, df, action_args, action_kwargs, config=None):
+        """ Call a dataframe action and record its wall time, CPU time, rows and memory usage. """
+        rows_in, mem_in = _n_rows(df), _memory_usage(df)
+        cprofiler = None
+        if self.cprofile_action == action_key and self.cprofile_stats is None:
+            import cProfile
+            cprofiler = cProfile.Profile()
+        if self.tracemalloc:
+            import tracemalloc as _tracemalloc
+            if hasattr(_tracemalloc, 'reset_peak'):  # Python 3.9+
+                _tracemalloc.reset_peak()
+            traced_before = _tracemalloc.get_traced_memory()[0]
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        if cprofiler is not None:
+            cprofiler.enable()
+        try:
+            result = action_func(df, *action_args, **action_kwargs, config=config)
+        finally:
+            if cprofiler is not None:
+                cprofiler.disable()
+            wall_time, cpu_time = time.perf_counter() - wall_start, time.process_time() - cpu_start
+        tracemalloc_peak = None
+        if self.tracemalloc:
+            tracemalloc_peak = _tracemalloc.get_traced_memory()[1] - traced_before
+        if cprofiler is not None:
+            self.cprofile_stats = cprofiler
+        self.add(step, action_key, action_args, wall_time, cpu_time, rows_in=rows_in, rows_out=_n_rows(result),
+                 mem_in=mem_in, mem_out=_memory_usage(result), tracemalloc_peak=tracemalloc_peak)
+        return result
+
+    def add(self, step, action_key, action_args, wall_time, cpu_time, rows_in=None, rows_out=None,
+            mem_in=None, mem_out=None, tracemalloc_peak=None):
+        """ Add one call of an action to the action's record (creating the record for the first call). """
+        record = self.records.get(step)
+        if record is None:
+            record = self.records[step] = {
+                'step': step, 'action': action_key, 'args': [str(arg) for arg in action_args], 'calls': 0,
+                'wall_s': 0.0, 'cpu_s': 0.0, 'rows_in': 0, 'rows_out': 0,
+                'mem_in_bytes': None, 'mem_out_bytes': None, 'peak_rss_bytes': None, 'tracemalloc_peak_bytes': None,
+            }
+        record['calls'] += 1
+        record['wall_s'] += wall_time
+        record['cpu_s'] += cpu_time
+        record['rows_in'] += rows_in or 0
+        record['rows_out'] += rows_out or 0
+        for key, value in (('mem_in_bytes', mem_in), ('mem_out_bytes', mem_out),
+                           ('peak_rss_bytes', peak_rss()), ('tracemalloc_peak_bytes', tracemalloc_peak)):
+            if value is not None:
+                record[key] = value if record[key] is None else max(record[key], value)
+
+    def iter_chunks(self, step, action_key, action_args, chunks):
+        """ Yield from an iterator of DataFrame chunks, recording the time spent producing each chunk (reading). """
+        chunks = iter(chunks)
+        try:
+            while True:
+                wall_start, cpu_start = time.perf_counter(), time.process_time()
+                try:
+                    chunk = next(chunks)
+                except StopIteration:
+                    return
+                self.add(step, action_key, action_args, time.perf_counter() - wall_start,
+                         time.process_time() - cpu_start, rows_out=_n_rows(chunk), mem_out=_memory_usage(chunk))
+                yield chunk
+        finally:
+            # Close the underlying reader, e.g. when streaming stops early.
+            if hasattr(chunks, 'close'):
+                chunks.close()
+
+    def format_table(self):
+        header = (f"{'step':>4}  {'action':20} {'calls':>6} {'wall (s)':>9} {'cpu (s)':>9} {'rows in':>10} "
+                  f"{'rows out':>10} {'mem in':>10} {'mem out':>10} {'peak rss':>10} {'py peak':>10}")
+        lines = [header, '-' * len(header)]
+        for record in self.records.values():
+            lines.append(
+                f"{record['step']:>4}  {'-' + record['action']:20} {record['calls']:>6} {record['wall_s']:9.3f} "
+                f"{record['cpu_s']:9.3f} {record['rows_in']:>10} {record['rows_out']:>10} "
+                f"{_format_bytes(record['mem_in_bytes']):>10} {_format_bytes(record['mem_out_bytes']):>10} "
+                f"{_format_bytes(record['peak_rss_bytes']):>10} {_format_bytes(record['tracemalloc_peak_bytes']):>10}")
+        total_wall = sum(record['wall_s'] for record in self.records.values())
+        total_cpu = sum(record['cpu_s'] for record in self.records.values())
+        lines.append(f"{'':4}  {'total':20} {'':>6} {total_wall:9.3f} {total_cpu:9.3f}")
+        return "\n".join(lines)
+
+    def format_cprofile(self):
+        import io
+        import pstats
+        stream = io.StringIO()
+        pstats.Stats(self.cprofile_stats, stream=stream).sort_stats('cumulative').print_stats(CPROFILE_TOP_N)
+        return f"cProfile of -{self.cprofile_action}:\n{stream.getvalue()}"
+
+    def report(self):
+        """ Print the profile as a table to stderr, or write it to the output file (table or JSON lines). """
+        if self.tracemalloc:
+            import tracemalloc as _tracemalloc
+            _tracemalloc.stop()
+        if self.format == 'jsonl':
+            text = "".join(json.dumps(record) + "\n" for record in self.records.values())
+        else:
+            text = f"\nProfile:\n{self.format_table()}\n"
+        if self.cprofile_stats is not None:
+            if self.output:
+                # Save the full stats for e.g. `snakeviz` or `python -m pstats`:
+                prof_fn = os.path.splitext(self.output)[0] + '.prof'
+                self.cprofile_stats.dump_stats(prof_fn)
+                print(f"Saved cProfile stats for -{self.cprofile_action} to {prof_fn!r}.", file=sys.stderr)
+            else:
+                text += "\n" + self.format_cprofile()
+        if self.output:
+            with open(self.output, 'w') as fp:
+                fp.write(text)
+        else:
+            print(text, file=sys.stderr)
+
+
+def get_profiler(config):
+    """ Return an ActionProfiler as configured by the `profile` config value, or None if profiling is disabled. """
+    profile_config = (config or {}).get('profile')
+    if not profile_config:
+        return None
+    if profile_config is True:
+        profile_config = {}
+    return ActionProfiler(**profile_config)
@@ -0,0 +1,184 @@
+# Copyright 2020, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Csv reader engines, with streamed decompression of compressed files.
+
+Two reader engines are available:
+
+* `pandas` (default): `pd.read_csv`.
+* `pyarrow`: pyarrow's csv reader, which parses blocks of the file in parallel, using multiple threads.
+  Column types are inferred from the whole file, and are the same as with pandas for numbers, booleans
+  and text. Dates and times are kept as text, like with pandas; use `parse_dates` to parse them.
+  When reading chunk-by-chunk (e.g. in `-stream` mode), column types are inferred from the first block
+  of the file, so use `dtype` for columns whose values only turn out to be text further down.
+
+The engine is selected with `engine=<pandas|pyarrow>` for `-read-from`, or the `read_engine` config value.
+For the pyarrow engine, the number of bytes parsed at a time (per thread) and the number of threads are given by
+`block_size` and `threads`, or the `read_block_size` and `read_threads` config values
+(the default is Arrow's block size, 1 MB, and all CPUs). The size of Arrow's (process-wide) CPU thread pool
+is only changed while the file is read, and restored afterwards.
+Read options that the pyarrow engine does not support (e.g. `skiprows`) make it fall back to pandas.
+
+Compressed files (`.gz`, `.bz2`, `.zst`, ...) are decompressed as a stream while being parsed, with either engine,
+so the decompressed file is never held in memory. The pyarrow engine also reads `.zst` files
+without the `zstandard` package.
+
+"""
+
+import contextlib
+import sys
+import threading
+
+import numpy as np
+import pandas as pd
+
+from .file_formats import (
+    STDIO_FILENAME, input_source, _select_columns, table_to_frame, read_batches, iter_batch_chunks,
+)
+
+READ_ENGINES = ('pandas', 'pyarrow')
+
+# `read-from` options that select and configure the reader engine (not passed on to the reader):
+ENGINE_READ_KWARGS = ('engine', 'block_size', 'threads')
+
+# Read options supported by the pyarrow engine; other options fall back to the pandas engine:
+PYARROW_READ_KWARGS = ('usecols', 'nrows', 'dtype', 'parse_dates')
+
+# Arrow's CPU count is process-wide, and files may be read from several threads at once (see `read_file`):
+_cpu_count_lock = threading.Lock()
+_cpu_count_state = {'readers': 0, 'saved': None}
+
+
+def read_engine(engine=None, config=None):
+    """ Return the csv reader engine to use, 'pandas' or 'pyarrow'. """
+    engine = (engine or (config or {}).get('read_engine') or 'pandas').lower()
+    if engine not in READ_ENGINES:
+        raise ValueError(f"Unknown read engine {engine!r}; use one of {', '.join(READ_ENGINES)}.")
+    return engine
+
+
+def _use_pyarrow(filename, sep, engine, config, kwargs):
+    if read_engine(engine, config) != 'pyarrow':
+        return False
+    unsupported = sorted(set(kwargs) - set(PYARROW_READ_KWARGS))
+    if len(sep) != 1:
+        # E.g. a regular expression, which only pandas supports.
+        unsupported.append('sep')
+    if not unsupported:
+        return True
+    if (config or {}).get('verbosity', 0) >= 2:
+        print(f"Reading {filename!r} with the pandas engine; the pyarrow engine does not support "
+              f"{', '.join(unsupported)}.", file=sys.stderr)
+    return False
+
+
+def _open_source(filename):
+    """ Return a function that opens the file as a (decompressing) pyarrow input stream. """
+    import pyarrow as pa
+    if filename == STDIO_FILENAME:
+        # Stdin can only be read once, but we open the input twice (see `_csv_options`).
+        buffer = pa.py_buffer(input_source(filename).read())
+        return lambda: pa.BufferReader(buffer)
+    return lambda: pa.input_stream(filename, compression='detect')
+
+
+def _arrow_type(dtype):
+    """ Return the pyarrow type to parse a column with a given `dtype` as, or None to convert it after parsing. """
+    import pyarrow as pa
+    if dtype in (str, object) or str(dtype) in ('str', 'string', 'object', 'category'):
+        # Categoricals are converted after parsing, so the categories are sorted like with pandas.
+        return pa.string()
+    try:
+        return pa.from_numpy_dtype(np.dtype(dtype))
+    except (TypeError, pa.ArrowNotImplementedError):
+        # E.g. pandas' nullable 'Int64' type.
+        return None
+
+
+@contextlib.contextmanager
+def _arrow_threads(threads):
+    """ Use `threads` threads in Arrow's CPU thread pool while reading, restoring the previous count afterwards.
+
+    When files are read concurrently, the count is restored when the last of them has been read.
+    """
+    if threads is None or int(threads) <= 1:
+        yield
+        return
+    import pyarrow as pa
+    with _cpu_count_lock:
+        if _cpu_count_state['readers'] == 0:
+            _cpu_count_state['saved'] = pa.cpu_count()
+        _cpu_count_state['readers'] += 1
+        pa.set_cpu_count(int(threads))
+    try:
+        yield
+    finally:
+        with _cpu_count_lock:
+            _cpu_count_state['readers'] -= 1
+            if _cpu_count_state['readers'] == 0:
+                pa.set_cpu_count(_cpu_count_state['saved'])
+
+
+def _csv_options(open_source, sep, block_size, threads, usecols, dtype, parse_dates):
+    """ Return the read, parse and convert options for pyarrow's csv readers. """
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    read_options = pa_csv.ReadOptions(use_threads=threads is None or int(threads) > 1,
+                                      **({'block_size': int(block_size)} if block_size else {}))
+    parse_options = pa_csv.ParseOptions(delimiter=sep)
+    # Peek at the first block, to get the column names and find the columns that are inferred as dates or times:
+    with pa_csv.open_csv(open_source(), read_options=read_options, parse_options=parse_options) as reader:
+        schema = reader.schema
+    column_types = {}
+    for field in schema:
+        arrow_type = _arrow_type(dtype[field.name]) if field.name in (dtype or {}) else None
+        if arrow_type is not None:
+            column_types[field.name] = arrow_type
+        elif pa.types.is_temporal(field.type) or field.name in (parse_dates or []):
+            column_types[field.name] = pa.string()
+    # Empty values (and e.g. "NA") are missing values in text columns, like with pandas:
+    convert_options = pa_csv.ConvertOptions(
+        column_types=column_types, include_columns=_select_columns(schema.names, usecols), strings_can_be_null=True)
+    return dict(read_options=read_options, parse_options=parse_options, convert_options=convert_options)
+
+
+def read_csv(filename, sep=",", engine=None, block_size=None, threads=None, config=None, **kwargs):
+    """ Read a csv file (or stdin, `-`) into a DataFrame, with the given reader engine (see module docstring). """
+    config = config or {}
+    if not _use_pyarrow(filename, sep, engine, config, kwargs):
+        return pd.read_csv(input_source(filename), sep=sep, **kwargs)
+    import pyarrow.csv as pa_csv
+    open_source = _open_source(filename)
+    threads = threads or config.get('read_threads')
+    with _arrow_threads(threads):
+        options = _csv_options(open_source, sep, block_size or config.get('read_block_size'), threads,
+                               kwargs.get('usecols'), kwargs.get('dtype'), kwargs.get('parse_dates'))
+        nrows = kwargs.get('nrows')
+        if nrows is None:
+            table = pa_csv.read_csv(open_source(), **options)
+        else:
+            # Only parse the blocks needed for the first `nrows` rows:
+            with pa_csv.open_csv(open_source(), **options) as reader:
+                table = read_batches(reader, nrows=int(nrows), schema=reader.schema)
+    return table_to_frame(table, kwargs.get('dtype'), kwargs.get('parse_dates'))
+
+
+def iter_csv_chunks(filename, chunksize, sep=",", engine=None, block_size=None, threads=None, config=None, **kwargs):
+    """ Read a csv file chunk-by-chunk, yielding DataFrames with a continuous index. """
+    config = config or {}
+    # Stdin is streamed by pandas; the pyarrow engine would have to read all of it first (see `_open_source`).
+    if filename == STDIO_FILENAME or not _use_pyarrow(filename, sep, engine, config, kwargs):
+        with pd.read_csv(input_source(filename), sep=sep, chunksize=chunksize, **kwargs) as reader:
+            yield from reader
+        return
+    import pyarrow.csv as pa_csv
+    open_source = _open_source(filename)
+    threads = threads or config.get('read_threads')
+    # The thread count is restored when the file has been read, or the chunks are no longer needed:
+    with _arrow_threads(threads):
+        options = _csv_options(open_source, sep, block_size or config.get('read_block_size'), threads,
+                               kwargs.get('usecols'), kwargs.get('dtype'), kwargs.get('parse_dates'))
+        nrows = kwargs.get('nrows')
+        with pa_csv.open_csv(open_source(), **options) as reader:
+            yield from iter_batch_chunks(reader, chunksize, nrows=int(nrows) if nrows is not None else None,
+                                         dtype=kwargs.get('dtype'), parse_dates=kwargs.get('parse_dates'))
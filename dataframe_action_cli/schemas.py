@@ -0,0 +1,162 @@
+# Copyright 2020, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Table schemas (column types per input file) and automatic memory compaction.
+
+Schemas are declared in the config file, per file name or glob pattern.
+The first pattern matching a file's path (or its base name) is used:
+
+    schemas:
+      "plates/*.csv":
+        dtype: {sample_id: int32, amount: float32}
+        categories: [Plate, name]     # Read as categorical columns.
+        parse_dates: [date]
+        skip: [note]                  # Columns that are not read at all.
+
+The schema is passed on to the reader as `dtype`, `parse_dates` and `usecols` options,
+so the columns are parsed directly into the given types.
+
+With `auto_compact: true` in the config (or `-auto-compact`, or `read-from ... compact=True`),
+tables are compacted after reading: integer columns are downcast to the smallest integer type,
+float columns to float32 if no precision is lost, and string columns with few distinct values
+are converted to categoricals. The memory saved is reported on stderr.
+
+"""
+
+import fnmatch
+import os
+import sys
+
+import pandas as pd
+from pandas.api.types import is_integer_dtype, is_float_dtype, is_bool_dtype, is_object_dtype, is_string_dtype
+
+SCHEMA_KEYS = ('dtype', 'categories', 'parse_dates', 'skip')
+
+# String columns are converted to categoricals if the number of distinct values is below this fraction of rows:
+DEFAULT_MAX_CATEGORY_FRACTION = 0.5
+
+
+class SkipColumns:
+    """ `read_csv(usecols=...)` callable that leaves out some columns, optionally combined with another usecols. """
+
+    def __init__(self, skip, usecols=None):
+        self.skip = frozenset(skip)
+        self.usecols = usecols
+
+    def __call__(self, column):
+        if column in self.skip:
+            return False
+        if self.usecols is None:
+            return True
+        return self.usecols(column) if callable(self.usecols) else column in self.usecols
+
+    def __repr__(self):
+        # Used in cache keys, so it must be deterministic.
+        return f"SkipColumns({sorted(self.skip)!r}, usecols={self.usecols!r})"
+
+
+def _is_selected(column, usecols):
+    if usecols is None:
+        return True
+    return usecols(column) if callable(usecols) else column in usecols
+
+
+def get_schema(filename, config):
+    """ Return the schema for a file from the `schemas` config value, or None if no pattern matches the file. """
+    schemas = (config or {}).get('schemas') or {}
+    candidates = (filename, os.path.abspath(filename), os.path.basename(filename))
+    for pattern, schema in schemas.items():
+        pattern = os.path.expanduser(pattern)
+        if any(fnmatch.fnmatch(candidate, pattern) for candidate in candidates):
+            unknown = set(schema or {}) - set(SCHEMA_KEYS)
+            if unknown:
+                raise ValueError(f"Unknown key(s) {sorted(unknown)} in schema {pattern!r}; "
+                                 f"use one of {', '.join(SCHEMA_KEYS)}.")
+            return schema or {}
+    return None
+
+
+def apply_schema(filename, read_kwargs, config):
+    """ Return read options with the file's schema (if any) merged in. Options given explicitly take precedence.
+
+    Examples:
+        >>> config = {'schemas': {'*.csv': {'categories': ['name'], 'skip': ['note']}}}
+        >>> apply_schema("data.csv", {}, config)
+        {'dtype': {'name': 'category'}, 'usecols': SkipColumns(['note'], usecols=None)}
+    """
+    schema = get_schema(filename, config)
+    if not schema:
+        return read_kwargs
+    read_kwargs = dict(read_kwargs)
+    dtype = dict(schema.get('dtype') or {})
+    dtype.update({column: 'category' for column in schema.get('categories') or []})
+    dtype.update(read_kwargs.get('dtype') or {})
+    if dtype:
+        read_kwargs['dtype'] = dtype
+    if schema.get('skip'):
+        read_kwargs['usecols'] = SkipColumns(schema['skip'], read_kwargs.get('usecols'))
+    if schema.get('parse_dates') and 'parse_dates' not in read_kwargs:
+        # read_csv raises an error for date columns that are not read, e.g. because of projection pushdown.
+        usecols = read_kwargs.get('usecols')
+        parse_dates = [column for column in schema['parse_dates'] if _is_selected(column, usecols)]
+        if parse_dates:
+            read_kwargs['parse_dates'] = parse_dates
+    return read_kwargs
+
+
+def _compact_column(series, max_category_fraction):
+    dtype = series.dtype
+    if is_bool_dtype(dtype):
+        return series
+    if is_integer_dtype(dtype):
+        return pd.to_numeric(series, downcast='integer')
+    if is_float_dtype(dtype):
+        downcast = series.astype('float32')
+        # Only downcast if all values survive the round trip, so the values written/printed are the same:
+        if ((downcast.astype(dtype) == series) | series.isna()).all():
+            return downcast
+        return series
+    if (is_object_dtype(dtype) or is_string_dtype(dtype)) and not isinstance(dtype, pd.CategoricalDtype):
+        n_unique = series.nunique(dropna=True)
+        if len(series) > 0 and n_unique <= max_category_fraction * len(series):
+            try:
+                return series.astype('category')
+            except TypeError:
+                # Mixed, unorderable values.
+                return series
+    return series
+
+
+def compact_dataframe(df: pd.DataFrame, max_category_fraction=DEFAULT_MAX_CATEGORY_FRACTION, verbosity=1, label=""):
+    """ Downcast numeric columns and convert low-cardinality string columns to categoricals, reporting memory saved.
+
+    Returns:
+        Compacted DataFrame.
+    """
+    before = int(df.memory_usage(index=True, deep=True).sum())
+    df = df.copy(deep=False)
+    for column in df.columns:
+        df[column] = _compact_column(df[column], max_category_fraction)
+    after = int(df.memory_usage(index=True, deep=True).sum())
+    if verbosity >= 1:
+        print(f"auto-compact{' ' + label if label else ''}: {before / 1024**2:.1f} MB -> {after / 1024**2:.1f} MB "
+              f"(saved {(before - after) / 1024**2:.1f} MB).", file=sys.stderr)
+    return df
+
+
+def unify_categories(frames):
+    """ Give categorical columns the same categories in all frames, so `pd.concat` keeps them categorical. """
+    if len(frames) < 2:
+        return frames
+    columns = {column for frame in frames for column in frame.columns
+               if isinstance(frame[column].dtype, pd.CategoricalDtype)}
+    frames = list(frames)
+    for column in columns:
+        if not all(column in frame.columns and isinstance(frame[column].dtype, pd.CategoricalDtype)
+                   for frame in frames):
+            continue
+        # Sorted, like the categories created by `astype('category')`, so sorting by the column is alphabetical:
+        categories = pd.api.types.union_categoricals(
+            [frame[column] for frame in frames], sort_categories=True).categories
+        frames = [frame.assign(**{column: frame[column].cat.set_categories(categories)}) for frame in frames]
+    return frames
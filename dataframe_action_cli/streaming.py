@@ -0,0 +1,241 @@
+# Copyright 2020, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Constant-memory streaming execution of row-wise action chains.
+
+In streaming mode (`-stream`), the input files are read chunk-by-chunk, and each chunk is passed
+through every action of the chain before the next chunk is read.
+`write-csv` and `print-csv` append each chunk to their output as they go,
+so memory usage is bounded by the chunk size, and the first output rows appear
+before the whole input has been read.
+If every output action has a `limit`, reading stops as soon as all limits have been reached.
+
+This only works for chains where all read actions come first, followed by
+row-local actions, i.e. actions that produce the same result whether they are applied to
+the whole table at once or to one chunk at a time.
+Other actions need the whole table, and cannot be streamed, with two exceptions:
+
+* `-aggregate` (see `aggregation.py`): Each chunk is aggregated into partial aggregates,
+  which are combined after the last chunk, and the actions following `-aggregate` are run on the result.
+* `-sort-by` and `-natsort` (see `external_sort.py`): The chunks are sorted in runs that are spilled to disk,
+  and merged after the last chunk. The merged rows are streamed through the (row-local) actions following the sort.
+
+Examples:
+
+    dataframe-action-cli -stream -read-from big.csv -select-where name eq Peter -write-to peter.csv
+    dataframe-action-cli -stream chunksize=50000 -read-from big.csv -create-column total "amount * price" -print-csv
+    dataframe-action-cli -stream -read-from big.csv -group-by name -aggregate amount:sum -sort-by amount_sum -print-csv
+    dataframe-action-cli -stream -read-from big.csv -sort-by price::desc -write-to sorted.csv
+
+"""
+
+import sys
+
+from .dataframe_actions import (
+    ACTIONS, expand_filenames, iter_file_chunks, read_file, write_csv, print_csv,
+    select_where, select_query_action, select_fused, select_columns, create_column_pyeval, create_column_dfeval,
+    group_by, aggregate, sort_by, natsort_by, natsort_by_single,
+)
+from .aggregation import GroupedAggregation, aggregation_specs, group_columns, parse_aggregations
+from .external_sort import ExternalSort, DEFAULT_SORT_MEMORY
+
+
+ROW_LOCAL_ACTIONS = (
+    select_where, select_query_action, select_fused, select_columns,
+    create_column_pyeval, create_column_dfeval,
+    write_csv, print_csv, group_by,
+)
+OUTPUT_ACTIONS = (write_csv, print_csv)
+# Actions that reduce the streamed chunks to a (small) table, which the rest of the chain is run on:
+AGGREGATE_ACTIONS = (aggregate,)
+# Actions that sort the streamed chunks with an external merge sort; the merged rows are streamed on:
+SORT_ACTIONS = (sort_by, natsort_by, natsort_by_single)
+
+# `read_file` arguments that only apply when reading whole files into memory:
+IN_MEMORY_READ_KWARGS = ('ignore_index', 'join', 'copy', 'workers', 'pool', 'compact')
+
+
+class StreamingError(RuntimeError):
+    """ The action chain cannot be run in streaming mode. """
+
+
+def split_streamable_chain(action_groups):
+    """ Split an action chain into (read actions, row-local actions).
+
+    Raises:
+        StreamingError, if the action chain cannot be streamed.
+    """
+    reads, actions = [], []
+    for action_key, action_args, action_kwargs in action_groups:
+        func = ACTIONS.get(action_key)
+        if func is read_file and not actions:
+            reads.append((action_key, action_args, action_kwargs))
+        else:
+            actions.append((action_key, action_args, action_kwargs))
+    if not reads:
+        raise StreamingError("Cannot stream action chain: The action chain must start with a `read-from` action.")
+    idx = final_actions_index(actions)
+    streamed = actions[:idx]
+    if idx < len(actions) and ACTIONS.get(actions[idx][0]) in SORT_ACTIONS:
+        # The sorted rows are streamed through the actions following the sort:
+        streamed = streamed + actions[idx + 1:]
+    not_streamable = [action_key for action_key, _, _ in streamed if ACTIONS.get(action_key) not in ROW_LOCAL_ACTIONS]
+    if not_streamable:
+        raise StreamingError(
+            f"Cannot stream action chain: The action(s) {', '.join(f'-{key}' for key in not_streamable)} "
+            f"need the whole table, and must be run without `-stream`.")
+    return reads, actions
+
+
+def final_actions_index(actions):
+    """ Return the index of the first aggregate or sort action, or the number of actions if there is none. """
+    return next((idx for idx, (action_key, _, _) in enumerate(actions)
+                 if ACTIONS.get(action_key) in AGGREGATE_ACTIONS + SORT_ACTIONS), len(actions))
+
+
+def _grouped_aggregation(actions, aggregate_action):
+    """ Return a `GroupedAggregation` for an aggregate action, grouped by its `by` or the last `-group-by` before it. """
+    _, aggregate_args, aggregate_kwargs = aggregate_action
+    by = aggregate_kwargs.get('by')
+    if by is None:
+        group_bys = [action_args for action_key, action_args, _ in actions if ACTIONS.get(action_key) is group_by]
+        by = group_bys[-1] if group_bys else []
+    return GroupedAggregation(group_columns(None, by),
+                              parse_aggregations(aggregation_specs(aggregate_args, aggregate_kwargs)))
+
+
+def _external_sort(sort_action, config):
+    """ Return an `ExternalSort` for a sort action, with the `sort_memory` budget. """
+    action_key, action_args, action_kwargs = sort_action
+    action_func = ACTIONS[action_key]
+    action_kwargs = dict(action_kwargs)
+    limit = action_kwargs.pop('limit', None)
+    if action_func is sort_by:
+        # The runs are merged by sorting them together, which requires a stable sort:
+        action_kwargs['kind'] = 'mergesort'
+    return ExternalSort(lambda df: action_func(df, *action_args, **action_kwargs, config=config), limit=limit,
+                        memory=config.get('sort_memory') or DEFAULT_SORT_MEMORY, spill_dir=config.get('spill_dir'),
+                        verbosity=config.get('verbosity', 0))
+
+
+def _output_limits(actions):
+    """ Return {action index: number of rows still to be printed} for the actions with a `limit`. """
+    return {idx: int(action_kwargs['limit']) for idx, (_, _, action_kwargs) in enumerate(actions)
+            if action_kwargs.get('limit')}
+
+
+def _run_chunk(chunk, actions, remaining, append, config, profiler=None, first_step=2):
+    """ Run the actions on a chunk; outputs append to the output of the previous chunks if `append`. """
+    for idx, (action_key, action_args, action_kwargs) in enumerate(actions):
+        action_func = ACTIONS[action_key]
+        if action_func in OUTPUT_ACTIONS:
+            if idx in remaining:
+                if remaining[idx] <= 0:
+                    continue
+                action_kwargs = dict(action_kwargs, limit=remaining[idx])
+                remaining[idx] -= min(len(chunk), remaining[idx])
+            if append:
+                action_kwargs = dict(action_kwargs, append=True)
+        if profiler is None:
+            chunk = action_func(chunk, *action_args, **action_kwargs, config=config)
+        else:
+            chunk = profiler.call(first_step + idx, action_key, action_func, chunk, action_args, action_kwargs, config)
+    return chunk
+
+
+def _limits_reached(actions, remaining):
+    """ Return True if every output action has a limit, and all limits have been reached. """
+    n_outputs = sum(1 for action_key, _, _ in actions if ACTIONS[action_key] in OUTPUT_ACTIONS)
+    return n_outputs > 0 and len(remaining) == n_outputs and all(count <= 0 for count in remaining.values())
+
+
+def iter_input_chunks(reads, config):
+    """ Yield chunks from all read actions, one file after the other, with the same columns throughout. """
+    columns = None
+    for action_key, action_args, action_kwargs in reads:
+        read_kwargs = {key: val for key, val in action_kwargs.items() if key not in IN_MEMORY_READ_KWARGS}
+        for filename in expand_filenames(action_args):
+            for chunk in iter_file_chunks(filename, config=config, **read_kwargs):
+                if columns is None:
+                    columns = chunk.columns
+                elif not chunk.columns.equals(columns):
+                    # Output has already been started, so we can only fill in missing columns, not add new ones.
+                    new_columns = chunk.columns.difference(columns)
+                    if len(new_columns) > 0:
+                        raise StreamingError(f"Cannot stream action chain: Columns {list(new_columns)} "
+                                           f"in {filename!r} were not present in the previous file(s).")
+                    chunk = chunk.reindex(columns=columns)
+                yield chunk
+
+
+def run_streaming(action_groups, config, profiler=None):
+    """ Run an action chain one chunk at a time.
+
+    Args:
+        action_groups: List of (action_key, action_args, action_kwargs) tuples.
+        config: App-level config.
+        profiler: Optional `profiling.ActionProfiler`; each action's numbers are summed over all chunks.
+
+    Returns:
+        None (the table is never held in memory as a whole).
+    """
+    # Binary output files (Arrow, Feather and Parquet) are kept open while the chunks are written to them:
+    config['table_writers'] = {}
+    try:
+        _run_streaming(action_groups, config, profiler)
+    finally:
+        for writer in config.pop('table_writers').values():
+            writer.close()
+
+
+def _run_streaming(action_groups, config, profiler=None):
+    reads, actions = split_streamable_chain(action_groups)
+    # Actions after an aggregation are run on the aggregated table, after the last chunk,
+    # and actions after a sort are run on the sorted chunks, as they are merged:
+    actions, final_actions = actions[:final_actions_index(actions)], actions[final_actions_index(actions):]
+    final_func = ACTIONS[final_actions[0][0]] if final_actions else None
+    aggregation = _grouped_aggregation(actions, final_actions[0]) if final_func in AGGREGATE_ACTIONS else None
+    external_sort = _external_sort(final_actions[0], config) if final_func in SORT_ACTIONS else None
+    # For each output action, the number of rows still to be printed (if `limit` is given):
+    remaining = _output_limits(actions)
+    n_rows_in = n_chunks = 0
+    chunks = iter_input_chunks(reads, config)
+    if profiler is not None:
+        # All reads are recorded together, as the first step:
+        chunks = profiler.iter_chunks(1, reads[0][0], [arg for _, read_args, _ in reads for arg in read_args], chunks)
+    for n_chunks, chunk in enumerate(chunks, start=1):
+        n_rows_in += len(chunk)
+        chunk = _run_chunk(chunk, actions, remaining, n_chunks > 1, config, profiler)
+        if aggregation is not None:
+            aggregation.add(chunk)
+        elif external_sort is not None:
+            external_sort.add(chunk)
+        if config.get('verbosity', 0) >= 2:
+            print(f"Streamed chunk {n_chunks} ({n_rows_in} rows read in total).", file=sys.stderr)
+        if not final_actions and _limits_reached(actions, remaining):
+            # All outputs are limited, and all limits have been reached.
+            # Closing the generator also closes the file being read.
+            chunks.close()
+            if config.get('verbosity', 0) >= 2:
+                print("All output limits reached; stopped reading.", file=sys.stderr)
+            break
+    if config.get('verbosity', 0) >= 1:
+        print(f"\nStreamed {n_rows_in} rows in {n_chunks} chunks.", file=sys.stderr)
+    if aggregation is not None:
+        table = aggregation.result()
+        for step, (action_key, action_args, action_kwargs) in enumerate(final_actions[1:], start=len(actions) + 3):
+            action_func = ACTIONS[action_key]
+            if profiler is None:
+                table = action_func(table, *action_args, **action_kwargs, config=config)
+            else:
+                table = profiler.call(step, action_key, action_func, table, action_args, action_kwargs, config)
+    elif external_sort is not None:
+        after_sort = final_actions[1:]
+        remaining = _output_limits(after_sort)
+        merged = external_sort.result_chunks()
+        for n_merged, chunk in enumerate(merged, start=1):
+            _run_chunk(chunk, after_sort, remaining, n_merged > 1, config, profiler, first_step=len(actions) + 3)
+            if _limits_reached(after_sort, remaining):
+                # Closing the generator removes the sorted runs.
+                merged.close()
+                break
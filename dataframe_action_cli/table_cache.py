@@ -0,0 +1,105 @@
+# Copyright 2020, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+In-memory cache of parsed tables, used by the resident daemon (see `daemon.py`).
+
+Tables are cached by the file's absolute path, size and modification time, and the read options,
+so a modified file is parsed again. The whole file is cached; options that select a subset of the table
+(`usecols`, `where` predicates and `nrows`) are applied to a copy of the cached table, so e.g.
+different projections and filters of the same file share one cache entry.
+
+When the total memory usage of the cached tables exceeds `max_size`, the least recently used tables are evicted.
+Every read returns a deep copy, so actions can never modify the cached tables.
+
+"""
+
+import collections
+import os
+import sys
+import threading
+
+from .cache import parse_size, select_usecols
+
+DEFAULT_MAX_SIZE = 2 * 1024**3
+
+# Read options that select a subset of the table, and are applied after loading from the cache:
+SUBSET_KWARGS = ('usecols', 'where', 'nrows')
+
+
+class TableCache:
+    """ LRU cache of parsed tables (DataFrames) in memory, with a limit on total memory usage. """
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE, verbosity=0):
+        self.max_size = parse_size(max_size)
+        self.verbosity = verbosity
+        self.tables = collections.OrderedDict()  # key -> (DataFrame, memory usage)
+        self.size = 0
+        self.hits = self.misses = 0
+        # Files may be read from several threads at once (see `read_file`):
+        self.lock = threading.Lock()
+
+    def key(self, filename, read_kwargs):
+        stat = os.stat(filename)
+        options = tuple((key, repr(val)) for key, val in sorted(read_kwargs.items()) if key not in SUBSET_KWARGS)
+        return os.path.abspath(filename), stat.st_size, stat.st_mtime_ns, options
+
+    def get(self, key):
+        with self.lock:
+            entry = self.tables.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.tables.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, df):
+        size = int(df.memory_usage(index=True, deep=True).sum())
+        if size > self.max_size:
+            return
+        with self.lock:
+            # Remove entries for older versions of the same file:
+            for old_key in [old_key for old_key in self.tables if old_key[0] == key[0] and old_key != key]:
+                self.size -= self.tables.pop(old_key)[1]
+            if key in self.tables:
+                self.size -= self.tables.pop(key)[1]
+            self.tables[key] = (df, size)
+            self.size += size
+            while self.size > self.max_size:
+                evicted_key, (_, evicted_size) = self.tables.popitem(last=False)
+                self.size -= evicted_size
+                if self.verbosity >= 2:
+                    # The daemon's own log, not the stderr of the request being run:
+                    print(f"Evicted {evicted_key[0]!r} from table cache.", file=sys.__stderr__)
+
+    def read(self, filename, read_kwargs, parse, select_where=None):
+        """ Return (DataFrame, number of rows before `where`) from the cache, or parse the file and cache it.
+
+        Args:
+            filename: File to read.
+            read_kwargs: Read options, including the subset options `usecols`, `where` and `nrows`.
+            parse: Function `parse(filename, **kwargs)` returning a DataFrame with the whole table.
+            select_where: Function `select_where(df, *args, **kwargs)`, used to apply `where` predicates.
+        """
+        key = self.key(filename, read_kwargs)
+        df = self.get(key)
+        if df is None:
+            df = parse(filename, **{key: val for key, val in read_kwargs.items() if key not in SUBSET_KWARGS})
+            self.put(key, df)
+        elif self.verbosity >= 2:
+            print(f"Loaded {filename!r} from table cache.", file=sys.__stderr__)
+        usecols = read_kwargs.get('usecols')
+        if usecols is not None:
+            df = df[select_usecols(df.columns, usecols)]
+        if read_kwargs.get('nrows') is not None:
+            df = df.iloc[:int(read_kwargs['nrows'])]
+        n_rows = len(df)
+        for where_args, where_kwargs in read_kwargs.get('where') or []:
+            df = select_where(df, *where_args, **where_kwargs)
+        # Always return a copy, so the cached table is never modified:
+        return df.copy(deep=True), n_rows
+
+    def stats(self):
+        with self.lock:
+            return {'tables': len(self.tables), 'size': self.size, 'max_size': self.max_size,
+                    'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,169 @@
+# Copyright 2020, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Vectorized binary operators, used by `select-where`.
+
+Each vectorized operator takes a whole column (Series) and a comparison value,
+and returns a boolean mask for the column in one go, e.g.
+regular expressions are compiled once and applied with `Series.str`,
+and comparison values are converted to the column's dtype before comparing.
+
+Operators from `actionista.binary_operators` that are not listed here are applied row-by-row instead.
+
+"""
+
+import fnmatch
+import re
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import (
+    is_bool_dtype, is_integer_dtype, is_float_dtype, is_datetime64_any_dtype, is_numeric_dtype,
+)
+
+from .input_type_conversion import STR_TO_BOOL
+
+
+class NotVectorizable(Exception):
+    """ Raised when a vectorized operator cannot be used for a given column and value. """
+
+
+def coerce_value(series, value):
+    """ Convert a comparison value (usually a string from the command line) to the dtype of `series`.
+
+    Examples:
+        >>> coerce_value(pd.Series([1, 2, 3]), "2")
+        2
+        >>> coerce_value(pd.Series([1.5, 2.5]), "2")
+        2.0
+
+    """
+    if not isinstance(value, str):
+        return value
+    dtype = series.dtype
+    try:
+        if is_bool_dtype(dtype):
+            return STR_TO_BOOL[value.upper()]
+        if is_integer_dtype(dtype):
+            try:
+                return int(value)
+            except ValueError:
+                return float(value)
+        if is_float_dtype(dtype):
+            return float(value)
+        if is_datetime64_any_dtype(dtype):
+            return pd.Timestamp(value)
+    except (KeyError, ValueError) as exc:
+        raise NotVectorizable(f"Could not convert {value!r} to column dtype {dtype}.") from exc
+    return value
+
+
+def _mask(result):
+    """ Return a boolean numpy array, with missing values (e.g. from nullable dtypes) as False. """
+    if isinstance(result, pd.Series):
+        if result.dtype != bool:
+            result = result.fillna(False)
+        result = result.to_numpy()
+    return np.asarray(result, dtype=bool)
+
+
+def _str(series):
+    """ Return the `.str` accessor, or raise NotVectorizable for non-string columns. """
+    if is_numeric_dtype(series.dtype) or is_datetime64_any_dtype(series.dtype):
+        raise NotVectorizable("String operators require a string column.")
+    return series.str
+
+
+def _str_regex(series, method, regex):
+    """ Apply `Series.str.match` or `Series.str.contains` with a compiled regex, returning a boolean mask. """
+    try:
+        return _mask(getattr(_str(series), method)(regex, na=False))
+    except ValueError:
+        # Arrow-backed string columns use the RE2 regex engine, which does not support all Python regex
+        # features, e.g. the atomic groups created by `fnmatch.translate()` (Python 3.11+), or look-aheads.
+        return _mask(getattr(series.astype(object).str, method)(regex, na=False))
+
+
+def _comparison(op):
+    def compare(series, value):
+        return _mask(op(series, coerce_value(series, value)))
+    return compare
+
+
+def _regex_match(flags=0):
+    def match(series, pattern):
+        return _str_regex(series, 'match', re.compile(pattern, flags))
+    return match
+
+
+def _regex_search(series, pattern):
+    return _str_regex(series, 'contains', re.compile(pattern))
+
+
+def _glob(flags=0):
+    def glob(series, pattern):
+        # fnmatch.translate() creates a regex that must match the whole string.
+        return _str_regex(series, 'match', re.compile(fnmatch.translate(pattern), flags))
+    return glob
+
+
+def _contains(series, value):
+    return _mask(_str(series).contains(value, regex=False, na=False))
+
+
+def _startswith(series, value):
+    return _mask(_str(series).startswith(value, na=False))
+
+
+def _endswith(series, value):
+    return _mask(_str(series).endswith(value, na=False))
+
+
+def _isin(series, values):
+    if not isinstance(values, (set, frozenset, list, tuple)):
+        # `a in "string"` is a substring test, which is only available row-by-row.
+        raise NotVectorizable("The 'in' operator is only vectorized for a list of values.")
+    return _mask(series.isin({coerce_value(series, value) for value in values}))
+
+
+VECTORIZED_OPERATORS = {
+    'eq': _comparison(lambda a, b: a == b),
+    'equal': _comparison(lambda a, b: a == b),
+    'equals': _comparison(lambda a, b: a == b),
+    'ne': _comparison(lambda a, b: a != b),
+    'not_equal': _comparison(lambda a, b: a != b),
+    'lt': _comparison(lambda a, b: a < b),
+    'lessthan': _comparison(lambda a, b: a < b),
+    'le': _comparison(lambda a, b: a <= b),
+    'lessthanorequal': _comparison(lambda a, b: a <= b),
+    'gt': _comparison(lambda a, b: a > b),
+    'greaterthan': _comparison(lambda a, b: a > b),
+    'ge': _comparison(lambda a, b: a >= b),
+    'greaterthanorequal': _comparison(lambda a, b: a >= b),
+    'matches': _regex_match(),
+    'match': _regex_match(),
+    'imatches': _regex_match(re.IGNORECASE),
+    'search': _regex_search,
+    'glob': _glob(),
+    'iglob': _glob(re.IGNORECASE),
+    'contains': _contains,
+    'startswith': _startswith,
+    'endswith': _endswith,
+    'in': _isin,
+}
+
+
+def vectorized_mask(series, comparison_method, comparison_value):
+    """ Evaluate a binary operator for a whole column.
+
+    Returns:
+        Boolean numpy array.
+
+    Raises:
+        NotVectorizable, if the operator has no vectorized implementation for the given column and value.
+    """
+    try:
+        operator_func = VECTORIZED_OPERATORS[comparison_method]
+    except KeyError:
+        raise NotVectorizable(f"No vectorized implementation of operator {comparison_method!r}.")
+    return operator_func(series, comparison_value)
@@ -0,0 +1,143 @@
+# Copyright 2020, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Buffered, chunked csv writers, with optional compression.
+
+Tables are written in chunks of rows (`write_chunksize` config value, default 50000 rows),
+and the output is flushed after each chunk, so e.g. `-print-csv | head` or `| less` shows
+the first rows right away, and memory use does not grow with the size of the output.
+
+Two writer engines are available:
+
+* `pandas` (default): `DataFrame.to_csv`, for each chunk.
+* `pyarrow`: pyarrow's csv writer, which converts columns to text in native code, using multiple threads.
+  The output differs slightly in formatting: Strings and column names are quoted,
+  booleans are written as `true`/`false`, and whole-number floats without decimals (e.g. `1`, not `1.0`).
+
+The engine is selected with `engine=<pandas|pyarrow>` for `-write-to` and `-print-csv`,
+or the `write_engine` config value.
+
+Files are compressed on the fly, as given by the file extension: `.gz` (gzip), `.bz2`, `.xz`,
+or `.zst` (zstd, requires the `zstandard` package). Use `compression=<gzip|bz2|xz|zstd|none>` to override.
+Appending (e.g. in `-stream` mode) adds a new compressed stream to the file, which is read as one continued file.
+
+"""
+
+import contextlib
+import io
+import os
+import sys
+
+from .file_formats import STDIO_FILENAME
+
+DEFAULT_WRITE_CHUNKSIZE = 50000
+WRITE_ENGINES = ('pandas', 'pyarrow')
+COMPRESSION_EXTENSIONS = {'.gz': 'gzip', '.bz2': 'bz2', '.xz': 'xz', '.zst': 'zstd'}
+
+# Output file buffer size:
+BUFFER_SIZE = 1024 * 1024
+
+
+def infer_compression(filename, compression='infer'):
+    """ Return the compression ('gzip', 'bz2', 'xz', 'zstd') for a file, or None for no compression.
+
+    Examples:
+        >>> infer_compression("out.csv.gz")
+        'gzip'
+        >>> infer_compression("out.csv") is None
+        True
+        >>> infer_compression("out.csv.gz", compression="none") is None
+        True
+    """
+    if compression is None or str(compression).lower() in ('none', 'false'):
+        return None
+    if compression != 'infer':
+        compression = compression.lower()
+        if compression not in COMPRESSION_EXTENSIONS.values():
+            raise ValueError(f"Unsupported compression {compression!r}; "
+                             f"use one of {', '.join(COMPRESSION_EXTENSIONS.values())} or none.")
+        return compression
+    if filename == STDIO_FILENAME:
+        return None
+    return COMPRESSION_EXTENSIONS.get(os.path.splitext(filename)[1].lower())
+
+
+def _open_compressed(filename, mode, compression):
+    if compression is None:
+        return open(filename, mode, buffering=BUFFER_SIZE)
+    if compression == 'gzip':
+        import gzip
+        # Level 6, like the gzip command line tool; level 9 is much slower for little gain.
+        return gzip.open(filename, mode, compresslevel=6)
+    if compression == 'bz2':
+        import bz2
+        return bz2.open(filename, mode)
+    if compression == 'xz':
+        import lzma
+        return lzma.open(filename, mode)
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("Writing zstd-compressed files requires the `zstandard` package.") from None
+    return zstandard.ZstdCompressor().stream_writer(open(filename, mode), closefd=True)
+
+
+@contextlib.contextmanager
+def open_output(filename, append=False, compression='infer', binary=False):
+    """ Open a file (or stdout, `-`) for writing, as a buffered text stream (or binary stream if `binary`). """
+    if filename == STDIO_FILENAME:
+        sys.stdout.flush()
+        stream = sys.stdout.buffer if binary else sys.stdout
+        yield stream
+        stream.flush()
+        return
+    raw = _open_compressed(filename, 'ab' if append else 'wb', infer_compression(filename, compression))
+    stream = raw if binary else io.TextIOWrapper(raw, encoding='utf-8', newline='')
+    try:
+        yield stream
+    finally:
+        stream.close()
+
+
+def _write_chunks_pandas(df, stream, header, index, index_label, chunksize):
+    # An empty table still gets a header:
+    for start in range(0, max(len(df), 1), chunksize):
+        df.iloc[start:start + chunksize].to_csv(
+            stream, header=header and start == 0, index=index, index_label=index_label)
+        stream.flush()
+
+
+def _write_chunks_pyarrow(df, stream, header, index, index_label, chunksize):
+    import pyarrow as pa
+    import pyarrow.csv as pa_csv
+    if index and df.index.nlevels == 1:
+        # Like `to_csv`, an unnamed index gets an empty column name (`reset_index` would name it "index"):
+        label = index_label if index_label is not None else (df.index.name or "")
+        df = df.reset_index()
+        df.columns = [label] + list(df.columns[1:])
+    elif index:
+        df = df.reset_index()
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    options = pa_csv.WriteOptions(include_header=header, batch_size=chunksize)
+    with pa_csv.CSVWriter(stream, table.schema, write_options=options) as writer:
+        for batch in table.to_batches(max_chunksize=chunksize):
+            writer.write_batch(batch)
+            stream.flush()
+
+
+def write_csv_chunks(df, filename, header=True, index=False, index_label=None, append=False,
+                     compression='infer', engine=None, chunksize=None, config=None):
+    """ Write a DataFrame as csv to a file (or stdout, `-`), chunk by chunk, see module docstring. """
+    config = config or {}
+    engine = (engine or config.get('write_engine') or 'pandas').lower()
+    if engine not in WRITE_ENGINES:
+        raise ValueError(f"Unknown write engine {engine!r}; use one of {', '.join(WRITE_ENGINES)}.")
+    chunksize = int(chunksize or config.get('write_chunksize') or DEFAULT_WRITE_CHUNKSIZE)
+    if engine == 'pyarrow' and filename == STDIO_FILENAME and not hasattr(sys.stdout, 'buffer'):
+        # E.g. stdout redirected to a StringIO.
+        engine = 'pandas'
+    with open_output(filename, append=append, compression=compression, binary=engine == 'pyarrow') as stream:
+        if engine == 'pyarrow':
+            _write_chunks_pyarrow(df, stream, header, index, index_label, chunksize)
+        else:
+            _write_chunks_pandas(df, stream, header, index, index_label, chunksize)
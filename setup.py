@@ -37,6 +37,8 @@ setup(
         'console_scripts': [
             # Action CLI entry point:
             'dataframe-action-cli=dataframe_action_cli.cli:action_cli',
+            # Thin client for the resident daemon (`dataframe-action-cli --serve`):
+            'dataframe-action-client=dataframe_action_cli.daemon:client_main',
         ],
         # 'gui_scripts': [
         # ]
@@ -45,6 +47,12 @@ setup(
     install_requires=[
         'pandas',
     ],
+    extras_require={
+        # Parse cache and Arrow/Feather/Parquet file formats:
+        'arrow': ['pyarrow'],
+        # Writing zstd-compressed (.zst) csv files:
+        'zstd': ['zstandard'],
+    },
     classifiers=[
         # How mature is this project? Common values are
         #   3 - Alpha
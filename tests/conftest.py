@@ -0,0 +1,77 @@
+# Copyright 2020, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Shared fixtures for the tests: A small deterministic table (like `benchmarks/datagen.py`),
+written to a csv file, and a `run_cli` fixture that runs `action_cli` and returns what it printed.
+
+The command line parser comes from `actionista`, so tests that run the CLI are skipped without it.
+
+"""
+
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+WELL_IDS = [f"{row}{col}" for row in "ABCDEFGHIJKLMNOP" for col in range(1, 25)]
+PLATE_NAMES = [f"Plate-{idx}" for idx in range(1, 21)]
+NAMES = ["Peter", "Michael", "Anna", "Maria", "Rasmus", "Sofie"]
+NOTE_WORDS = ["ok", "check", "redo", "low signal", "control"]
+
+
+def make_table(n_rows, seed=0) -> pd.DataFrame:
+    """ Return a deterministic DataFrame with `n_rows` rows and a mix of column types. """
+    rng = np.random.default_rng(seed)
+    price = np.round(rng.random(n_rows) * 100, 2)
+    price[rng.random(n_rows) < 0.02] = np.nan
+    note = np.array(NOTE_WORDS, dtype=object)[rng.integers(0, len(NOTE_WORDS), n_rows)]
+    note[rng.random(n_rows) < 0.05] = np.nan
+    return pd.DataFrame({
+        'Pos': np.array(WELL_IDS, dtype=object)[rng.integers(0, len(WELL_IDS), n_rows)],
+        'Plate': np.array(PLATE_NAMES, dtype=object)[rng.integers(0, len(PLATE_NAMES), n_rows)],
+        'name': np.array(NAMES, dtype=object)[rng.integers(0, len(NAMES), n_rows)],
+        'amount': rng.integers(0, 100, n_rows),
+        'price': price,
+        'note': note,
+    })
+
+
+def read_csv_output(text) -> pd.DataFrame:
+    """ Parse csv printed by `-print-csv`. """
+    return pd.read_csv(io.StringIO(text))
+
+
+@pytest.fixture(autouse=True)
+def isolated_home(tmp_path, monkeypatch):
+    """ Do not pick up the user's config file (or write to the user's cache directories). """
+    home = tmp_path / "home"
+    home.mkdir()
+    monkeypatch.setenv("HOME", str(home))
+    return home
+
+
+@pytest.fixture
+def table():
+    return make_table(2000)
+
+
+@pytest.fixture
+def csv_file(tmp_path, table):
+    filename = str(tmp_path / "data.csv")
+    table.to_csv(filename, index=False)
+    return filename
+
+
+@pytest.fixture
+def run_cli(capsys):
+    """ Return a function that runs the CLI with the given argv (and `verbosity=0`), returning stdout. """
+    pytest.importorskip("actionista")
+    from dataframe_action_cli.cli import action_cli
+
+    def run(*argv):
+        capsys.readouterr()
+        action_cli(["verbosity=0", *argv])
+        return capsys.readouterr().out
+
+    return run
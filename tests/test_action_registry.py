@@ -0,0 +1,51 @@
+# Copyright 2020, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Tests for the action registry: The actions read from the source of the action modules are the actions
+of the imported modules, and cheap commands (e.g. `-help`) do not import pandas.
+
+"""
+
+import importlib
+import os
+import subprocess
+import sys
+
+import pytest
+
+from dataframe_action_cli.action_registry import ActionCollection, _parse_module_actions
+
+MODULES = ['dataframe_actions', 'config_actions', 'help_actions', 'cache_actions', 'pipeline']
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.mark.parametrize("module_name", MODULES)
+def test_parsed_actions_equal_imported_actions(module_name):
+    collection = ActionCollection(module_name)
+    # Not importing the module, only reading its source:
+    assert collection._module is None
+    pytest.importorskip("actionista")
+    module = importlib.import_module(f"dataframe_action_cli.{module_name}")
+    assert collection._func_names == {key: func.__name__ for key, func in module.ACTIONS.items()}
+    for action_key, func in module.ACTIONS.items():
+        assert collection.docstring(action_key) == func.__doc__
+        assert collection[action_key] is func
+
+
+def test_unparsable_actions_dict():
+    assert _parse_module_actions("ACTIONS = {\n    'a': func,\n}\n") == {'a': 'func'}
+    assert _parse_module_actions("ACTIONS = {\n    'a': lambda df: df,\n}\n") is None
+    assert _parse_module_actions("ACTIONS = dict(a=func)\n") is None
+
+
+@pytest.mark.parametrize("argv", [["-help"], ["-help", "natsort"], ["-cache-stats"]])
+def test_cheap_commands_do_not_import_pandas(argv):
+    pytest.importorskip("actionista")
+    code = (f"import sys; from dataframe_action_cli.cli import action_cli; action_cli({argv!r}); "
+            f"sys.stderr.write('PANDAS=%d' % ('pandas' in sys.modules))")
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([PACKAGE_ROOT] + sys.path))
+    proc = subprocess.run([sys.executable, "-c", code], stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                          env=env, check=True)
+    assert proc.stderr.decode().endswith("PANDAS=0")
+    assert proc.stdout
@@ -0,0 +1,126 @@
+# Copyright 2020, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Tests for group-by aggregation: Aggregates, and partial aggregates of chunks combined, equal pandas' groupby.
+
+"""
+
+import io
+import warnings
+
+import pandas as pd
+import pytest
+
+from dataframe_action_cli.aggregation import (
+    GroupedAggregation, finalize_aggregate, parse_aggregations, partial_aggregate,
+)
+
+SPECS = ["amount:sum", "amount:min", "amount:max", "price:mean", "price:count", "price:max", "count"]
+
+
+def expected_aggregate(df, by, specs=SPECS):
+    """ The aggregate computed with pandas' groupby, missing keys as a group of their own, sorted by the keys. """
+    named = {name: ((column, func) if column is not None else ('amount', 'size'))
+             for name, column, func in parse_aggregations(specs)}
+    if not by:
+        return pd.DataFrame({name: [df[column].agg(func)] for name, (column, func) in named.items()})
+    return df.groupby(by, dropna=False, sort=True).agg(**named).reset_index()
+
+
+def parse_csv(text):
+    return pd.read_csv(io.StringIO(text))
+
+
+def assert_aggregates_equal(result, expected):
+    # Floating-point sums depend on the order the values are added in:
+    pd.testing.assert_frame_equal(result.reset_index(drop=True), expected, check_dtype=False, check_exact=False)
+
+
+BY = [[], ["Plate"], ["name", "Plate"], ["note"], ["amount"]]
+
+
+@pytest.mark.parametrize("by", BY, ids=lambda by: ",".join(by) or "all")
+def test_aggregate_equals_groupby(table, by):
+    aggregations = parse_aggregations(SPECS)
+    result = finalize_aggregate(partial_aggregate(table, by, aggregations), by, aggregations)
+    assert_aggregates_equal(result, expected_aggregate(table, by))
+
+
+@pytest.mark.parametrize("chunksize", [1, 37, 500])
+@pytest.mark.parametrize("by", BY, ids=lambda by: ",".join(by) or "all")
+def test_combined_partial_aggregates_equal_groupby(table, by, chunksize):
+    table = table.iloc[:300] if chunksize == 1 else table
+    aggregation = GroupedAggregation(by, parse_aggregations(SPECS), max_partials=3)
+    for start in range(0, len(table), chunksize):
+        aggregation.add(table.iloc[start:start + chunksize])
+    assert_aggregates_equal(aggregation.result(), expected_aggregate(table, by))
+
+
+def test_groups_with_only_missing_values(table):
+    # The mean of a group without values is missing, and its count is 0:
+    table = table.assign(price=table.price.where(table.name != "Anna"))
+    aggregation = GroupedAggregation(["name"], parse_aggregations(SPECS))
+    for start in range(0, len(table), 100):
+        aggregation.add(table.iloc[start:start + 100])
+    result = aggregation.result()
+    assert_aggregates_equal(result, expected_aggregate(table, ["name"]))
+    anna = result[result.name == "Anna"].iloc[0]
+    assert pd.isna(anna.price_mean) and anna.price_count == 0
+
+
+def test_empty_table(table):
+    aggregations = parse_aggregations(["amount:sum", "count"])
+    result = finalize_aggregate(partial_aggregate(table.iloc[:0], [], aggregations), [], aggregations)
+    assert result.to_dict('records') == [{'amount_sum': 0, 'count': 0}]
+    assert list(GroupedAggregation(["name"], aggregations).result().columns) == ["name", "amount_sum", "count"]
+
+
+def test_parse_aggregations():
+    assert parse_aggregations(["total=amount:sum", "*:count", "n=count"]) == [
+        ('total', 'amount', 'sum'), ('count', None, 'size'), ('n', None, 'size')]
+    with pytest.raises(ValueError, match="Unknown aggregate function"):
+        parse_aggregations(["amount:median"])
+    with pytest.raises(ValueError, match="Invalid aggregation"):
+        parse_aggregations(["sum"])
+
+
+@pytest.mark.parametrize("chain", [
+    ["-group-by", "Plate", "-aggregate", *SPECS, "-print-csv"],
+    ["-select-where", "amount", "lt", "50", "-aggregate", "total=amount:sum", "price:mean", "by=name,note",
+     "-sort-by", "total", "-print-csv"],
+    ["-aggregate", "amount:sum", "count", "-print-csv"],
+], ids=["group-by", "by-sort", "all"])
+def test_streamed_aggregate_equals_in_memory(run_cli, csv_file, chain):
+    expected = parse_csv(run_cli("-read-from", csv_file, *chain))
+    assert_aggregates_equal(parse_csv(run_cli("chunksize=150", "-stream", "-read-from", csv_file, *chain)), expected)
+    assert_aggregates_equal(parse_csv(run_cli("chunksize=150", "-lazy", "-read-from", csv_file, *chain)), expected)
+
+
+def test_cli_aggregate_equals_groupby(run_cli, csv_file, table):
+    output = run_cli("-read-from", csv_file, "-group-by", "name", "Plate", "-aggregate", *SPECS, "-print-csv")
+    assert_aggregates_equal(parse_csv(output), expected_aggregate(table, ["name", "Plate"]))
+
+
+@pytest.mark.parametrize("reverse", [False, True])
+def test_group_as_equals_filter_and_stable_sort(table, reverse):
+    pytest.importorskip("actionista")
+    from dataframe_action_cli.dataframe_actions import group_as
+    groups = ["Sofie", "Anna", "Nobody", "Peter"]
+    rank = {group: idx for idx, group in enumerate(groups)}
+    expected = table[table.name.isin(groups)]
+    expected = expected.sort_values("name", key=lambda names: names.map(rank), ascending=not reverse, kind='stable')
+    pd.testing.assert_frame_equal(group_as(table, "name", *groups, reverse=reverse), expected)
+    # Groups are matched as numbers for numeric columns:
+    result = group_as(table, "amount", "5", "abc", "3")
+    assert list(result.amount.unique()) == [5, 3] and len(result) == table.amount.isin([3, 5]).sum()
+
+
+def test_group_as_unlisted_groups_do_not_warn(table):
+    pytest.importorskip("actionista")
+    from dataframe_action_cli.dataframe_actions import group_as
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        result = group_as(table, "Plate", "Plate-3", "Plate-1", "Plate-99")
+        assert len(group_as(table, "name")) == 0
+    assert list(result.Plate.unique()) == ["Plate-3", "Plate-1"]
+    assert len(result) == table.Plate.isin(["Plate-1", "Plate-3"]).sum()
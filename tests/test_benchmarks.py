@@ -0,0 +1,54 @@
+# Copyright 2020, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Tests for the benchmark suite: Every action has a benchmark case, and the suite runs on a small table.
+
+"""
+
+import json
+import os
+
+import pytest
+
+pytest.importorskip("actionista")
+
+BENCHMARKS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks")
+
+
+@pytest.fixture
+def bench_suite(monkeypatch):
+    # The benchmark scripts import each other as top-level modules:
+    monkeypatch.syspath_prepend(BENCHMARKS_DIR)
+    import bench_suite
+    return bench_suite
+
+
+def test_every_action_has_a_benchmark_case(bench_suite):
+    bench_suite.check_coverage()
+
+
+def test_missing_benchmark_case_is_reported(bench_suite, monkeypatch):
+    cases = [case for case in bench_suite.ACTION_CASES if case[1] != 'group-as']
+    monkeypatch.setattr(bench_suite, 'ACTION_CASES', cases)
+    with pytest.raises(RuntimeError, match="group-as"):
+        bench_suite.check_coverage()
+
+
+def test_suite_runs_and_results_compare(bench_suite, tmp_path, capsys):
+    pytest.importorskip("pyarrow")
+    output = str(tmp_path / "results.json")
+    argv = ["--sizes", "300", "--repeat", "1", "--data-dir", str(tmp_path / "data")]
+    bench_suite.main(argv + ["--output", output])
+    with open(output) as fp:
+        results = json.load(fp)['results']
+    names = {result['name'] for result in results}
+    assert names == {name for name, _, _ in bench_suite.ACTION_CASES} | {name for name, _ in bench_suite.CLI_CASES}
+    assert all(result['n_rows'] == 300 and len(result['times']) == 1 for result in results)
+
+    import compare
+    bench_suite.main(argv + ["--filter", "sort-by", "--output", str(tmp_path / "after.json")])
+    capsys.readouterr()
+    compare.main([output, str(tmp_path / "after.json"), "--threshold", "1000"])
+    lines = capsys.readouterr().out.splitlines()
+    assert any(line.startswith("sort-by[top-20]") for line in lines)
+    assert any(line.startswith("Only in") for line in lines)
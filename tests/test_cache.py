@@ -0,0 +1,103 @@
+# Copyright 2020, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Tests for the parse cache: Loading a file from the cache gives the same table as parsing it again.
+
+"""
+
+import os
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from dataframe_action_cli.cache import ParseCache, parse_size  # noqa: E402
+
+
+class CountingParser:
+    """ Parse csv files with `pd.read_csv`, counting the number of files parsed. """
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, filename, **kwargs):
+        self.calls += 1
+        return pd.read_csv(filename, **kwargs)
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ParseCache(directory=str(tmp_path / "cache"))
+
+
+def test_cache_hit_equals_fresh_parse(cache, csv_file):
+    parse = CountingParser()
+    first = cache.read(csv_file, {'sep': ","}, parse=parse)
+    second = cache.read(csv_file, {'sep': ","}, parse=parse)
+    assert parse.calls == 1
+    pd.testing.assert_frame_equal(first, pd.read_csv(csv_file))
+    pd.testing.assert_frame_equal(second, pd.read_csv(csv_file))
+
+
+def test_subsets_are_selected_from_the_cached_table(cache, csv_file):
+    parse = CountingParser()
+    cache.read(csv_file, {'sep': ","}, parse=parse)
+    subset = cache.read(csv_file, {'sep': ",", 'usecols': ['price', 'Pos']}, parse=parse)
+    assert parse.calls == 1
+    pd.testing.assert_frame_equal(subset, pd.read_csv(csv_file, usecols=['price', 'Pos']))
+
+
+def test_other_read_options_are_parsed_again(cache, csv_file):
+    parse = CountingParser()
+    cache.read(csv_file, {'sep': ","}, parse=parse)
+    result = cache.read(csv_file, {'sep': ",", 'dtype': {'amount': float}}, parse=parse)
+    assert parse.calls == 2
+    pd.testing.assert_frame_equal(result, pd.read_csv(csv_file, dtype={'amount': float}))
+
+
+def test_modified_file_is_parsed_again(cache, csv_file, table):
+    parse = CountingParser()
+    cache.read(csv_file, {'sep': ","}, parse=parse)
+    table.iloc[:100].to_csv(csv_file, index=False)
+    # Make sure the modification time changes, also on file systems with coarse timestamps:
+    stat = os.stat(csv_file)
+    os.utime(csv_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    result = cache.read(csv_file, {'sep': ","}, parse=parse)
+    assert parse.calls == 2
+    pd.testing.assert_frame_equal(result, pd.read_csv(csv_file))
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path, table):
+    files = []
+    for idx in range(3):
+        files.append(str(tmp_path / f"data{idx}.csv"))
+        table.to_csv(files[-1], index=False)
+    cache = ParseCache(directory=str(tmp_path / "cache"), max_size="1GB")
+    for idx, filename in enumerate(files):
+        cache.read(filename, {}, parse=CountingParser())
+        # Entries are ordered by their modification time (last use), which may not change between quick reads:
+        os.utime(cache.path(cache.key(filename, {})), (1000 + idx, 1000 + idx))
+    entry_size = max(size for _, size, _ in cache.entries())
+    cache.max_size = 2 * entry_size
+    cache.evict()
+    assert cache.stats()['entries'] == 2
+    assert cache.load(files[0], {}) is None
+    assert cache.clear() == 2 and cache.entries() == []
+
+
+def test_read_file_with_cache_equals_read_file_without_cache(csv_file, tmp_path):
+    pytest.importorskip("actionista")
+    from dataframe_action_cli.dataframe_actions import read_file
+    config = {'parse_cache': {'enabled': True, 'directory': str(tmp_path / "cache")}}
+    expected = read_file(None, csv_file)
+    pd.testing.assert_frame_equal(read_file(None, csv_file, config=config), expected)
+    assert len(os.listdir(tmp_path / "cache")) == 1
+    pd.testing.assert_frame_equal(read_file(None, csv_file, config=config), expected)
+
+
+@pytest.mark.parametrize("size, expected", [
+    (1000, 1000), ("500MB", 500 * 1024**2), ("1.5 kb", 1536), ("2G", 2 * 1024**3),
+])
+def test_parse_size(size, expected):
+    assert parse_size(size) == expected
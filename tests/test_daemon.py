@@ -0,0 +1,147 @@
+# Copyright 2020, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Tests for the daemon: Running an action chain in the daemon gives the same output (and exit code)
+as running it directly, and tables loaded from the table cache equal freshly parsed tables.
+
+"""
+
+import io
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+import pytest
+
+from dataframe_action_cli.daemon import (
+    FRAME_HEADER, STDOUT_CHANNEL, STDERR_CHANNEL, SOCKET_ENV_VAR, run_request,
+)
+from dataframe_action_cli.table_cache import TableCache
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def read_frames(data):
+    """ Return {channel: concatenated data} for the frames sent by the daemon. """
+    stream, channels = io.BytesIO(data), {}
+    while True:
+        header = stream.read(FRAME_HEADER.size)
+        if not header:
+            return channels
+        channel, size = FRAME_HEADER.unpack(header)
+        channels[channel] = channels.get(channel, b'') + stream.read(size)
+
+
+def test_run_request_frames_equal_direct_output(run_cli, csv_file, tmp_path):
+    argv = ["-read-from", "data.csv", "-select-where", "name", "eq", "Peter", "-print-csv"]
+    expected = run_cli(*argv[:1], csv_file, *argv[2:])
+    wfile = io.BytesIO()
+    table_cache = TableCache()
+    request = {'argv': ["verbosity=0", *argv], 'cwd': str(tmp_path)}
+    assert run_request(request, b'', wfile, table_cache) == 0
+    assert read_frames(wfile.getvalue())[STDOUT_CHANNEL].decode() == expected
+    # The second request is answered from the table cache:
+    wfile = io.BytesIO()
+    assert run_request(request, b'', wfile, table_cache) == 0
+    assert read_frames(wfile.getvalue())[STDOUT_CHANNEL].decode() == expected
+    assert table_cache.stats()['hits'] == 1
+
+
+def test_run_request_reads_stdin_and_reports_errors(run_cli, csv_file):
+    with open(csv_file, 'rb') as fp:
+        stdin_data = fp.read()
+    wfile = io.BytesIO()
+    request = {'argv': ["verbosity=0", "-read-from", "-", "-print-csv", "limit=5"], 'cwd': os.getcwd()}
+    assert run_request(request, stdin_data, wfile, TableCache()) == 0
+    assert read_frames(wfile.getvalue())[STDOUT_CHANNEL].decode() == run_cli("-read-from", csv_file, "-print-csv",
+                                                                              "limit=5")
+    wfile = io.BytesIO()
+    request = {'argv': ["verbosity=0", "-stream", "-read-from", csv_file, "-select-rows-from", "5", "-print-csv"]}
+    assert run_request(request, b'', wfile, TableCache()) == 2
+    assert read_frames(wfile.getvalue())[STDERR_CHANNEL].decode().startswith("Error: Cannot stream")
+
+
+@pytest.fixture
+def daemon_socket():
+    """ Start a daemon in a subprocess, returning its socket path. """
+    pytest.importorskip("actionista")
+    if not hasattr(socket, 'AF_UNIX'):
+        pytest.skip("Unix sockets are not available.")
+    # Socket paths are limited to about 100 characters, so not in pytest's tmp_path:
+    directory = tempfile.mkdtemp(prefix="dac-test-")
+    socket_path = os.path.join(directory, "daemon.sock")
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([PACKAGE_ROOT] + sys.path))
+    proc = subprocess.Popen([sys.executable, "-c", "from dataframe_action_cli.daemon import serve; "
+                             f"serve(['socket={socket_path}', 'verbosity=1'])"],
+                            env=env, stderr=subprocess.PIPE)
+    try:
+        for _ in range(200):
+            if os.path.exists(socket_path) or proc.poll() is not None:
+                break
+            time.sleep(0.05)
+        assert os.path.exists(socket_path), proc.stderr.read().decode() if proc.poll() is not None else "timeout"
+        yield socket_path
+    finally:
+        proc.terminate()
+        proc.wait(timeout=10)
+        proc.stderr.close()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def run_client(socket_path, *argv):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([PACKAGE_ROOT] + sys.path), **{SOCKET_ENV_VAR: socket_path})
+    return subprocess.run([sys.executable, "-c", "from dataframe_action_cli.daemon import client_main; client_main()",
+                           "verbosity=0", *argv], env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+def test_client_output_equals_direct_output(daemon_socket, run_cli, csv_file):
+    chain = ["-read-from", csv_file, "-select-where", "amount", "lt", "20", "-sort-by", "price", "-print-csv"]
+    expected = run_cli(*chain)
+    for _ in range(2):
+        proc = run_client(daemon_socket, *chain)
+        assert proc.returncode == 0
+        assert proc.stdout.decode() == expected
+    proc = run_client(daemon_socket, "-read-from", csv_file, "-select-where", "no-such-column", "eq", "1")
+    assert proc.returncode != 0
+
+
+def test_table_cache_equals_fresh_parse(csv_file):
+    calls = []
+
+    def parse(filename, **kwargs):
+        calls.append(filename)
+        return pd.read_csv(filename, **kwargs)
+
+    cache = TableCache()
+    first, n_rows = cache.read(csv_file, {'sep': ","}, parse=parse)
+    second, _ = cache.read(csv_file, {'sep': ","}, parse=parse)
+    assert len(calls) == 1 and n_rows == len(first)
+    pd.testing.assert_frame_equal(first, pd.read_csv(csv_file))
+    pd.testing.assert_frame_equal(second, pd.read_csv(csv_file))
+    # The returned tables are copies, so changing them does not change the cached table:
+    second['amount'] = 0
+    pd.testing.assert_frame_equal(cache.read(csv_file, {'sep': ","}, parse=parse)[0], pd.read_csv(csv_file))
+    subset, n_rows = cache.read(csv_file, {'sep': ",", 'usecols': ['name', 'price'], 'nrows': 500}, parse=parse)
+    assert len(calls) == 1 and n_rows == 500
+    pd.testing.assert_frame_equal(subset, pd.read_csv(csv_file, usecols=['name', 'price'], nrows=500))
+
+
+def test_table_cache_drops_old_versions_and_evicts(csv_file, table, tmp_path):
+    cache = TableCache()
+    cache.read(csv_file, {}, parse=pd.read_csv)
+    table.iloc[:100].to_csv(csv_file, index=False)
+    stat = os.stat(csv_file)
+    os.utime(csv_file, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    df, _ = cache.read(csv_file, {}, parse=pd.read_csv)
+    assert len(df) == 100 and cache.stats()['tables'] == 1
+    other = str(tmp_path / "other.csv")
+    table.to_csv(other, index=False)
+    cache.max_size = int(pd.read_csv(other).memory_usage(index=True, deep=True).sum()) + 1
+    cache.read(other, {}, parse=pd.read_csv)
+    # Only the most recently used table fits:
+    assert cache.stats()['tables'] == 1 and cache.get(cache.key(other, {})) is not None
@@ -0,0 +1,111 @@
+# Copyright 2020, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Tests for `create-column` expressions: Compiled and vectorized evaluation gives the same values
+as evaluating the expression with `eval()` for each row (`df.iterrows()`), like before.
+
+"""
+
+import math
+
+import pandas as pd
+import pytest
+
+from dataframe_action_cli.expressions import (
+    evaluate_expression, evaluate_format_expression, compile_expression, _vectorize,
+)
+
+
+def eval_rows(df, expr, use_format=False):
+    """ Evaluate the expression like the original `create_column_pyeval`. """
+    if use_format:
+        return [eval(expr.format(**dict(row)), None, dict(row)) for _, row in df.iterrows()]
+    return [eval(expr, None, dict(row)) for _, row in df.iterrows()]
+
+
+def assert_same_values(result, expected):
+    result = list(result) if not isinstance(result, pd.Series) else result.tolist()
+    assert len(result) == len(expected)
+    for value, expected_value in zip(result, expected):
+        if isinstance(expected_value, float) and math.isnan(expected_value):
+            assert isinstance(value, float) and math.isnan(value)
+        elif isinstance(expected_value, float):
+            assert value == pytest.approx(expected_value)
+        else:
+            assert value == expected_value
+
+
+VECTORIZED = [
+    "amount * 2", "amount * price", "price / 4", "amount // 7 + amount % 7", "-amount + 3", "amount ** 2",
+    "amount < 50", "10 < amount <= 60", "price > 50",
+    "Pos[0]", "Pos[1:]", "Pos[-1]", "Pos[::-1]", "str(int(Pos[1:])) + ' ' + Pos[0]", "name + '-' + Plate",
+    "len(Plate)", "name.upper()", "name.lower().startswith('p')", "Plate.zfill(10)",
+    "abs(amount - 50)", "float(amount)", "str(amount)", "str(price)", "str(note)", "3 * 4",
+]
+
+ROW_BY_ROW = [
+    "name if amount > 50 else Pos",
+    "round(price or 0, 1)",
+    "Pos[1:].isdigit() and int(Pos[1:]) > 12",
+]
+
+
+@pytest.mark.parametrize("expr", VECTORIZED)
+def test_vectorized_expression_equals_row_by_row_eval(table, expr):
+    tree, _ = compile_expression(expr)
+    # The expression must actually be vectorized:
+    _vectorize(tree, table)
+    expected = eval_rows(table, expr)
+    result = evaluate_expression(table, expr)
+    if not isinstance(result, pd.Series):
+        # Constant expressions give a single value.
+        result = [result] * len(table)
+    assert_same_values(result, expected)
+
+
+@pytest.mark.parametrize("expr", ROW_BY_ROW)
+def test_row_by_row_expression_equals_eval(table, expr):
+    assert_same_values(evaluate_expression(table, expr), eval_rows(table, expr))
+
+
+@pytest.mark.parametrize("expr, error", [
+    ("amount / (amount - 50)", ZeroDivisionError),
+    ("Pos[2]", IndexError),
+    ("int(price)", ValueError),
+    # `note` has missing values, which are floats:
+    ("note.upper()", AttributeError),
+])
+def test_errors_are_raised_like_with_eval(table, expr, error):
+    with pytest.raises(error):
+        eval_rows(table, expr)
+    with pytest.raises(error):
+        evaluate_expression(table, expr)
+
+
+@pytest.mark.parametrize("expr", ["'{Pos}-{amount:03}'", "{amount} * 2", "'{name}'.lower() + Plate", "'constant'"])
+def test_format_expression_equals_eval(table, expr):
+    result = evaluate_format_expression(table, expr)
+    if not isinstance(result, (list, pd.Series)):
+        result = [result] * len(table)
+    assert_same_values(result, eval_rows(table, expr, use_format=True))
+
+
+def test_filtered_table_keeps_index(table):
+    subset = table.loc[table.amount > 50]
+    result = evaluate_expression(subset, "amount * price")
+    assert result.index.equals(subset.index)
+    assert_same_values(result, eval_rows(subset, "amount * price"))
+
+
+@pytest.mark.parametrize("expr", [
+    "a ** 3", "a * a", "b * 2", "b + b", "c - b", "-b - b", "a ** 2 + 1", "2 ** (a % 70)",
+])
+def test_integer_overflow_equals_python_ints(expr):
+    # Values near the int64 limit, where numpy's integer operations wrap around:
+    df = pd.DataFrame({'a': [3_000_000_000, 2, -3], 'b': [2 ** 62, 2 ** 62 - 1, -2 ** 62],
+                       'c': [-2 ** 63 + 1, 0, 2 ** 63 - 1]})
+    # The values as Python ints, which do not overflow:
+    expected = [eval(expr, None, dict(zip(df.columns, values))) for values in zip(*[df[c].tolist() for c in df])]
+    assert_same_values(evaluate_expression(df, expr), expected)
+    # Integer operations that fit in int64 are still vectorized:
+    assert str(_vectorize(compile_expression("a * 2")[0], df).dtype) == 'int64'
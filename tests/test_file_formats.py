@@ -0,0 +1,86 @@
+# Copyright 2020, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Tests for the binary table file formats (Arrow IPC streams, Feather and Parquet files),
+and for piping tables between processes as Arrow IPC streams.
+
+"""
+
+import os
+import subprocess
+import sys
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("pyarrow")
+
+from dataframe_action_cli.file_formats import (  # noqa: E402
+    TableFileWriter, read_table_file, write_table_file, iter_table_file_chunks, detect_format,
+)
+
+EXTENSIONS = ['arrows', 'feather', 'parquet']
+
+
+@pytest.mark.parametrize("ext", EXTENSIONS)
+def test_round_trip(tmp_path, table, ext):
+    filename = str(tmp_path / f"table.{ext}")
+    write_table_file(table, filename, detect_format(filename))
+    pd.testing.assert_frame_equal(read_table_file(filename, detect_format(filename)), table)
+
+
+@pytest.mark.parametrize("ext", EXTENSIONS)
+def test_read_chunks(tmp_path, table, ext):
+    filename = str(tmp_path / f"table.{ext}")
+    write_table_file(table, filename, detect_format(filename))
+    chunks = list(iter_table_file_chunks(filename, detect_format(filename), 300))
+    assert [len(chunk) for chunk in chunks] == [300] * 6 + [200]
+    pd.testing.assert_frame_equal(pd.concat(chunks), table)
+
+
+@pytest.mark.parametrize("ext", EXTENSIONS)
+def test_writer_writes_parts_to_one_file(tmp_path, table, ext):
+    filename = str(tmp_path / f"table.{ext}")
+    writer = TableFileWriter(filename, detect_format(filename))
+    for start in range(0, len(table), 700):
+        writer.write(table.iloc[start:start + 700])
+    writer.close()
+    pd.testing.assert_frame_equal(read_table_file(filename, detect_format(filename)), table)
+
+
+@pytest.mark.parametrize("ext", EXTENSIONS)
+def test_append_to_open_writer(tmp_path, table, ext):
+    filename = str(tmp_path / f"table.{ext}")
+    writers = {}
+    write_table_file(table.iloc[:1000], filename, detect_format(filename), writers=writers)
+    write_table_file(table.iloc[1000:], filename, detect_format(filename), append=True, writers=writers)
+    writers.pop(filename).close()
+    pd.testing.assert_frame_equal(read_table_file(filename, detect_format(filename)), table)
+
+
+def test_append_to_closed_file_is_refused(tmp_path, table):
+    filename = str(tmp_path / "table.parquet")
+    with pytest.raises(ValueError, match="Cannot append"):
+        write_table_file(table, filename, 'parquet', append=True)
+
+
+@pytest.mark.parametrize("ext", EXTENSIONS)
+def test_streamed_binary_output_equals_in_memory_output(run_cli, csv_file, tmp_path, ext):
+    chain = ["-select-where", "name", "eq", "Peter"]
+    expected, streamed = str(tmp_path / f"expected.{ext}"), str(tmp_path / f"streamed.{ext}")
+    run_cli("-read-from", csv_file, *chain, "-write-to", expected)
+    run_cli("chunksize=100", "-stream", "-read-from", csv_file, *chain, "-write-to", streamed)
+    fmt = detect_format(expected)
+    pd.testing.assert_frame_equal(read_table_file(streamed, fmt), read_table_file(expected, fmt))
+
+
+def test_arrow_pipe_between_processes_equals_csv_output(run_cli, csv_file):
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join([package_root] + sys.path))
+    command = [sys.executable, "-c", "from dataframe_action_cli.cli import action_cli; action_cli()", "verbosity=0"]
+    first = subprocess.run(command + ["-read-from", csv_file, "-select-where", "amount", "lt", "50",
+                                      "-print-csv", "format=arrow"], env=env, stdout=subprocess.PIPE, check=True)
+    second = subprocess.run(command + ["-read-from", "-", "-sort-by", "price", "-print-csv"], input=first.stdout,
+                            env=env, stdout=subprocess.PIPE, check=True)
+    expected = run_cli("-read-from", csv_file, "-select-where", "amount", "lt", "50", "-sort-by", "price", "-print-csv")
+    assert second.stdout.decode() == expected
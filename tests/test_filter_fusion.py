@@ -0,0 +1,92 @@
+# Copyright 2020, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Tests for filter fusion and copy-free chaining: Fused filters select the same rows as applying the filters
+one after another, and creating columns does not modify (or copy) the table it is given.
+
+"""
+
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("actionista")
+
+from dataframe_action_cli import planner  # noqa: E402
+from dataframe_action_cli.dataframe_actions import (  # noqa: E402
+    ACTIONS, create_column_dfeval, create_column_pyeval, filter_mask, select_fused,
+)
+
+FILTERS = [
+    [('select-where', ('amount', 'lt', '50'), {}), ('select-where', ('name', 'eq', 'Peter'), {})],
+    [('select-where', ('amount', 'lt', '50'), {}), ('select-query', ('price > 20 and amount % 2 == 0',), {}),
+     ('select-where', ('name', 'ne', 'Anna'), {})],
+    [('select-query', ('`name` == "Maria"',), {}), ('select-where', ('Pos', 'matches', '[A-D]1[0-9]'), {})],
+    [('select-where', ('Plate', 'glob', 'Plate-1*'), {'invert': True}), ('select-where', ('note', 'eq', 'ok'), {})],
+    [('select-where', ('amount', 'gt', '1000'), {}), ('select-query', ('price > 20',), {})],
+    [('select-where', ('note', 'eq', 'ok'), {}), ('select-where', ('note', 'contains', 'o'), {}),
+     ('select-query', ('price < 10',), {})],
+]
+
+
+def apply_filters(df, filters):
+    for action_key, action_args, action_kwargs in filters:
+        df = ACTIONS[action_key](df, *action_args, **action_kwargs)
+    return df
+
+
+@pytest.mark.parametrize("filters", FILTERS, ids=lambda filters: " | ".join(" ".join(f[1]) for f in filters))
+def test_fused_filters_equal_sequential_filters(table, filters):
+    expected = apply_filters(table, filters)
+    pd.testing.assert_frame_equal(select_fused(table, filters=filters), expected)
+    # Also for a table that is itself a row selection, with a non-default index:
+    subset = table.iloc[::3]
+    pd.testing.assert_frame_equal(select_fused(subset, filters=filters), apply_filters(subset, filters))
+    assert filter_mask(table, filters).sum() == len(expected)
+
+
+def test_fused_filters_do_not_modify_the_table(table):
+    original = table.copy()
+    select_fused(table, filters=FILTERS[1])
+    pd.testing.assert_frame_equal(table, original)
+
+
+@pytest.mark.parametrize("chain", [
+    ["-select-where", "amount", "lt", "50", "-select-query", "price > 20", "-select-where", "name", "ne", "Anna",
+     "-print-csv"],
+    ["-select-where", "amount", "lt", "50", "-create-column", "total", "amount * 2", "-select-where", "total", "gt",
+     "40", "-select-where", "note", "eq", "ok", "-print-csv"],
+], ids=["filters", "filters-create-column"])
+def test_cli_fused_output_equals_sequential_output(run_cli, csv_file, monkeypatch, chain):
+    output = run_cli("-read-from", csv_file, *chain)
+    assert run_cli("-lazy", "-read-from", csv_file, *chain) == output
+    # Without fusion, each filter takes the selected rows from the table:
+    monkeypatch.setattr(planner, 'fuse_row_filters', lambda action_groups: action_groups)
+    assert run_cli("-read-from", csv_file, *chain) == output
+
+
+def test_create_column_does_not_modify_the_table(table):
+    original = table.copy()
+    # A row selection, which pandas without copy-on-write would warn about modifying:
+    subset = table[table.amount > 50]
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        result = create_column_pyeval(subset, "total", "amount * price", config={'verbosity': 0})
+        fast = create_column_dfeval(subset, "total", "amount * price")
+        single = create_column_dfeval(subset, "total = amount * price")
+    pd.testing.assert_frame_equal(table, original)
+    assert "total" not in subset.columns
+    expected = subset.assign(total=subset.amount * subset.price)
+    for df in (result, fast, single):
+        pd.testing.assert_frame_equal(df, expected)
+    # The existing columns are shared with the table, not copied:
+    assert np.shares_memory(result['price'].to_numpy(), subset['price'].to_numpy())
+
+
+def test_create_column_fast_argument_styles(table):
+    expected = table.assign(total=table.amount * 2)
+    pd.testing.assert_frame_equal(create_column_dfeval(table, "total", "=", "amount", "*", "2"), expected)
+    with pytest.raises(RuntimeError, match="could not be recognized"):
+        create_column_dfeval(table, "total", "amount", "*")
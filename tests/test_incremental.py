@@ -0,0 +1,71 @@
+# Copyright 2020, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Tests for incremental mode: Processing appended rows gives the same output as processing the whole file.
+
+"""
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("actionista")
+
+from dataframe_action_cli.incremental import merge_sorted  # noqa: E402
+
+
+@pytest.mark.parametrize("columns, ascending, na_position", [
+    (['amount'], [True], 'last'),
+    (['price'], [False], 'last'),
+    (['price'], [True], 'first'),
+    (['name', 'price'], [True, False], 'last'),
+])
+def test_merge_sorted_equals_stable_sort_of_concatenation(table, columns, ascending, na_position):
+    def sort(df):
+        return df.sort_values(columns, ascending=ascending, na_position=na_position, kind='stable')
+    old, new = sort(table.iloc[:1500]), sort(table.iloc[1500:])
+    merged = merge_sorted(old, new, columns, ascending, na_position=na_position)
+    pd.testing.assert_frame_equal(merged, sort(pd.concat([old, new])))
+
+
+def append_rows(filename, rows):
+    with open(filename, 'a') as fp:
+        rows.to_csv(fp, header=False, index=False)
+
+
+@pytest.mark.parametrize("chain", [
+    ["-select-where", "name", "eq", "Peter"],
+    ["-select-where", "amount", "lt", "50", "-create-column", "total", "amount * 2", "-sort-by", "total::desc"],
+], ids=["filter", "filter-create-sort"])
+def test_incremental_output_equals_full_output(run_cli, tmp_path, table, chain):
+    input_fn, output_fn, expected_fn = (str(tmp_path / name) for name in ("log.csv", "out.csv", "expected.csv"))
+    table.iloc[:1200].to_csv(input_fn, index=False)
+    run_cli("-incremental", "-read-from", input_fn, *chain, "-write-to", output_fn)
+    append_rows(input_fn, table.iloc[1200:1600])
+    run_cli("-incremental", "-read-from", input_fn, *chain, "-write-to", output_fn)
+    append_rows(input_fn, table.iloc[1600:])
+    run_cli("-incremental", "-read-from", input_fn, *chain, "-write-to", output_fn)
+    run_cli("-read-from", input_fn, *chain, "-write-to", expected_fn)
+    with open(output_fn) as fp, open(expected_fn) as expected:
+        assert fp.read() == expected.read()
+
+
+@pytest.mark.parametrize("value", ["True", "1", "t"])
+def test_incremental_config_value(run_cli, tmp_path, table, value):
+    input_fn, output_fn = str(tmp_path / "log.csv"), str(tmp_path / "out.csv")
+    table.to_csv(input_fn, index=False)
+    run_cli(f"incremental={value}", "-read-from", input_fn, "-select-where", "name", "eq", "Anna",
+            "-write-to", output_fn)
+    assert len(pd.read_csv(output_fn)) == (table.name == "Anna").sum()
+    assert (tmp_path / "out.csv.incremental.json").exists()
+
+
+def test_invalid_incremental_config_value(run_cli, csv_file, tmp_path, capsys):
+    with pytest.raises(SystemExit) as exc_info:
+        run_cli("incremental=sometimes", "-read-from", csv_file, "-write-to", str(tmp_path / "out.csv"))
+    assert exc_info.value.code == 2
+    assert "Invalid `incremental` config value 'sometimes'" in capsys.readouterr().err
+
+
+def test_incremental_config_value_false(run_cli, csv_file, tmp_path):
+    run_cli("incremental=False", "-read-from", csv_file, "-write-to", str(tmp_path / "out.csv"))
+    assert not (tmp_path / "out.csv.incremental.json").exists()
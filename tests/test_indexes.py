@@ -0,0 +1,79 @@
+# Copyright 2020, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Tests for sidecar indexes: Lookups and row ranges read with an index give the same rows
+as reading and filtering the whole file.
+
+"""
+
+import os
+
+import pandas as pd
+import pytest
+
+from dataframe_action_cli.indexes import build_index, read_indexed, read_row_range, load_index_meta
+
+
+@pytest.fixture
+def indexed_file(csv_file):
+    for column in ('amount', 'name', 'price'):
+        build_index(csv_file, column, verbosity=0)
+    return csv_file
+
+
+@pytest.mark.parametrize("start, stop", [(0, 10), (5, 8), (1234, 1300), (1990, None), (1995, 3000), (2000, None)])
+def test_row_range_equals_slice_of_whole_file(indexed_file, start, stop):
+    expected = pd.read_csv(indexed_file).iloc[start:stop]
+    pd.testing.assert_frame_equal(read_row_range(indexed_file, start, stop), expected, check_index_type=False)
+
+
+def test_row_range_keeps_column_types_of_whole_file(indexed_file):
+    # The dtypes are those of the whole file, not those inferred from the few rows read:
+    pd.testing.assert_frame_equal(read_row_range(indexed_file, 0, 3), pd.read_csv(indexed_file).iloc[0:3],
+                                  check_index_type=False)
+    assert read_row_range(indexed_file, 0, 3).dtypes.equals(pd.read_csv(indexed_file).dtypes)
+
+
+def test_index_is_ignored_when_the_file_changes(indexed_file, table):
+    assert load_index_meta(indexed_file, 'amount') is not None
+    table.iloc[:100].to_csv(indexed_file, index=False)
+    assert load_index_meta(indexed_file, 'amount') is None
+    assert read_row_range(indexed_file, 5, 8) is None
+    assert read_indexed(indexed_file, [(('amount', 'eq', '5'), {})]) is None
+
+
+WHERE = [
+    [('amount', 'eq', '42')],
+    [('amount', 'in', '3,14,15,92')],
+    [('amount', 'lt', '3')],
+    [('amount', 'ge', '97')],
+    [('amount', 'gt', '20'), ('amount', 'le', '22')],
+    [('name', 'eq', 'Peter'), ('amount', 'lt', '10')],
+    [('name', 'in', 'Anna,Sofie'), ('price', 'gt', '95')],
+    [('price', 'le', '2.5')],
+    [('price', 'eq', '12.34')],
+    [('amount', 'eq', '42'), ('note', 'eq', 'ok')],
+    [('amount', 'eq', '1000')],
+]
+
+
+@pytest.mark.parametrize("where", WHERE, ids=lambda where: " & ".join(" ".join(predicate) for predicate in where))
+def test_indexed_lookup_equals_filtering_the_whole_file(indexed_file, where):
+    pytest.importorskip("actionista")
+    from dataframe_action_cli.dataframe_actions import read_file, select_where
+    expected = pd.read_csv(indexed_file)
+    for predicate in where:
+        expected = select_where(expected, *predicate)
+    where = [(predicate, {}) for predicate in where]
+    result = read_indexed(indexed_file, where)
+    assert result is not None, "The index was not used"
+    pd.testing.assert_frame_equal(read_file(None, indexed_file, where=where), expected, check_index_type=False)
+
+
+def test_cli_lookup_equals_lookup_without_index(run_cli, csv_file):
+    chain = ["-select-where", "amount", "eq", "42", "-select-where", "name", "ne", "Anna", "-print-csv"]
+    expected = run_cli("-read-from", csv_file, *chain)
+    run_cli("-build-index", csv_file, "amount")
+    assert os.path.isdir(csv_file + ".idx")
+    assert run_cli("-read-from", csv_file, *chain) == expected
+    assert run_cli("-lazy", "-read-from", csv_file, *chain) == expected
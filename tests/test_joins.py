@@ -0,0 +1,127 @@
+# Copyright 2020, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Tests for `-join-with`: Every join strategy gives the same table as `pd.merge`,
+with the rows in the order of the table, and multiple matches in the order of the other table.
+
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from dataframe_action_cli.joins import (
+    hash_join, join_tables, partitioned_join, sort_merge_join, streamed_hash_join,
+)
+
+
+@pytest.fixture
+def plates():
+    """ A table to join with on `Plate`: Some plates are missing, some are listed twice, and `name` is in both. """
+    names = [f"Plate-{idx}" for idx in range(1, 16)] + ["Plate-3", "Plate-7", "Plate-99"]
+    rng = np.random.default_rng(1)
+    return pd.DataFrame({'Plate': names, 'conc': np.round(rng.random(len(names)), 3),
+                         'name': [f"owner-{idx}" for idx in range(len(names))]})
+
+
+@pytest.fixture
+def samples(table):
+    """ A table to join with on `name` and `amount` (as floats), with some keys listed twice. """
+    rows = table.drop_duplicates(['name', 'amount']).iloc[::3]
+    samples = pd.DataFrame({'name': rows.name, 'amount': rows.amount.astype(float), 'sample': np.arange(len(rows))})
+    return pd.concat([samples, samples.iloc[:20].assign(sample=-1)], ignore_index=True)
+
+
+def expected_join(left, right, on, how):
+    return pd.merge(left, right, on=on, how=how, sort=False, suffixes=("", "_right")).reset_index(drop=True)
+
+
+def chunks(df, chunksize):
+    return (df.iloc[start:start + chunksize] for start in range(0, len(df), chunksize))
+
+
+def assert_joins_equal(result, expected):
+    # E.g. a float join column in the other table matched against an integer column:
+    pd.testing.assert_frame_equal(result, expected, check_dtype=False)
+
+
+JOINS = [('plates', ['Plate']), ('samples', ['name', 'amount'])]
+
+
+@pytest.mark.parametrize("how", ["inner", "left"])
+@pytest.mark.parametrize("right, on", JOINS, ids=[right for right, _ in JOINS])
+def test_hash_and_streamed_joins_equal_merge(request, table, how, right, on):
+    right = request.getfixturevalue(right)
+    expected = expected_join(table, right, on, how)
+    assert_joins_equal(hash_join(table, right, on, how), expected)
+    for chunksize in (1, 7, 1000):
+        assert_joins_equal(streamed_hash_join(table, chunks(right, chunksize), on, how), expected)
+
+
+@pytest.mark.parametrize("n_partitions", [2, 5, 64])
+@pytest.mark.parametrize("how", ["inner", "left"])
+@pytest.mark.parametrize("right, on", JOINS, ids=[right for right, _ in JOINS])
+def test_partitioned_join_equals_merge(request, table, tmp_path, how, right, on, n_partitions):
+    right = request.getfixturevalue(right)
+    timings = {}
+    result = partitioned_join(table, chunks(right, 7), on, how, n_partitions=n_partitions,
+                              spill_dir=str(tmp_path), timings=timings)
+    assert_joins_equal(result, expected_join(table, right, on, how))
+    assert set(timings) == {'spill', 'join'}
+    # The partition files are removed:
+    assert os.listdir(tmp_path) == ["home"]
+
+
+@pytest.mark.parametrize("how", ["inner", "left"])
+def test_sort_merge_join_equals_merge(table, plates, how):
+    left = table.sort_values("Plate", kind='stable')
+    right = plates.sort_values("Plate", kind='stable')
+    assert_joins_equal(sort_merge_join(left, right, ["Plate"], how), expected_join(left, right, ["Plate"], how))
+    left, right = table.sort_values("amount", kind='stable'), pd.DataFrame({'amount': [3, 3, 50, 200], 'x': range(4)})
+    assert_joins_equal(sort_merge_join(left, right, ["amount"], how), expected_join(left, right, ["amount"], how))
+
+
+def test_joins_with_an_empty_table(table, plates, tmp_path):
+    for how in ("inner", "left"):
+        expected = expected_join(table, plates.iloc[:0], ["Plate"], how)
+        assert_joins_equal(hash_join(table, plates.iloc[:0], ["Plate"], how), expected)
+        assert len(streamed_hash_join(table, iter([]), ["Plate"], how)) == len(expected)
+        assert len(partitioned_join(table, iter([]), ["Plate"], how, spill_dir=str(tmp_path))) == len(expected)
+
+
+@pytest.mark.parametrize("strategy, memory, right_size", [
+    (None, "1GB", 1000), ('hash', "1GB", 1000), ('hash', "1KB", 10**6), (None, "1KB", 10**6),
+    ('partitioned', "1GB", 1000),
+])
+def test_join_tables_strategies_equal_merge(table, plates, strategy, memory, right_size, tmp_path):
+    config = {'spill_dir': str(tmp_path)}
+    result = join_tables(table, lambda: plates, lambda: chunks(plates, 4), right_size, on="Plate", how="left",
+                         strategy=strategy, memory=memory, config=config)
+    assert_joins_equal(result, expected_join(table, plates, ["Plate"], "left"))
+
+
+def test_join_tables_errors(table, plates):
+    with pytest.raises(ValueError, match="requires both tables to be sorted"):
+        join_tables(table, lambda: plates, None, 1000, on="Plate", strategy="merge")
+    with pytest.raises(ValueError, match="Unsupported join"):
+        join_tables(table, lambda: plates, None, 1000, how="outer")
+    with pytest.raises(KeyError, match="conc"):
+        join_tables(table, lambda: plates, None, 1000, on="conc")
+
+
+@pytest.mark.parametrize("options", [[], ["strategy=hash", "memory=1KB"], ["strategy=partitioned"]])
+def test_cli_join_equals_merge(run_cli, csv_file, table, plates, tmp_path, options):
+    plates_fn = str(tmp_path / "plates.csv")
+    plates.to_csv(plates_fn, index=False)
+    output = run_cli("chunksize=5", "-read-from", csv_file, "-join-with", plates_fn, "on=Plate", "how=left",
+                     *options, "-print-csv")
+    expected = expected_join(table, plates, ["Plate"], "left")
+    assert output == expected.to_csv(index=False)
+    # Sorted tables are joined with a sort-merge join:
+    plates = plates.sort_values("Plate", kind='stable')
+    plates.to_csv(plates_fn, index=False)
+    output = run_cli("-read-from", csv_file, "-sort-by", "Plate", "-join-with", plates_fn, "on=Plate", "-print-csv")
+    expected = expected_join(table.sort_values("Plate", kind='stable'), plates, ["Plate"], "inner")
+    assert output == expected.to_csv(index=False)
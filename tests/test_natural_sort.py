@@ -0,0 +1,77 @@
+# Copyright 2020, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Tests for the natural sort keys: They sort like the `natsort` package, and stably.
+
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from dataframe_action_cli.natural_sort import natural_sort_order
+
+natsort = pytest.importorskip("natsort")
+
+ODD_VALUES = ["a1b10", "a1b2", "a1", "a1b", "10", "9", "", "a", "A2", "A10", "a01", "a1 ", "x-5", "x-10"]
+
+
+def natsort_order(df, columns, ascending):
+    """ Row positions sorted by `natsort.natsort_key`, with one stable sort per column, least significant first. """
+    order = list(range(len(df)))
+    for column, column_ascending in reversed(list(zip(columns, ascending))):
+        values = df[column].tolist()
+        order = sorted(order, key=lambda pos: natsort.natsort_key(values[pos]), reverse=not column_ascending)
+    return order
+
+
+@pytest.mark.parametrize("columns, ascending", [
+    (['Pos'], [True]), (['Pos'], [False]), (['Plate', 'Pos'], [True, True]), (['Plate', 'Pos'], [False, True]),
+    (['name', 'amount'], [True, False]),
+])
+def test_natural_sort_order_equals_natsort(table, columns, ascending):
+    assert list(natural_sort_order(table, columns, ascending)) == natsort_order(table, columns, ascending)
+
+
+def test_natural_sort_order_of_odd_values():
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({'value': rng.choice(ODD_VALUES, 500), 'other': rng.choice(ODD_VALUES, 500)})
+    for ascending in ([True, True], [False, True], [True, False]):
+        assert list(natural_sort_order(df, ['value', 'other'], ascending)) == natsort_order(
+            df, ['value', 'other'], ascending)
+
+
+@pytest.mark.parametrize("na_position", ['first', 'last'])
+@pytest.mark.parametrize("ascending", [True, False])
+def test_missing_values_are_placed_by_na_position(table, na_position, ascending):
+    order = natural_sort_order(table, ['note'], ascending, na_position=na_position)
+    isna = table.note.isna().to_numpy()[order]
+    n_missing = isna.sum()
+    assert isna[:n_missing].all() if na_position == 'first' else isna[-n_missing:].all()
+    present = table.dropna(subset=['note']).reset_index(drop=True)
+    expected = natsort_order(present, ['note'], [ascending])
+    assert list(table.note.iloc[order].dropna()) == list(present.note.iloc[expected])
+
+
+def test_cached_keys_give_the_same_order(table):
+    config = {}
+    first = natural_sort_order(table, ['Pos'], config=config)
+    assert config['natsort_key_cache']['Pos']
+    # A filtered table, with values already in the cache:
+    subset = table.iloc[::3]
+    np.testing.assert_array_equal(natural_sort_order(subset, ['Pos'], config=config),
+                                  natural_sort_order(subset, ['Pos']))
+    np.testing.assert_array_equal(natural_sort_order(table, ['Pos'], config=config), first)
+
+
+@pytest.mark.parametrize("reverse", [False, True])
+@pytest.mark.parametrize("column", ['Pos', 'note'])
+def test_natsort_by_single_equals_index_natsorted(table, column, reverse):
+    pytest.importorskip("actionista")
+    from dataframe_action_cli.dataframe_actions import natsort_by_single
+    table = table.assign(Pos=table.Pos.where(table.index % 50 != 7))
+    expected = table.iloc[natsort.index_natsorted(table[column], reverse=reverse)]
+    result = natsort_by_single(table, column, reverse=reverse)
+    pd.testing.assert_frame_equal(result, expected)
+    # Missing values are first, or last when reversed:
+    assert result[column].isna().iloc[-1 if reverse else 0]
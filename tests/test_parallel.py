@@ -0,0 +1,66 @@
+# Copyright 2020, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Tests for process-pool evaluation: Splitting row-wise evaluation over worker processes gives the same values,
+in the same order, as evaluating all rows in the main process.
+
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from dataframe_action_cli.expressions import evaluate_expression, evaluate_format_expression
+from dataframe_action_cli.parallel import serialize_block, deserialize_block, resolve_workers, use_parallel
+
+# Use the process pool also for the small test table:
+PARALLEL_CONFIG = {'parallel_min_rows': 100}
+
+
+@pytest.mark.parametrize("expr", [
+    "name if amount > 50 else Pos", "round(price * 3, 1) if price == price else -1.0",
+    "note.title() if isinstance(note, str) else ''",
+])
+def test_parallel_expression_equals_serial_expression(table, expr):
+    expected = evaluate_expression(table, expr, workers=1)
+    assert evaluate_expression(table, expr, workers=3, config=PARALLEL_CONFIG) == list(expected)
+
+
+def test_parallel_format_expression_equals_serial_expression(table):
+    expr = "'{Pos}-{amount:03}'"
+    expected = evaluate_format_expression(table, expr, workers=1)
+    assert evaluate_format_expression(table, expr, workers=3, config=PARALLEL_CONFIG) == expected
+
+
+def test_parallel_expression_on_filtered_table(table):
+    subset = table.loc[table.amount > 30]
+    expected = evaluate_expression(subset, "name if amount > 50 else Pos")
+    assert evaluate_expression(subset, "name if amount > 50 else Pos", workers=4, config=PARALLEL_CONFIG) == expected
+
+
+@pytest.mark.parametrize("columns", [['amount', 'price'], ['Pos', 'name'], ['note', 'amount']])
+def test_serialized_block_round_trip(table, columns):
+    block = table.iloc[100:300][columns]
+    result = deserialize_block(serialize_block(block))
+    pd.testing.assert_frame_equal(result, block.reset_index(drop=True), check_dtype=False)
+    # Missing values in text columns stay NaN:
+    for column in columns:
+        np.testing.assert_array_equal(result[column].isna(), block[column].isna())
+
+
+def test_parallel_select_where_equals_serial_select_where(table):
+    pytest.importorskip("actionista")
+    from dataframe_action_cli.dataframe_actions import select_where
+    # `in` with a string (a substring test) is applied row-by-row:
+    expected = select_where(table, 'name', 'in', "Peter Anna", workers=1)
+    result = select_where(table, 'name', 'in', "Peter Anna", workers=3, config=PARALLEL_CONFIG)
+    pd.testing.assert_frame_equal(result, expected)
+    assert set(result.name) == {'Peter', 'Anna'}
+
+
+def test_workers_and_min_rows(table):
+    assert resolve_workers(None, {}) == 1
+    assert resolve_workers("4") == 4
+    assert resolve_workers("auto") >= 1
+    assert not use_parallel(table, 4)
+    assert use_parallel(table, 4, PARALLEL_CONFIG) and not use_parallel(table, 1, PARALLEL_CONFIG)
@@ -0,0 +1,99 @@
+# Copyright 2020, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Tests for pipeline files: Shared prefixes, and re-running a pipeline from its saved results.
+
+"""
+
+import re
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("actionista")
+pytest.importorskip("yaml")
+pytest.importorskip("pyarrow")
+
+from dataframe_action_cli.pipeline import run_pipeline  # noqa: E402
+
+
+def write_pipeline(tmp_path, text):
+    filename = tmp_path / "pipeline.yaml"
+    filename.write_text(text.format(tmp=tmp_path))
+    return str(filename)
+
+
+def run_and_count(filename, capsys, *chains):
+    """ Run the pipeline, returning {'run': n, 'loaded': n, 'skipped': n} from its summary on stderr. """
+    capsys.readouterr()
+    run_pipeline(filename, *chains, config={'verbosity': 1})
+    summary = capsys.readouterr().err.strip().splitlines()[-1]
+    match = re.search(r"(\d+) run, (\d+) loaded from cache, (\d+) skipped", summary)
+    return dict(zip(('run', 'loaded', 'skipped'), map(int, match.groups())))
+
+
+LINEAR = """
+persist: true
+chains:
+  sorted: -read-from {tmp}/data.csv -select-where name eq Peter -sort-by price::desc -write-to {tmp}/out.csv
+"""
+
+BRANCHED = """
+persist: true
+chains:
+  peter: -read-from {tmp}/data.csv -select-where name eq Peter
+  by-price:
+    from: peter
+    actions: -sort-by price::desc -write-to {tmp}/by-price.csv
+  by-amount:
+    from: peter
+    actions: -sort-by amount -write-to {tmp}/by-amount.csv
+  anna: -read-from {tmp}/data.csv -select-where name eq Anna -write-to {tmp}/anna.csv
+"""
+
+
+def test_pipeline_output_equals_cli_output(run_cli, csv_file, tmp_path):
+    filename = write_pipeline(tmp_path, BRANCHED.replace("persist: true", "persist: false"))
+    run_pipeline(filename, config={'verbosity': 0})
+    expected = run_cli("-read-from", csv_file, "-select-where", "name", "eq", "Peter", "-sort-by", "price::desc",
+                       "-print-csv")
+    assert (tmp_path / "by-price.csv").read_text() == expected
+
+
+def test_rerun_only_runs_outputs(csv_file, tmp_path, capsys):
+    filename = write_pipeline(tmp_path, LINEAR)
+    assert run_and_count(filename, capsys) == {'run': 4, 'loaded': 0, 'skipped': 0}
+    expected = (tmp_path / "out.csv").read_text()
+    (tmp_path / "out.csv").unlink()
+    # The sorted rows are loaded, and the read and the filter before them are not run at all:
+    assert run_and_count(filename, capsys) == {'run': 1, 'loaded': 1, 'skipped': 2}
+    assert (tmp_path / "out.csv").read_text() == expected
+
+
+def test_rerun_after_changing_an_action_starts_from_the_parsed_file(csv_file, tmp_path, capsys):
+    filename = write_pipeline(tmp_path, LINEAR)
+    run_and_count(filename, capsys)
+    write_pipeline(tmp_path, LINEAR.replace("price::desc", "amount"))
+    # The parsed file is loaded; the filter and the (changed) sort are run:
+    assert run_and_count(filename, capsys) == {'run': 3, 'loaded': 1, 'skipped': 0}
+    expected = pd.read_csv(csv_file).query("name == 'Peter'").sort_values('amount', kind='stable')
+    pd.testing.assert_frame_equal(pd.read_csv(tmp_path / "out.csv"), expected.reset_index(drop=True))
+
+
+def test_rerun_after_changing_the_input_runs_everything(csv_file, tmp_path, table, capsys):
+    filename = write_pipeline(tmp_path, LINEAR)
+    run_and_count(filename, capsys)
+    table.iloc[:1000].to_csv(csv_file, index=False)
+    assert run_and_count(filename, capsys) == {'run': 4, 'loaded': 0, 'skipped': 0}
+    assert len(pd.read_csv(tmp_path / "out.csv")) == (table.iloc[:1000].name == "Peter").sum()
+
+
+def test_branched_rerun_gives_the_same_output(csv_file, tmp_path, capsys):
+    filename = write_pipeline(tmp_path, BRANCHED)
+    first = run_and_count(filename, capsys)
+    assert first['loaded'] == 0 and first['skipped'] == 0
+    outputs = {name: (tmp_path / name).read_text() for name in ("by-price.csv", "by-amount.csv", "anna.csv")}
+    second = run_and_count(filename, capsys)
+    # Only the three outputs are run; the shared read is skipped:
+    assert second['run'] == 3 and second['loaded'] > 0 and second['skipped'] > 0
+    assert {name: (tmp_path / name).read_text() for name in outputs} == outputs
@@ -0,0 +1,118 @@
+# Copyright 2020, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Tests for the lazy planner: Lazy plans give the same output as running the chain eagerly,
+and the rewrites made without `-lazy` do not change the output.
+
+"""
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("actionista")
+
+from dataframe_action_cli import planner  # noqa: E402
+from dataframe_action_cli.cli import run_action_chain  # noqa: E402
+from dataframe_action_cli.indexes import build_index  # noqa: E402
+
+
+CHAINS = [
+    ["-select-where", "name", "eq", "Peter", "-select-columns", "Pos", "price", "-print-csv"],
+    ["-select-where", "amount", "lt", "10", "-select-query", "price > 50", "-print-csv"],
+    ["-create-column", "total", "amount * 2", "-select-where", "total", "ge", "150", "-print-csv"],
+    ["-select-where", "name", "eq", "Anna", "-sort-by", "price::desc", "-print-csv", "limit=15"],
+    ["-print-csv", "limit=7"],
+    ["-select-rows-islice", "100", "110", "-print-csv"],
+    ["-natsort", "Pos", "-select-columns", "Pos", "amount", "-print-csv", "limit=20"],
+]
+
+
+@pytest.mark.parametrize("chain", CHAINS, ids=lambda chain: " ".join(chain))
+def test_lazy_output_equals_eager_output(run_cli, csv_file, chain):
+    eager = run_cli("-read-from", csv_file, *chain)
+    lazy = run_cli("-lazy", "-read-from", csv_file, *chain)
+    assert lazy == eager
+    assert len(eager.splitlines()) > 1
+
+
+def test_lazy_output_equals_eager_output_for_multiple_files(run_cli, tmp_path, table):
+    files = []
+    for idx in range(3):
+        files.append(str(tmp_path / f"part{idx}.csv"))
+        table.iloc[idx * 500:(idx + 1) * 500].to_csv(files[-1], index=False)
+    chain = ["-select-where", "name", "eq", "Maria", "-print-csv"]
+    assert run_cli("-lazy", "-read-from", *files, *chain) == run_cli("-read-from", *files, *chain)
+
+
+def test_explain_pushes_down_columns_and_predicates(run_cli, csv_file):
+    plan = run_cli("-explain", "-read-from", csv_file, "-select-where", "name", "eq", "Peter",
+                   "-select-columns", "Pos", "-print-csv")
+    lines = plan.splitlines()
+    assert lines[0].startswith("-read-from") and "usecols=['Pos', 'name']" in lines[0]
+    assert lines[1] == "    where: name eq Peter"
+    assert lines[2:] == ["-select-columns Pos", "-print-csv"]
+
+
+def test_push_down_limits_into_sort():
+    groups = [('read-from', ['a.csv'], {}), ('sort-by', ['x'], {}), ('select-columns', ['x'], {}),
+              ('print-csv', [], {'limit': '5'})]
+    assert planner.push_down_limits(groups)[1] == ('sort-by', ['x'], {'limit': 5})
+    # Filters between the sort and the print change which rows are printed:
+    groups[2] = ('select-where', ['x', 'gt', '1'], {})
+    assert planner.push_down_limits(groups) == groups
+
+
+def test_fuse_row_filters():
+    groups = [('read-from', ['a.csv'], {}), ('select-where', ['x', 'eq', '1'], {}),
+              ('select-query', ['y > 2'], {}), ('sort-by', ['x'], {}), ('select-where', ['z', 'eq', '3'], {})]
+    fused = planner.fuse_row_filters(groups)
+    assert fused == [groups[0], ('select-fused', [], {'filters': [
+        ('select-where', ('x', 'eq', '1'), {}), ('select-query', ('y > 2',), {})]}),
+        groups[3], ('select-where', ('z', 'eq', '3'), {})]
+
+
+@pytest.fixture
+def mixed_types_file(tmp_path, table):
+    """ A file where the type of `code` (zero-padded numbers, and text in the last row) depends on which rows
+    are parsed, and an index on `amount`. """
+    table = table.assign(code=[f"{idx:05}" for idx in range(len(table))])
+    filename = str(tmp_path / "mixed.csv")
+    table.to_csv(filename, index=False)
+    with open(filename, 'a') as fp:
+        fp.write("A1,Plate-1,Peter,5,1.0,ok,x\n")
+    build_index(filename, 'amount', verbosity=0)
+    return filename
+
+
+EAGER_REWRITES = [
+    ('merge_read_actions', lambda groups, config: planner.merge_read_actions(groups),
+     lambda fn: [('read-from', [fn], {}), ('read-from', [fn], {}), ('select-where', ['name', 'eq', 'Peter'], {})]),
+    ('push_down_limits', lambda groups, config: planner.push_down_limits(groups),
+     lambda fn: [('read-from', [fn], {}), ('sort-by', ['price::desc'], {}), ('print-csv', [], {'limit': '10'})]),
+    ('push_down_indexed_predicates[lookup]', planner.push_down_indexed_predicates,
+     lambda fn: [('read-from', [fn], {}), ('select-where', ['amount', 'eq', '5'], {})]),
+    # Most rows match, so the index is not used, and the file is read without it:
+    ('push_down_indexed_predicates[most rows]', planner.push_down_indexed_predicates,
+     lambda fn: [('read-from', [fn], {}), ('select-where', ['amount', 'ge', '10'], {})]),
+    ('push_down_row_ranges', planner.push_down_row_ranges,
+     lambda fn: [('read-from', [fn], {}), ('select-rows-islice', ['5', '20'], {})]),
+    ('fuse_row_filters', lambda groups, config: planner.fuse_row_filters(groups),
+     lambda fn: [('read-from', [fn], {}), ('select-where', ['amount', 'lt', '50'], {}),
+                 ('select-query', ['price > 20'], {}), ('select-where', ['name', 'ne', 'Anna'], {})]),
+]
+
+
+@pytest.mark.parametrize("rewrite, make_groups", [(rewrite, make_groups) for _, rewrite, make_groups in EAGER_REWRITES],
+                         ids=[name for name, _, _ in EAGER_REWRITES])
+def test_eager_rewrites_do_not_change_output(capsys, mixed_types_file, rewrite, make_groups):
+    # Small chunks, so reading chunk-by-chunk would parse `code` as integers in all but the last chunk:
+    config = {'verbosity': 0, 'chunksize': 100}
+    groups = make_groups(mixed_types_file)
+    rewritten = rewrite(groups, config=config)
+    assert rewritten != groups
+    expected = run_action_chain(groups, config=dict(config))
+    expected_output = capsys.readouterr().out
+    result = run_action_chain(rewritten, config=dict(config))
+    # With a limit pushed into the sort, only the printed rows are kept:
+    pd.testing.assert_frame_equal(result, expected.iloc[:len(result)])
+    assert capsys.readouterr().out == expected_output
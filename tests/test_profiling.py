@@ -0,0 +1,60 @@
+# Copyright 2020, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Tests for `-profile`: Profiling does not change the output, and records the rows going in and out of each action.
+
+"""
+
+import json
+
+import pytest
+
+pytest.importorskip("actionista")
+
+CHAIN = ["-select-where", "name", "eq", "Peter", "-sort-by", "price", "-print-csv"]
+
+
+def read_records(filename):
+    with open(filename) as fp:
+        return [json.loads(line) for line in fp]
+
+
+def test_profiled_output_equals_output(run_cli, csv_file, tmp_path, table):
+    expected = run_cli("-read-from", csv_file, *CHAIN)
+    profile_fn = str(tmp_path / "profile.jsonl")
+    assert run_cli("-profile", f"output={profile_fn}", "-read-from", csv_file, *CHAIN) == expected
+    records = read_records(profile_fn)
+    n_peter = (table.name == "Peter").sum()
+    assert [record['action'] for record in records] == ['read-from', 'select-where', 'sort-by', 'print-csv']
+    assert [(record['rows_in'], record['rows_out']) for record in records] == [
+        (0, len(table)), (len(table), n_peter), (n_peter, n_peter), (n_peter, n_peter)]
+    assert all(record['calls'] == 1 and record['wall_s'] >= 0 for record in records)
+
+
+def test_streamed_profile_sums_chunks(run_cli, csv_file, tmp_path, table):
+    chain = ["-select-where", "name", "eq", "Peter", "-print-csv"]
+    expected = run_cli("-read-from", csv_file, *chain)
+    profile_fn = str(tmp_path / "profile.jsonl")
+    assert run_cli("chunksize=500", "-profile", f"output={profile_fn}", "-stream", "-read-from", csv_file,
+                   *chain) == expected
+    read, select, _ = read_records(profile_fn)
+    assert read['rows_out'] == select['rows_in'] == len(table)
+    assert select['calls'] == 4 and select['rows_out'] == (table.name == "Peter").sum()
+
+
+def test_profile_table_and_cprofile_on_stderr(run_cli, csv_file, capsys):
+    expected = run_cli("-read-from", csv_file, *CHAIN)
+    capsys.readouterr()
+    from dataframe_action_cli.cli import action_cli
+    action_cli(["verbosity=0", "-profile", "cprofile=sort-by", "-read-from", csv_file, *CHAIN])
+    captured = capsys.readouterr()
+    assert captured.out == expected
+    assert "Profile:" in captured.err and "-select-where" in captured.err
+    assert "cProfile of -sort-by:" in captured.err
+
+
+def test_cprofile_stats_are_saved_next_to_the_output(run_cli, csv_file, tmp_path):
+    profile_fn = tmp_path / "profile.txt"
+    run_cli("-profile", f"output={profile_fn}", "cprofile=sort-by", "-read-from", csv_file, *CHAIN)
+    assert "-sort-by" in profile_fn.read_text()
+    assert (tmp_path / "profile.prof").stat().st_size > 0
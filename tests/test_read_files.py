@@ -0,0 +1,75 @@
+# Copyright 2020, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Tests for reading multiple files: Reading files in parallel gives the same table as reading them
+one at a time and concatenating them, like consecutive `-read-from` actions did before.
+
+"""
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("actionista")
+
+from dataframe_action_cli.dataframe_actions import read_file, select_where  # noqa: E402
+
+
+@pytest.fixture
+def part_files(tmp_path, table):
+    """ The table split into five csv files, named so their sorted order is the order of the rows. """
+    (tmp_path / "shards").mkdir()
+    files = []
+    for idx in range(5):
+        files.append(str(tmp_path / "shards" / f"part{idx}.csv"))
+        table.iloc[idx * 400:(idx + 1) * 400].to_csv(files[-1], index=False)
+    return files
+
+
+def concat_sequential(files, **kwargs):
+    """ Read the files one at a time, appending each to the data read so far (the original `read_file`). """
+    df = None
+    for filename in files:
+        df2 = pd.read_csv(filename, **kwargs)
+        df = df2 if df is None or len(df) == 0 else pd.concat([df, df2], join='outer', ignore_index=True)
+    return df
+
+
+@pytest.mark.parametrize("workers, pool", [(1, None), (3, 'thread'), (5, 'process')])
+def test_parallel_read_equals_sequential_read(part_files, workers, pool):
+    result = read_file(None, *part_files, workers=workers, pool=pool, config={'verbosity': 0})
+    pd.testing.assert_frame_equal(result, concat_sequential(part_files))
+
+
+def test_glob_pattern_reads_files_in_sorted_order(part_files, tmp_path):
+    result = read_file(None, str(tmp_path / "shards" / "part*.csv"), config={'verbosity': 0})
+    pd.testing.assert_frame_equal(result, concat_sequential(part_files))
+
+
+def test_missing_glob_match_raises(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        read_file(None, str(tmp_path / "no-such-*.csv"))
+
+
+def test_files_with_different_columns_are_joined(part_files, tmp_path, table):
+    extra = str(tmp_path / "extra.csv")
+    table.iloc[:50].assign(extra=1).drop(columns=['note']).to_csv(extra, index=False)
+    files = part_files[:2] + [extra]
+    pd.testing.assert_frame_equal(read_file(None, *files, workers=3), concat_sequential(files))
+
+
+def test_appending_to_existing_data(part_files):
+    existing = pd.read_csv(part_files[0])
+    result = read_file(existing, *part_files[1:], workers=2)
+    pd.testing.assert_frame_equal(result, concat_sequential(part_files))
+
+
+def test_pushed_down_predicate_keeps_row_numbers(part_files):
+    where = [(('name', 'eq', 'Peter'), {})]
+    result = read_file(None, *part_files, where=where, workers=3)
+    full = concat_sequential(part_files)
+    pd.testing.assert_frame_equal(result, select_where(full, 'name', 'eq', 'Peter'))
+
+
+def test_consecutive_reads_equal_one_read(run_cli, part_files):
+    consecutive = run_cli(*[arg for filename in part_files for arg in ("-read-from", filename)], "-print-csv")
+    assert run_cli("-read-from", *part_files, "-print-csv") == consecutive
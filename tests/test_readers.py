@@ -0,0 +1,43 @@
+# Copyright 2020, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Tests for the csv reader engines: The pyarrow engine gives the same DataFrame as pandas.
+
+"""
+
+import pandas as pd
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+
+from dataframe_action_cli.readers import read_csv, iter_csv_chunks  # noqa: E402
+
+
+@pytest.mark.parametrize("ext", ["csv", "csv.gz"])
+def test_pyarrow_engine_equals_pandas_engine(tmp_path, table, ext):
+    filename = str(tmp_path / f"data.{ext}")
+    table.to_csv(filename, index=False)
+    expected = read_csv(filename, engine='pandas')
+    pd.testing.assert_frame_equal(read_csv(filename, engine='pyarrow', block_size=4096, threads=2), expected)
+    pd.testing.assert_frame_equal(read_csv(filename, engine='pyarrow', usecols=['name', 'price'], nrows=300),
+                                  expected[['name', 'price']].iloc[:300])
+
+
+def test_pyarrow_chunks_equal_pandas_chunks(csv_file):
+    expected = list(iter_csv_chunks(csv_file, 300, engine='pandas'))
+    chunks = list(iter_csv_chunks(csv_file, 300, engine='pyarrow', block_size=4096))
+    assert [len(chunk) for chunk in chunks] == [len(chunk) for chunk in expected]
+    pd.testing.assert_frame_equal(pd.concat(chunks), pd.concat(expected))
+
+
+def test_threads_do_not_change_arrow_cpu_count(csv_file):
+    cpu_count = pa.cpu_count()
+    threads = 2 if cpu_count != 2 else 3
+    read_csv(csv_file, engine='pyarrow', threads=threads)
+    assert pa.cpu_count() == cpu_count
+    chunks = iter_csv_chunks(csv_file, 300, engine='pyarrow', threads=threads)
+    next(chunks)
+    assert pa.cpu_count() == threads
+    # The count is restored when the reader is closed before the end of the file:
+    chunks.close()
+    assert pa.cpu_count() == cpu_count
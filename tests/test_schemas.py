@@ -0,0 +1,77 @@
+# Copyright 2020, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Tests for schemas and compaction: Compacted tables and tables read with a schema give the same output
+as tables read without them.
+
+"""
+
+import pandas as pd
+import pytest
+
+from dataframe_action_cli.schemas import apply_schema, compact_dataframe, unify_categories, get_schema
+
+
+def test_compacted_table_has_the_same_values(table):
+    compacted = compact_dataframe(table, verbosity=0)
+    assert compacted.memory_usage(deep=True).sum() < table.memory_usage(deep=True).sum()
+    assert str(compacted.amount.dtype) == 'int8' and str(compacted.price.dtype) == 'float64'
+    assert isinstance(compacted.name.dtype, pd.CategoricalDtype)
+    assert compacted.to_csv(index=False) == table.to_csv(index=False)
+    # Only floats that survive the round trip are downcast:
+    assert str(compact_dataframe(table.assign(price=table.price * 4 // 1 / 4), verbosity=0).price.dtype) == 'float32'
+
+
+def test_unified_categories_concatenate_like_the_original(table):
+    parts = [compact_dataframe(table.iloc[start:start + 500], verbosity=0) for start in range(0, len(table), 500)]
+    concatenated = pd.concat(unify_categories(parts))
+    assert isinstance(concatenated.Plate.dtype, pd.CategoricalDtype)
+    assert list(concatenated.Plate.cat.categories) == sorted(table.Plate.unique())
+    assert concatenated.to_csv(index=False) == table.to_csv(index=False)
+
+
+def test_schema_is_merged_into_read_options():
+    config = {'schemas': {'other/*.csv': {'skip': ['x']},
+                          'plates/*.csv': {'dtype': {'amount': 'float32'}, 'categories': ['name'],
+                                           'parse_dates': ['date'], 'skip': ['note']}}}
+    assert get_schema("data.csv", config) is None
+    read_kwargs = apply_schema("plates/data.csv", {'dtype': {'amount': 'int64'}}, config)
+    assert read_kwargs['dtype'] == {'amount': 'int64', 'name': 'category'}
+    assert read_kwargs['parse_dates'] == ['date']
+    assert not read_kwargs['usecols']('note') and read_kwargs['usecols']('amount')
+    # Date columns that are not read are not parsed:
+    read_kwargs = apply_schema("plates/data.csv", {'usecols': ['amount']}, config)
+    assert 'parse_dates' not in read_kwargs
+    with pytest.raises(ValueError, match="Unknown key"):
+        get_schema("data.csv", {'schemas': {'*.csv': {'types': {}}}})
+
+
+@pytest.fixture
+def schema_config():
+    return {'verbosity': 0, 'schemas': {'*.csv': {
+        'dtype': {'amount': 'int16'}, 'categories': ['name', 'Plate'], 'skip': ['note']}}}
+
+
+def test_read_with_schema_equals_read_with_options(csv_file, schema_config):
+    pytest.importorskip("actionista")
+    from dataframe_action_cli.dataframe_actions import read_file
+    result = read_file(None, csv_file, config=schema_config)
+    expected = pd.read_csv(csv_file, usecols=lambda column: column != 'note',
+                           dtype={'amount': 'int16', 'name': 'category', 'Plate': 'category'})
+    pd.testing.assert_frame_equal(result, expected)
+
+
+@pytest.mark.parametrize("chain", [
+    ["-select-where", "name", "eq", "Peter", "-print-csv"],
+    ["-sort-by", "name", "Plate", "price::desc", "-print-csv"],
+    ["-natsort", "Plate", "Pos", "-print-csv", "limit=50"],
+    ["-group-by", "Plate", "-aggregate", "amount:sum", "price:mean", "-print-csv"],
+], ids=lambda chain: " ".join(chain[:2]))
+def test_compacted_output_equals_output(run_cli, tmp_path, table, chain):
+    files = []
+    for idx in range(2):
+        files.append(str(tmp_path / f"part{idx}.csv"))
+        table.iloc[idx * 1000:(idx + 1) * 1000].to_csv(files[-1], index=False)
+    expected = run_cli("-read-from", *files, *chain)
+    assert run_cli("-read-from", *files, "compact=True", *chain) == expected
+    assert run_cli("auto_compact=True", "-read-from", *files, *chain) == expected
@@ -0,0 +1,116 @@
+# Copyright 2020, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Tests for sorting: Sorting with a limit (top-k) gives the first rows of the fully sorted table,
+and the external merge sort gives the same result as sorting in memory.
+
+"""
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("actionista")
+
+from dataframe_action_cli.dataframe_actions import sort_by  # noqa: E402
+
+
+@pytest.mark.parametrize("columns", [
+    ["price"], ["price::desc"], ["amount", "name"], ["amount::desc", "price"], ["name", "price::desc"],
+])
+@pytest.mark.parametrize("limit", [1, 10, 1990, 5000])
+@pytest.mark.parametrize("na_position", ['last', 'first'])
+def test_top_k_equals_full_sort_then_head(table, columns, limit, na_position):
+    # About 40 rows have a missing price, which fill the first 10 rows with na_position=first:
+    expected = sort_by(table, *columns, na_position=na_position).head(limit)
+    assert sort_by(table, *columns, na_position=na_position, limit=limit).equals(expected)
+
+
+def test_sort_then_print_limit_equals_full_sort_then_head(run_cli, csv_file):
+    full = run_cli("-read-from", csv_file, "-sort-by", "amount::desc", "price", "-print-csv")
+    expected = "".join(full.splitlines(keepends=True)[:13])
+    assert run_cli("-read-from", csv_file, "-sort-by", "amount::desc", "price", "-print-csv", "limit=12") == expected
+    assert run_cli("-lazy", "-read-from", csv_file, "-sort-by", "amount::desc", "price", "-print-csv",
+                   "limit=12") == expected
+
+
+def test_lazy_sort_with_limit_is_not_streamed(run_cli, csv_file):
+    plan = run_cli("-explain", "-lazy", "-read-from", csv_file, "-sort-by", "price::desc", "-print-csv", "limit=3")
+    assert plan.splitlines()[1] == "-sort-by price::desc limit=3"
+    assert "(streamed chunk-by-chunk)" not in plan
+
+
+@pytest.mark.parametrize("columns, ascending", [
+    (['price'], [True]), (['price'], [False]), (['name', 'amount'], [True, False]), (['amount'], [True]),
+    # Few distinct keys, so most rows are tied with rows in other runs:
+    (['name'], [False]),
+])
+@pytest.mark.parametrize("limit", [None, 30])
+def test_external_sort_equals_sort_values(monkeypatch, table, columns, ascending, limit):
+    pytest.importorskip("pyarrow")
+    from dataframe_action_cli import external_sort
+    # Small batches, so rows are loaded from each run several times while merging:
+    monkeypatch.setattr(external_sort, 'RUN_BATCH_ROWS', 16)
+    sorter = external_sort.ExternalSort(
+        lambda df: df.sort_values(columns, ascending=ascending, kind='stable'), limit=limit, memory="20KB")
+    for start in range(0, len(table), 100):
+        sorter.add(table.iloc[start:start + 100])
+    assert len(sorter.runs) > 5
+    result = pd.concat(list(sorter.result_chunks()))
+    expected = table.sort_values(columns, ascending=ascending, kind='stable')
+    pd.testing.assert_frame_equal(result, expected if limit is None else expected.iloc[:limit], check_dtype=False)
+
+
+@pytest.mark.parametrize("chain", [
+    ["-sort-by", "name", "price::desc", "-print-csv"],
+    ["-sort-by", "amount::desc", "-select-columns", "Pos", "amount", "-print-csv", "limit=40"],
+    ["-natsort", "Pos", "Plate::desc", "-print-csv"],
+], ids=lambda chain: " ".join(chain))
+@pytest.mark.parametrize("mode", ["-lazy", "-stream"])
+def test_external_sort_output_equals_in_memory_output(run_cli, csv_file, chain, mode):
+    pytest.importorskip("pyarrow")
+    expected = run_cli("-read-from", csv_file, *chain)
+    # The input is larger than the memory budget, so the sort is spilled to disk:
+    assert run_cli("sort_memory=20KB", "chunksize=100", mode, "-read-from", csv_file, *chain) == expected
+
+
+def test_external_sort_is_stable_for_any_sort_kind(run_cli, csv_file):
+    pytest.importorskip("pyarrow")
+    chain = ["-sort-by", "name", "kind=quicksort", "-print-csv"]
+    expected = run_cli("-read-from", csv_file, "-sort-by", "name", "-print-csv")
+    assert run_cli("sort_memory=20KB", "chunksize=100", "-stream", "-read-from", csv_file, *chain) == expected
+
+
+@pytest.fixture
+def mixed_types_file(tmp_path, table):
+    """ A file where the column types of a chunk depend on which rows are in it:
+    zero-padded codes with text in the last row, integers and booleans with missing values in the last chunk. """
+    n_rows = len(table)
+    table = table.assign(code=[f"{idx:05}" for idx in range(n_rows)], count=table.amount,
+                         flag=table.amount > 50)
+    table['count'] = table['count'].astype(object).where(table.index < n_rows - 50)
+    table['flag'] = table['flag'].astype(object).where(table.index < n_rows - 50)
+    table.loc[n_rows - 1, 'code'] = "x"
+    filename = str(tmp_path / "mixed.csv")
+    table.to_csv(filename, index=False)
+    return filename
+
+
+def test_exact_types_chunks_equal_whole_file(mixed_types_file):
+    from dataframe_action_cli.dataframe_actions import iter_file_chunks
+    chunks = list(iter_file_chunks(mixed_types_file, chunksize=100, exact_types=True))
+    pd.testing.assert_frame_equal(pd.concat(chunks), pd.read_csv(mixed_types_file))
+    assert str(chunks[0]['count'].dtype) == 'float64' and chunks[0]['code'].iloc[0] == "00000"
+    # Without `exact_types`, the types are inferred for each chunk:
+    assert str(next(iter_file_chunks(mixed_types_file, chunksize=100))['count'].dtype) == 'int64'
+
+
+def test_large_input_is_sorted_externally_without_lazy(run_cli, mixed_types_file, monkeypatch):
+    pytest.importorskip("pyarrow")
+    from dataframe_action_cli import external_sort
+    chain = ["-sort-by", "amount", "-print-csv"]
+    expected = run_cli("-read-from", mixed_types_file, *chain)
+    runs = []
+    monkeypatch.setattr(external_sort.ExternalSort, '_write_run',
+                        lambda self, write_run=external_sort.ExternalSort._write_run: runs.append(write_run(self)))
+    assert run_cli("sort_memory=20KB", "chunksize=100", "-read-from", mixed_types_file, *chain) == expected
+    assert len(runs) > 5
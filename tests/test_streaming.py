@@ -0,0 +1,70 @@
+# Copyright 2020, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Tests for streaming mode: Streaming chunk-by-chunk gives the same output as running the chain in memory.
+
+"""
+
+import pandas as pd
+import pytest
+
+pytest.importorskip("actionista")
+
+
+CHAINS = [
+    ["-select-where", "name", "eq", "Peter", "-print-csv"],
+    ["-select-query", "amount < 30 and price > 10", "-select-columns", "Pos", "amount", "-print-csv"],
+    ["-create-column", "total", "amount * price", "-select-where", "total", "gt", "1000", "-print-csv"],
+    ["-select-where", "name", "eq", "Anna", "-print-csv", "limit=25"],
+]
+
+
+@pytest.mark.parametrize("chain", CHAINS, ids=lambda chain: " ".join(chain))
+def test_streamed_output_equals_in_memory_output(run_cli, csv_file, chain):
+    expected = run_cli("-read-from", csv_file, *chain)
+    # Small chunks, so the output is written in many parts:
+    assert run_cli("chunksize=150", "-stream", "-read-from", csv_file, *chain) == expected
+
+
+def test_streamed_write_equals_in_memory_write(run_cli, csv_file, tmp_path):
+    chain = ["-select-where", "amount", "lt", "50"]
+    run_cli("-read-from", csv_file, *chain, "-write-to", str(tmp_path / "expected.csv"))
+    run_cli("chunksize=100", "-stream", "-read-from", csv_file, *chain, "-write-to", str(tmp_path / "streamed.csv"))
+    assert (tmp_path / "streamed.csv").read_text() == (tmp_path / "expected.csv").read_text()
+
+
+def test_streaming_multiple_files(run_cli, table, tmp_path):
+    files = []
+    for idx in range(3):
+        files.append(str(tmp_path / f"part{idx}.csv"))
+        table.iloc[idx * 400:(idx + 1) * 400].to_csv(files[-1], index=False)
+    chain = ["-select-where", "name", "ne", "Peter", "-print-csv"]
+    assert run_cli("chunksize=150", "-stream", "-read-from", *files, *chain) == run_cli("-read-from", *files, *chain)
+
+
+def test_streaming_refuses_actions_that_need_the_whole_table(run_cli, csv_file, capsys):
+    with pytest.raises(SystemExit) as exc_info:
+        run_cli("-stream", "-read-from", csv_file, "-select-rows-from", "5", "-print-csv")
+    assert exc_info.value.code != 0
+    captured = capsys.readouterr()
+    assert captured.out == ""
+    assert captured.err.strip().splitlines() == [
+        "Error: Cannot stream action chain: The action(s) -select-rows-from need the whole table, "
+        "and must be run without `-stream`."]
+
+
+@pytest.mark.parametrize("start, stop", [(5, 8), (95, 205), (1990, 2500)])
+def test_streamed_row_range_equals_in_memory_output(run_cli, csv_file, start, stop):
+    from dataframe_action_cli.indexes import build_index
+    # With an index, the row range is read by `-read-from`, which is then streamed:
+    build_index(csv_file, 'amount', verbosity=0)
+    chain = ["-select-rows-islice", str(start), str(stop), "-print-csv"]
+    expected = run_cli("-read-from", csv_file, *chain)
+    assert run_cli("chunksize=100", "-stream", "-read-from", csv_file, *chain) == expected
+
+
+def test_iter_file_chunks_stops_after_the_row_range(csv_file):
+    from dataframe_action_cli.dataframe_actions import iter_file_chunks
+    chunks = list(iter_file_chunks(csv_file, chunksize=100, row_range=(150, 420)))
+    assert len(chunks) == 5
+    assert list(pd.concat(chunks).index) == list(range(150, 420))
@@ -0,0 +1,78 @@
+# Copyright 2020, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Tests for the vectorized `select-where` operators: They give the same rows as comparing row-by-row.
+
+"""
+
+import fnmatch
+import operator
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from dataframe_action_cli.vectorized_operators import vectorized_mask, coerce_value, NotVectorizable
+
+# Row-by-row reference implementations, comparing each value with the comparison value converted to the column type:
+ROW_OPERATORS = {
+    'eq': operator.eq, 'ne': operator.ne, 'lt': operator.lt, 'le': operator.le, 'gt': operator.gt, 'ge': operator.ge,
+    'matches': lambda a, b: re.match(b, a) is not None,
+    'imatches': lambda a, b: re.match(b, a, re.IGNORECASE) is not None,
+    'search': lambda a, b: re.search(b, a) is not None,
+    'glob': fnmatch.fnmatchcase,
+    'iglob': lambda a, b: fnmatch.fnmatchcase(a.lower(), b.lower()),
+    'contains': lambda a, b: b in a,
+    'startswith': str.startswith,
+    'endswith': str.endswith,
+}
+
+
+def row_mask(series, method, value):
+    """ Evaluate the operator row-by-row; missing values never match (except for 'ne'). """
+    value = coerce_value(series, value)
+    return np.array([(method == 'ne') if pd.isna(row_val) else bool(ROW_OPERATORS[method](row_val, value))
+                     for row_val in series.tolist()], dtype=bool)
+
+
+@pytest.mark.parametrize("column, method, value", [
+    ('name', 'eq', 'Peter'), ('name', 'ne', 'Peter'), ('name', 'lt', 'Michael'), ('name', 'ge', 'Peter'),
+    ('amount', 'eq', '42'), ('amount', 'lt', '50'), ('amount', 'ge', '99'), ('amount', 'gt', '49.5'),
+    ('price', 'le', '10.5'), ('price', 'gt', '90'), ('price', 'eq', '5'),
+    ('Pos', 'matches', r'[A-C]1\d'), ('Pos', 'imatches', r'a\d$'), ('note', 'search', 'sig'),
+    ('Plate', 'glob', 'Plate-1?'), ('Plate', 'iglob', 'plate-2*'), ('note', 'glob', '*o*'),
+    ('note', 'contains', 'e'), ('Pos', 'startswith', 'P'), ('Plate', 'endswith', '-1'),
+])
+def test_vectorized_mask_equals_row_by_row(table, column, method, value):
+    mask = vectorized_mask(table[column], method, value)
+    np.testing.assert_array_equal(mask, row_mask(table[column], method, value))
+    assert 0 < mask.sum() < len(table) or (method, value) == ('eq', '5')
+
+
+def test_isin_equals_row_by_row(table):
+    mask = vectorized_mask(table.amount, 'in', {'3', '14', '15', '92'})
+    np.testing.assert_array_equal(mask, table.amount.apply(lambda amount: amount in {3, 14, 15, 92}).to_numpy())
+    mask = vectorized_mask(table.name, 'in', {'Anna', 'Sofie', 'Bob'})
+    np.testing.assert_array_equal(mask, table.name.apply(lambda name: name in {'Anna', 'Sofie', 'Bob'}).to_numpy())
+
+
+@pytest.mark.parametrize("series, method, value", [
+    (pd.Series([1, 2, 3]), 'eq', 'abc'),
+    (pd.Series([1.5, 2.5]), 'matches', '1'),
+    (pd.Series(['a', 'b']), 'in', 'abc'),
+    (pd.Series(['a', 'b']), 'no-such-operator', 'a'),
+])
+def test_not_vectorizable(series, method, value):
+    # These are applied row-by-row instead, like before.
+    with pytest.raises(NotVectorizable):
+        vectorized_mask(series, method, value)
+
+
+def test_select_where_equals_row_by_row_selection(table):
+    pytest.importorskip("actionista")
+    from dataframe_action_cli.dataframe_actions import select_where
+    expected = table.loc[row_mask(table.Plate, 'glob', 'Plate-1*')]
+    pd.testing.assert_frame_equal(select_where(table, 'Plate', 'glob', 'Plate-1*'), expected)
+    pd.testing.assert_frame_equal(select_where(table, 'Plate', 'glob', 'Plate-1*', invert=True),
+                                  table.loc[~row_mask(table.Plate, 'glob', 'Plate-1*')])
@@ -0,0 +1,78 @@
+# Copyright 2020, Rasmus Sorensen <rasmusscholer@gmail.com>
+"""
+
+Tests for the csv writers: Chunked, compressed and pyarrow-written output reads back as the same table
+as a plain `DataFrame.to_csv` file.
+
+"""
+
+import gzip
+import io
+
+import pandas as pd
+import pytest
+
+from dataframe_action_cli.writers import infer_compression, write_csv_chunks
+
+
+@pytest.mark.parametrize("chunksize", [1, 7, 500, 2000, 100000])
+@pytest.mark.parametrize("index", [False, True])
+def test_chunked_output_equals_to_csv(table, tmp_path, chunksize, index):
+    filename = tmp_path / "out.csv"
+    write_csv_chunks(table, str(filename), index=index, index_label="row" if index else None, chunksize=chunksize)
+    assert filename.read_text() == table.to_csv(index=index, index_label="row" if index else None)
+
+
+def test_empty_table_gets_a_header(table, tmp_path):
+    filename = tmp_path / "out.csv"
+    write_csv_chunks(table.iloc[:0], str(filename), chunksize=10)
+    assert filename.read_text() == table.iloc[:0].to_csv(index=False)
+
+
+@pytest.mark.parametrize("extension", [".gz", ".bz2", ".xz", ".zst"])
+def test_compressed_output_equals_plain_output(table, tmp_path, extension):
+    if extension == ".zst":
+        pytest.importorskip("zstandard")
+    filename = tmp_path / f"out.csv{extension}"
+    write_csv_chunks(table, str(filename), chunksize=300)
+    # Appended chunks are new compressed streams, read as one continued file:
+    write_csv_chunks(table, str(filename), header=False, append=True, chunksize=300)
+    expected = pd.concat([table, table], ignore_index=True)
+    pd.testing.assert_frame_equal(pd.read_csv(filename), pd.read_csv(io.StringIO(expected.to_csv(index=False))))
+
+
+def test_compression_can_be_overridden(table, tmp_path):
+    filename = tmp_path / "out.csv"
+    write_csv_chunks(table, str(filename), compression="gzip")
+    with gzip.open(filename, 'rt', newline='') as fp:
+        assert fp.read() == table.to_csv(index=False)
+    assert infer_compression("out.csv.gz", "none") is None
+    with pytest.raises(ValueError, match="Unsupported compression"):
+        write_csv_chunks(table, str(filename), compression="zip")
+
+
+@pytest.mark.parametrize("index", [False, True])
+def test_pyarrow_output_reads_back_as_pandas_output(table, tmp_path, index):
+    pytest.importorskip("pyarrow")
+    pandas_fn, pyarrow_fn = str(tmp_path / "pandas.csv"), str(tmp_path / "pyarrow.csv.gz")
+    write_csv_chunks(table, pandas_fn, index=index, chunksize=300)
+    write_csv_chunks(table, pyarrow_fn, index=index, engine="pyarrow", chunksize=300)
+    pd.testing.assert_frame_equal(pd.read_csv(pyarrow_fn), pd.read_csv(pandas_fn))
+
+
+def test_unknown_engine_is_an_error(table, tmp_path):
+    with pytest.raises(ValueError, match="Unknown write engine"):
+        write_csv_chunks(table, str(tmp_path / "out.csv"), engine="polars")
+
+
+def test_cli_compressed_output_equals_output(run_cli, csv_file, tmp_path):
+    chain = ["-read-from", csv_file, "-select-where", "amount", "lt", "50"]
+    expected = run_cli(*chain, "-print-csv")
+    run_cli("write_chunksize=100", *chain, "-write-to", str(tmp_path / "out.csv.gz"))
+    with gzip.open(tmp_path / "out.csv.gz", 'rt', newline='') as fp:
+        assert fp.read() == expected
+    assert run_cli("write_chunksize=100", *chain, "-print-csv") == expected
+    # Streamed chunks are appended to the compressed file:
+    run_cli("chunksize=300", "-stream", *chain, "-write-to", str(tmp_path / "streamed.csv.gz"))
+    with gzip.open(tmp_path / "streamed.csv.gz", 'rt', newline='') as fp:
+        assert fp.read() == expected